@@ -23,6 +23,7 @@ setuptools.setup(
         "tornado",
         "soundfile",
         "pandas",
+        "numpy",
         "requests",
         "pytest-flake8",
         "textgrid",
@@ -7,7 +7,7 @@
 from inspect import signature
 from argparse import Namespace, ArgumentParser
 from simuleval.data.segments import Segment, TextSegment, SpeechSegment, EmptySegment
-from typing import Optional
+from typing import List, Optional
 from .states import AgentStates
 from .actions import Action
 
@@ -96,7 +96,7 @@ class GenericAgent:
         Returns:
             Segment: segment to return.
         """
-        if len(signature(self.policy).parameters) == 0:
+        if not self.is_stateless():
             is_stateless = False
             if states:
                 raise RuntimeError("Feeding states to stateful agents.")
@@ -114,6 +114,62 @@ class GenericAgent:
         else:
             action = self.policy()
 
+        return self.action_to_segment(action, states)
+
+    def policy_batch(self, states_list: List[AgentStates]) -> List[Action]:
+        """
+        Make decisions for several independent streams at once.
+        By default, the policy is called on each of the states.
+        Agents can override it to batch the model calls of the streams.
+
+        Args:
+            states_list (List[AgentStates]): the states of each stream
+
+        Returns:
+            List[Action]: the action of each stream
+        """
+        return [self.policy(states) for states in states_list]
+
+    def pop_batch(self, states_list: List[AgentStates]) -> List[Segment]:
+        """
+        Generate the system outputs of several independent streams,
+        the batched counterpart of :meth:`pop` for stateless agents.
+
+        Args:
+            states_list (List[AgentStates]): the states of each stream
+
+        Returns:
+            List[Segment]: segment to return for each stream.
+        """
+        if not self.is_stateless():
+            raise RuntimeError("Feeding states to stateful agents.")
+
+        segments: List[Optional[Segment]] = [None for _ in states_list]
+        active_indices = []
+        for index, states in enumerate(states_list):
+            if states.target_finished:
+                segments[index] = EmptySegment(finished=True)
+            else:
+                active_indices.append(index)
+
+        if len(active_indices) > 0:
+            actions = self.policy_batch([states_list[i] for i in active_indices])
+            for index, action in zip(active_indices, actions):
+                segments[index] = self.action_to_segment(action, states_list[index])
+        return segments
+
+    def action_to_segment(self, action: Action, states: AgentStates) -> Segment:
+        """
+        Convert the action of the policy to the output segment,
+        and update the target of the states.
+
+        Args:
+            action (Action): action returned by the policy
+            states (AgentStates): states the action was made on
+
+        Returns:
+            Segment: segment to return.
+        """
         if not isinstance(action, Action):
             raise RuntimeError(
                 f"The return value of {self.policy.__qualname__} is not an {Action.__qualname__} instance"
@@ -130,6 +186,13 @@ class GenericAgent:
             states.update_target(segment)
             return segment
 
+    def is_stateless(self) -> bool:
+        """
+        Whether the policy takes the states as argument,
+        in which case the agent can serve several streams.
+        """
+        return len(signature(self.policy).parameters) > 0
+
     def pushpop(
         self, segment: Segment, states: Optional[AgentStates] = None
     ) -> Segment:
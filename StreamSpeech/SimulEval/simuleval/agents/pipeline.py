@@ -70,6 +70,14 @@ class AgentPipeline(GenericAgent):
 
         return self.module_list[-1].pop(last_states)
 
+    def pop_batch(self, states_list: List[List[AgentStates]]) -> List[Segment]:
+        for states in states_list:
+            assert len(states) == len(self.module_list)
+        return self.module_list[-1].pop_batch([states[-1] for states in states_list])
+
+    def is_stateless(self) -> bool:
+        return all(module.is_stateless() for module in self.module_list)
+
     @classmethod
     def add_args(cls, parser) -> None:
         for module_class in cls.pipeline:
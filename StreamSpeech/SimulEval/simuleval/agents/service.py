@@ -4,21 +4,213 @@
 # LICENSE file in the root directory of this source tree.
 import os
 import json
+import time
+import uuid
 import logging
-from tornado import web, ioloop
-from simuleval.data.segments import segment_from_json_string
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+from tornado import gen, web, ioloop
+from tornado.concurrent import Future
+from simuleval.data.segments import (
+    Segment,
+    segment_from_bytes,
+    segment_from_json_string,
+)
 from simuleval import options
 
 logger = logging.getLogger("simuleval.agent_server")
 
+BINARY_CONTENT_TYPE = "application/octet-stream"
+
+
+class SessionStore:
+    """
+    States of the sessions of a standalone agent.
+
+    A client that disconnects without deleting its session leaves its
+    states behind, so the sessions unused for ``session_timeout`` seconds
+    are evicted, and no more than ``max_sessions`` are kept.
+
+    Attributes:
+        max_sessions (int): maximum number of open sessions
+        session_timeout (float): idle time after which a session is evicted,
+            in seconds
+    """
+
+    def __init__(self, max_sessions: int = 64, session_timeout: float = 600.0):
+        self.max_sessions = max_sessions
+        self.session_timeout = session_timeout
+        # session id -> (states, last access time), least recently used first
+        self.sessions: OrderedDict = OrderedDict()
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self.sessions
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def keys(self) -> List[str]:
+        return list(self.sessions.keys())
+
+    def get(self, session_id: str):
+        states, _ = self.sessions.pop(session_id)
+        self.sessions[session_id] = (states, time.monotonic())
+        return states
+
+    def add(self, states) -> Optional[str]:
+        """Store the states of a new session, None if there are too many."""
+        self.evict_idle()
+        if len(self.sessions) >= self.max_sessions:
+            return None
+        session_id = uuid.uuid4().hex
+        self.sessions[session_id] = (states, time.monotonic())
+        return session_id
+
+    def remove(self, session_id: str) -> None:
+        del self.sessions[session_id]
+
+    def evict_idle(self) -> List[str]:
+        deadline = time.monotonic() - self.session_timeout
+        evicted = []
+        for session_id, (_, last_access) in self.sessions.items():
+            if last_access > deadline:
+                break
+            evicted.append(session_id)
+        for session_id in evicted:
+            del self.sessions[session_id]
+        if len(evicted) > 0:
+            logger.info(f"Evicted {len(evicted)} idle sessions.")
+        return evicted
+
+
+class BatchScheduler:
+    """
+    Micro-batch the pop requests of concurrent sessions.
+
+    Requests are gathered for at most ``batch_timeout`` seconds,
+    or until ``max_batch_size`` of them are queued,
+    and are then served by one call to ``system.pop_batch``.
+    The system runs in a single worker thread
+    so that the server keeps receiving inputs meanwhile.
+
+    The inputs of the sessions go through the scheduler as well: the
+    decoding reads and updates the states of the sessions in the worker
+    thread, so the inputs received meanwhile are pushed after the batch.
+
+    The idle sessions are evicted after each batch.
+
+    Attributes:
+        system (GenericAgent): a stateless agent or agent pipeline
+        max_batch_size (int): maximum number of sessions in a batch
+        batch_timeout (float): time to wait for a batch to fill up, in seconds
+        sessions (SessionStore): the sessions served
+    """
+
+    def __init__(
+        self,
+        system,
+        max_batch_size: int = 16,
+        batch_timeout: float = 0.01,
+        sessions: Optional[SessionStore] = None,
+    ):
+        self.system = system
+        self.max_batch_size = max_batch_size
+        self.batch_timeout = batch_timeout
+        self.sessions = sessions
+        self.queue: List[Tuple[object, object]] = []
+        self.pending_inputs: List[Tuple[Segment, object]] = []
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.running = False
+        self.decoding = False
+
+    def push(self, segment: Segment, states) -> None:
+        if self.decoding:
+            self.pending_inputs.append((segment, states))
+        else:
+            self.system.push(segment, states)
+
+    def push_pending_inputs(self) -> None:
+        pending_inputs, self.pending_inputs = self.pending_inputs, []
+        for segment, states in pending_inputs:
+            try:
+                self.system.push(segment, states)
+            except Exception:
+                logger.exception("Failed to push an input.")
+
+    async def pop(self, states) -> Segment:
+        future: Future = Future()
+        self.queue.append((states, future))
+        if not self.running:
+            self.running = True
+            ioloop.IOLoop.current().spawn_callback(self.run)
+        return await future
+
+    def next_batch(self) -> List[Tuple[object, object]]:
+        # a session is decoded at most once per batch
+        batch, rest, seen = [], [], set()
+        for states, future in self.queue:
+            if len(batch) < self.max_batch_size and id(states) not in seen:
+                seen.add(id(states))
+                batch.append((states, future))
+            else:
+                rest.append((states, future))
+        self.queue = rest
+        return batch
+
+    async def run(self) -> None:
+        try:
+            while len(self.queue) > 0:
+                if len(self.queue) < self.max_batch_size:
+                    await gen.sleep(self.batch_timeout)
+                batch = self.next_batch()
+                self.decoding = True
+                try:
+                    segments = await ioloop.IOLoop.current().run_in_executor(
+                        self.executor,
+                        self.system.pop_batch,
+                        [states for states, _ in batch],
+                    )
+                except Exception as e:
+                    logger.exception("Failed to decode a batch.")
+                    for _, future in batch:
+                        future.set_exception(e)
+                else:
+                    for (_, future), segment in zip(batch, segments):
+                        future.set_result(segment)
+                finally:
+                    self.decoding = False
+                    self.push_pending_inputs()
+                if self.sessions is not None:
+                    self.sessions.evict_idle()
+        finally:
+            self.running = False
+
 
 class SystemHandler(web.RequestHandler):
-    def initialize(self, system):
+    def initialize(self, system, sessions=None, scheduler=None):
         self.system = system
+        self.sessions = sessions
+        self.scheduler = scheduler
 
     def get(self):
         self.write(json.dumps({"info": str(self.system)}))
 
+    def read_segment(self) -> Segment:
+        content_type = self.request.headers.get("Content-Type", "")
+        if content_type.startswith(BINARY_CONTENT_TYPE):
+            return segment_from_bytes(self.request.body)
+        return segment_from_json_string(self.request.body)
+
+    def write_segment(self, segment: Segment) -> None:
+        """Reply in binary if the client accepts it, in json otherwise."""
+        if BINARY_CONTENT_TYPE in self.request.headers.get("Accept", ""):
+            self.set_header("Content-Type", BINARY_CONTENT_TYPE)
+            sample_format = self.get_query_argument("sample_format", "float32")
+            self.write(segment.to_bytes(sample_format))
+        else:
+            self.write(segment.json())
+
 
 class ResetHandle(SystemHandler):
     def post(self):
@@ -28,30 +220,108 @@ class ResetHandle(SystemHandler):
 class OutputHandler(SystemHandler):
     def get(self):
         output_segment = self.system.pop()
-        self.write(output_segment.json())
+        self.write_segment(output_segment)
 
 
 class InputHandler(SystemHandler):
     def put(self):
-        segment = segment_from_json_string(self.request.body)
+        segment = self.read_segment()
         self.system.push(segment)
 
 
-def start_agent_service(system):
-    parser = options.general_parser()
-    options.add_evaluator_args(parser)
-    args, _ = parser.parse_known_args()
-    app = web.Application(
+def reset_states(states) -> None:
+    if isinstance(states, list):
+        for module_states in states:
+            module_states.reset()
+    else:
+        states.reset()
+
+
+class SessionHandler(SystemHandler):
+    def get_states(self, session_id):
+        if session_id not in self.sessions:
+            raise web.HTTPError(404, f"Unknown session {session_id}")
+        return self.sessions.get(session_id)
+
+    def get(self, session_id=None):
+        if session_id is None:
+            self.write(json.dumps({"sessions": self.sessions.keys()}))
+        else:
+            self.get_states(session_id)
+            self.write(json.dumps({"session_id": session_id}))
+
+    def post(self, session_id=None):
+        if session_id is not None:
+            reset_states(self.get_states(session_id))
+            return
+        if not self.system.is_stateless():
+            raise web.HTTPError(400, "Sessions require a stateless agent.")
+        session_id = self.sessions.add(self.system.build_states())
+        if session_id is None:
+            raise web.HTTPError(503, "Too many open sessions.")
+        self.write(json.dumps({"session_id": session_id}))
+
+    def delete(self, session_id):
+        self.get_states(session_id)
+        self.sessions.remove(session_id)
+
+
+class SessionOutputHandler(SessionHandler):
+    async def get(self, session_id):
+        output_segment = await self.scheduler.pop(self.get_states(session_id))
+        self.write_segment(output_segment)
+
+
+class SessionInputHandler(SessionHandler):
+    def put(self, session_id):
+        segment = self.read_segment()
+        self.scheduler.push(segment, self.get_states(session_id))
+
+
+def build_agent_app(
+    system,
+    max_batch_size: int = 16,
+    batch_timeout: float = 0.01,
+    max_sessions: int = 64,
+    session_timeout: float = 600.0,
+) -> web.Application:
+    sessions = SessionStore(max_sessions, session_timeout)
+    scheduler = BatchScheduler(system, max_batch_size, batch_timeout, sessions)
+    kwargs = {"system": system, "sessions": sessions, "scheduler": scheduler}
+    return web.Application(
         [
             (r"/reset", ResetHandle, {"system": system}),
             (r"/input", InputHandler, {"system": system}),
             (r"/output", OutputHandler, {"system": system}),
+            (r"/session", SessionHandler, kwargs),
+            (r"/session/(\w+)", SessionHandler, kwargs),
+            (r"/session/(\w+)/input", SessionInputHandler, kwargs),
+            (r"/session/(\w+)/output", SessionOutputHandler, kwargs),
             (r"/", SystemHandler, {"system": system}),
         ],
         debug=False,
+        sessions=sessions,
+    )
+
+
+def start_agent_service(system):
+    parser = options.general_parser()
+    options.add_evaluator_args(parser)
+    args, _ = parser.parse_known_args()
+    app = build_agent_app(
+        system,
+        args.max_batch_size,
+        args.batch_timeout / 1000,
+        args.max_sessions,
+        args.session_timeout,
     )
 
     app.listen(args.remote_port, max_buffer_size=1024**3)
+    # the sessions of clients that stopped sending requests are evicted too
+    ioloop.PeriodicCallback(
+        app.settings["sessions"].evict_idle,
+        min(args.session_timeout, 60) * 1000,
+    ).start()
 
     logger.info(
         f"Simultaneous Translation Server Started (process id {os.getpid()}). Listening to port {args.remote_port} "
@@ -4,7 +4,43 @@
 # This source code is licensed under the license found in the
 # LICENSE file in the root directory of this source tree.
 
-from simuleval.data.segments import Segment, TextSegment, EmptySegment, SpeechSegment
+import numpy as np
+from simuleval.data.segments import (
+    Segment,
+    TextSegment,
+    EmptySegment,
+    SpeechSegment,
+    as_sample_array,
+)
+
+
+class SampleBuffer:
+    """
+    Growable float32 buffer of speech samples.
+    The capacity doubles when full, so appending is amortized constant time,
+    and the filled part is exposed as a view without copying.
+    """
+
+    def __init__(self, capacity: int = 16000) -> None:
+        self.data = np.empty(capacity, dtype=np.float32)
+        self.length = 0
+
+    def __len__(self) -> int:
+        return self.length
+
+    def extend(self, samples) -> None:
+        samples = as_sample_array(samples)
+        if self.length + len(samples) > len(self.data):
+            data = np.empty(
+                max(2 * len(self.data), self.length + len(samples)), dtype=np.float32
+            )
+            data[: self.length] = self.data[: self.length]
+            self.data = data
+        self.data[self.length : self.length + len(samples)] = samples
+        self.length += len(samples)
+
+    def view(self) -> np.ndarray:
+        return self.data[: self.length]
 
 
 class AgentStates:
@@ -12,8 +48,10 @@ class AgentStates:
     Tracker of the decoding progress.
 
     Attributes:
-        source (list): current source sequence.
-        target (list): current target sequence.
+        source (list): current source sequence,
+            a float32 array of samples for speech.
+        target (list): current target sequence,
+            a float32 array of samples for speech.
         source_finished (bool): if the source is finished.
         target_finished (bool): if the target is finished.
     """
@@ -29,6 +67,8 @@ class AgentStates:
         self.target_finished = False
         self.source_sample_rate = 0
         self.target_sample_rate = 0
+        self.source_buffer = None
+        self.target_buffer = None
 
     def update_source(self, segment: Segment):
         """
@@ -43,7 +83,10 @@ class AgentStates:
         elif isinstance(segment, TextSegment):
             self.source.append(segment.content)
         elif isinstance(segment, SpeechSegment):
-            self.source += segment.content
+            if self.source_buffer is None:
+                self.source_buffer = SampleBuffer()
+            self.source_buffer.extend(segment.content)
+            self.source = self.source_buffer.view()
             self.source_sample_rate = segment.sample_rate
         else:
             raise NotImplementedError
@@ -62,7 +105,10 @@ class AgentStates:
             elif isinstance(segment, TextSegment):
                 self.target.append(segment.content)
             elif isinstance(segment, SpeechSegment):
-                self.target += segment.content
+                if self.target_buffer is None:
+                    self.target_buffer = SampleBuffer()
+                self.target_buffer.extend(segment.content)
+                self.target = self.target_buffer.view()
                 self.target_sample_rate = segment.sample_rate
             else:
                 raise NotImplementedError
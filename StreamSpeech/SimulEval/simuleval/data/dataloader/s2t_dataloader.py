@@ -6,7 +6,8 @@
 
 from __future__ import annotations
 from pathlib import Path
-from typing import List, Union
+from typing import Union
+import numpy as np
 from .dataloader import GenericDataloader
 from simuleval.data.dataloader import register_dataloader
 from argparse import Namespace
@@ -58,10 +59,9 @@ def download_youtube_video(url):
 
 @register_dataloader("speech-to-text")
 class SpeechToTextDataloader(GenericDataloader):
-    def preprocess_source(self, source: Union[Path, str]) -> List[float]:
+    def preprocess_source(self, source: Union[Path, str]) -> np.ndarray:
         assert IS_IMPORT_SOUNDFILE, "Please make sure soundfile is properly installed."
         samples, _ = soundfile.read(source, dtype="float32")
-        samples = samples.tolist()
         return samples
 
     def preprocess_target(self, target: str) -> str:
@@ -5,8 +5,28 @@
 # LICENSE file in the root directory of this source tree.
 
 import json
+import struct
+import numpy as np
 from dataclasses import dataclass, field
 
+# Binary segment: a little-endian header followed by the content,
+# utf-8 text or raw PCM samples.
+# Header: magic, data type, sample format, flags, index, sample rate, content size
+SEGMENT_MAGIC = b"SSEG"
+SEGMENT_HEADER = struct.Struct("<4sBBBxdiI")
+DATA_TYPES = [None, "text", "speech"]
+SAMPLE_FORMATS = {"float32": (1, "<f4"), "int16": (2, "<i2")}
+INT16_SCALE = 32767
+FINISHED_FLAG = 1
+EMPTY_FLAG = 2
+
+
+def as_sample_array(content) -> np.ndarray:
+    """Float32 samples of speech content given as a list, an array or a tensor."""
+    if hasattr(content, "detach"):
+        content = content.detach().cpu().numpy()
+    return np.asarray(content, dtype=np.float32).reshape(-1)
+
 
 @dataclass
 class Segment:
@@ -17,13 +37,51 @@ class Segment:
     data_type: str = None
 
     def json(self) -> str:
-        info_dict = {attribute: value for attribute, value in self.__dict__.items()}
+        info_dict = {
+            attribute: value.tolist() if hasattr(value, "tolist") else value
+            for attribute, value in self.__dict__.items()
+        }
         return json.dumps(info_dict)
 
     @classmethod
     def from_json(cls, json_string: str):
         return cls(**json.loads(json_string))
 
+    def to_bytes(self, sample_format: str = "float32") -> bytes:
+        """
+        Compact binary encoding of the segment, see :func:`segment_from_bytes`.
+
+        Args:
+            sample_format (str): PCM format of speech content, float32 or int16
+        """
+        format_code = 0
+        if self.data_type == "text":
+            content = self.content.encode("utf-8")
+        elif self.data_type == "speech":
+            format_code, dtype = SAMPLE_FORMATS[sample_format]
+            samples = as_sample_array(self.content)
+            if sample_format == "int16":
+                samples = np.clip(
+                    np.round(samples * INT16_SCALE), -INT16_SCALE, INT16_SCALE
+                )
+            content = samples.astype(dtype).tobytes()
+        else:
+            content = b""
+
+        flags = (FINISHED_FLAG if self.finished else 0) | (
+            EMPTY_FLAG if self.is_empty else 0
+        )
+        header = SEGMENT_HEADER.pack(
+            SEGMENT_MAGIC,
+            DATA_TYPES.index(self.data_type),
+            format_code,
+            flags,
+            self.index,
+            getattr(self, "sample_rate", -1),
+            len(content),
+        )
+        return header + content
+
 
 @dataclass
 class EmptySegment(Segment):
@@ -50,3 +108,40 @@ def segment_from_json_string(string: str):
         return SpeechSegment.from_json(string)
     else:
         return EmptySegment.from_json(string)
+
+
+def segment_from_bytes(data: bytes):
+    (
+        magic,
+        data_type_code,
+        format_code,
+        flags,
+        index,
+        sample_rate,
+        size,
+    ) = SEGMENT_HEADER.unpack_from(data)
+    if magic != SEGMENT_MAGIC:
+        raise ValueError("Not a binary segment.")
+    content = data[SEGMENT_HEADER.size : SEGMENT_HEADER.size + size]
+    info_dict = {
+        # the index of a speech segment may be an offset in milliseconds
+        "index": int(index) if index.is_integer() else index,
+        "finished": bool(flags & FINISHED_FLAG),
+        "is_empty": bool(flags & EMPTY_FLAG),
+    }
+
+    data_type = DATA_TYPES[data_type_code]
+    if data_type == "text":
+        return TextSegment(content=content.decode("utf-8"), **info_dict)
+    elif data_type == "speech":
+        for sample_format, (code, dtype) in SAMPLE_FORMATS.items():
+            if code == format_code:
+                break
+        else:
+            raise ValueError(f"Unknown sample format {format_code}.")
+        samples = np.frombuffer(content, dtype=dtype).astype(np.float32)
+        if sample_format == "int16":
+            samples /= INT16_SCALE
+        return SpeechSegment(content=samples, sample_rate=sample_rate, **info_dict)
+    else:
+        return EmptySegment(**info_dict)
@@ -6,8 +6,12 @@
 
 import pandas
 import os
+import queue
 import numbers
+import multiprocessing
 from argparse import Namespace
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Generator, Optional
 from .scorers import get_scorer_class
 from .scorers.latency_scorer import LatencyScorer
@@ -21,6 +25,13 @@ from tqdm import tqdm
 from pathlib import Path
 from simuleval.data.dataloader import GenericDataloader, build_dataloader
 
+try:
+    import torch
+
+    IS_IMPORT_TORCH = True
+except Exception:
+    IS_IMPORT_TORCH = False
+
 
 logger = logging.getLogger("simuleval.sentence_level_evaluator")
 
@@ -42,6 +53,7 @@ class SentenceLevelEvaluator(object):
 
     Attributes:
         instances: collections of sentence pairs. Instances also keep track of delays.
+            When evaluating from a dataloader, they are added while iterating.
         latency_scorers (List[~simuleval.scorers.latency_scorer.LatencyScorer]): Scorers for latency evaluation.
         quality_scorers (List[~simuleval.scorers.latency_scorer.QualityScorer]): Scorers for quality evaluation.
         output: output directory
@@ -100,6 +112,8 @@ class SentenceLevelEvaluator(object):
         ]
         self.start_index = getattr(args, "start_index", 0)
         self.end_index = getattr(args, "end_index", -1)
+        self.num_prefetch_instances = getattr(args, "num_prefetch_instances", 2)
+        self.num_workers = getattr(args, "num_workers", 1)
 
         if not self.score_only:
             if self.output:
@@ -123,19 +137,33 @@ class SentenceLevelEvaluator(object):
 
         self.build_instances()
 
-        if not self.args.no_progress_bar and not self.score_only:
-            self.instance_iterator = tqdm(
-                self.instances.values(),
-                initial=self.start_index,
-                total=len(self.instances.values()),
-            )
-        else:
+        if self.score_only:
             self.instance_iterator = self.instances.values()
+        else:
+            self.instance_iterator = self.maybe_tqdm(self.iterate_instances())
 
-    def write_log(self, instance):
+    def maybe_tqdm(self, iterator) -> Generator:
+        if self.args.no_progress_bar:
+            yield from iterator
+        else:
+            yield from tqdm(iterator, initial=self.start_index, total=len(self))
+
+    def write_log(self, instance, log: Optional[str] = None):
+        """
+        Log the summary of a finished instance, then release it.
+
+        Args:
+            instance: the finished instance
+            log (Optional[str]): the json summary if it was already computed
+        """
         if self.output is not None:
+            if log is None:
+                log = json.dumps(instance.summarize())
             with open(self.output / "instances.log", "a") as f:
-                f.write(json.dumps(instance.summarize()) + "\n")
+                f.write(log + "\n")
+        if not instance.released:
+            # the parallel workers release the instances before sending them
+            instance.release()
 
     def build_instances(self):
         if self.score_only:
@@ -152,8 +180,93 @@ class SentenceLevelEvaluator(object):
                     self.instances[instance.index] = instance
 
     def build_instances_from_dataloader(self):
-        for i in self.get_indices():
-            self.instances[i] = self.instance_class(i, self.dataloader, self.args)
+        # the instances are built by iterate_instances
+        self.instances = {}
+
+    def build_instance(self, index: int):
+        instance = self.instance_class(index, self.dataloader, self.args)
+        instance.load()
+        return instance
+
+    def iterate_instances(self) -> Generator:
+        """
+        Build the instances one by one. The sources of the next
+        ``num_prefetch_instances`` instances are read in a background thread
+        while the current one is evaluated.
+        """
+        indices = iter(self.get_indices())
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            futures = deque(
+                executor.submit(self.build_instance, index)
+                for _, index in zip(range(self.num_prefetch_instances + 1), indices)
+            )
+            while len(futures) > 0:
+                instance = futures.popleft().result()
+                for index in indices:
+                    futures.append(executor.submit(self.build_instance, index))
+                    break
+                self.instances[instance.index] = instance
+                yield instance
+
+    def iterate_instances_parallel(self, system) -> Generator:
+        """
+        Evaluate the instances in ``num_workers`` forked processes,
+        each with its own copy of the system.
+        The finished instances and their json summaries are yielded in index order.
+        """
+        context = multiprocessing.get_context("fork")
+        task_queue = context.Queue()
+        result_queue = context.Queue()
+        indices = list(self.get_indices())
+        for index in indices:
+            task_queue.put(index)
+        workers = [
+            context.Process(
+                target=evaluate_worker,
+                args=(self, system, task_queue, result_queue),
+                daemon=True,
+            )
+            for _ in range(self.num_workers)
+        ]
+        for worker in workers:
+            task_queue.put(None)
+            worker.start()
+
+        finished = {}
+        try:
+            for index in indices:
+                while index not in finished:
+                    try:
+                        result_index, log, instance = result_queue.get(timeout=1)
+                    except queue.Empty:
+                        if any(worker.exitcode not in (None, 0) for worker in workers):
+                            raise RuntimeError("An evaluation worker failed.")
+                        continue
+                    finished[result_index] = (log, instance)
+                log, instance = finished.pop(index)
+                instance.dataloader = self.dataloader
+                instance.args = self.args
+                self.instances[index] = instance
+                yield instance, log
+            for worker in workers:
+                worker.join()
+        finally:
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+
+    def evaluate_instance(self, system, instance) -> None:
+        while not self.is_finished(instance):
+            input_segment = instance.send_source(self.source_segment_size)
+            output_segment = system.pushpop(input_segment)
+            instance.receive_prediction(output_segment)
+            if instance.finish_prediction:
+                # if instance.finish_prediction where set by the reader,
+                # source_finished_reading will be set as well. If it is
+                # set by any of the intermediate components, then we didn't
+                # end yet. We are going to clear the state and continue
+                # processing the rest of the input.
+                system.reset()
 
     def __len__(self) -> int:
         return self.end_index - self.start_index
@@ -214,22 +327,18 @@ class SentenceLevelEvaluator(object):
         return instance.finish_prediction
 
     def __call__(self, system):
-        system.reset()
-        for instance in self.instance_iterator:
-            while not self.is_finished(instance):
-                input_segment = instance.send_source(self.source_segment_size)
-                output_segment = system.pushpop(input_segment)
-                instance.receive_prediction(output_segment)
-                if instance.finish_prediction:
-                    # if instance.finish_prediction where set by the reader,
-                    # source_finished_reading will be set as well. If it is
-                    # set by any of the intermediate components, then we didn't
-                    # end yet. We are going to clear the state and continue
-                    # processing the rest of the input.
-                    system.reset()
+        if self.num_workers > 1 and not self.score_only:
+            for instance, log in self.maybe_tqdm(
+                self.iterate_instances_parallel(system)
+            ):
+                self.write_log(instance, log)
+        else:
+            system.reset()
+            for instance in self.instance_iterator:
+                self.evaluate_instance(system, instance)
 
-            if not self.score_only:
-                self.write_log(instance)
+                if not self.score_only:
+                    self.write_log(instance)
 
         self.dump_results()
         self.dump_metrics()
@@ -259,3 +368,21 @@ class SentenceLevelEvaluator(object):
             quality_scorers[name] = get_scorer_class("quality", name).from_args(args)
 
         return cls(dataloader, quality_scorers, latency_scorers, args)
+
+
+def evaluate_worker(evaluator, system, task_queue, result_queue):
+    """
+    Worker process of SentenceLevelEvaluator.iterate_instances_parallel,
+    it evaluates the instances whose indices are read from the task queue.
+    The workers share the CPU cores, so each one gets its share of the
+    torch threads instead of one thread per core.
+    """
+    if IS_IMPORT_TORCH:
+        torch.set_num_threads(max(1, os.cpu_count() // evaluator.num_workers))
+    system.reset()
+    for index in iter(task_queue.get, None):
+        instance = evaluator.build_instance(index)
+        evaluator.evaluate_instance(system, instance)
+        log = json.dumps(instance.summarize())
+        instance.release()
+        result_queue.put((index, log, instance))
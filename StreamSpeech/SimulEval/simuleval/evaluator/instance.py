@@ -7,10 +7,16 @@
 import json
 import time
 import math
-from typing import Dict, List, Optional, Union
+from typing import Dict, Optional, Union
 from pathlib import Path
 
-from simuleval.data.segments import TextSegment, SpeechSegment, EmptySegment
+import numpy as np
+from simuleval.data.segments import (
+    TextSegment,
+    SpeechSegment,
+    EmptySegment,
+    as_sample_array,
+)
 
 from simuleval.data.dataloader import SpeechToTextDataloader, TextToTextDataloader
 from argparse import Namespace
@@ -43,9 +49,10 @@ class Instance(object):
         self.index = index
         self.finish_prediction = False
         self.dataloader = dataloader
-        if self.dataloader is not None:
-            self.source = self.dataloader[self.index]["source"]
-            self.reference = self.dataloader[self.index]["target"]
+        # the source and reference are only read from the dataloader when needed
+        self._source = None
+        self._reference = None
+        self.released = False
         self.reset()
         if args is not None:
             self.args = args
@@ -59,6 +66,51 @@ class Instance(object):
         self.start_time = None
         self.metrics = {}
 
+    def load(self) -> None:
+        """
+        Read the source and the reference of the sentence pair.
+        """
+        self.source
+        self.reference
+
+    def release(self) -> None:
+        """
+        Free the data not needed for scoring once the instance is logged.
+        A freed source is not read again.
+        """
+        self.released = True
+
+    def __getstate__(self):
+        # the evaluator attaches its own dataloader and arguments
+        state = self.__dict__.copy()
+        state.pop("dataloader", None)
+        state.pop("args", None)
+        return state
+
+    @property
+    def source(self):
+        if self._source is None and self.dataloader is not None:
+            if self.released:
+                raise RuntimeError(
+                    f"The source of instance {self.index} was released."
+                )
+            self._source = self.dataloader.get_source(self.index)
+        return self._source
+
+    @source.setter
+    def source(self, source):
+        self._source = source
+
+    @property
+    def reference(self):
+        if self._reference is None and self.dataloader is not None:
+            self._reference = self.dataloader.get_target(self.index)
+        return self._reference
+
+    @reference.setter
+    def reference(self, reference):
+        self._reference = reference
+
     def step_to_elapsed(self, *args):
         raise NotImplementedError
 
@@ -238,6 +290,7 @@ class SpeechInputInstance(Instance):
         super().__init__(index, dataloader, args)
         self.sample_rate_value = None
         self.sample_list = None
+        self.num_samples = None
         self.source_finished_reading = False
         self.dataloader: SpeechToTextDataloader
 
@@ -249,11 +302,25 @@ class SpeechInputInstance(Instance):
         return self.sample_rate_value
 
     @property
-    def samples(self) -> List[float]:
+    def samples(self) -> np.ndarray:
         if self.sample_list is None:
             self.sample_list = self.source
+            self.num_samples = len(self.sample_list)
         return self.sample_list
 
+    def load(self) -> None:
+        super().load()
+        self.samples
+        self.sample_rate
+
+    def release(self) -> None:
+        # only the number of samples is kept for the latency
+        if self.num_samples is None:
+            self.samples
+        self.sample_list = None
+        self.source = None
+        super().release()
+
     @property
     def is_finish_source(self):
         return self.step == len(self.samples)
@@ -298,7 +365,9 @@ class SpeechInputInstance(Instance):
     @property
     def source_length(self):
         # In milliseconds
-        return self.len_sample_to_ms(len(self.samples))
+        if self.num_samples is None:
+            self.samples
+        return self.len_sample_to_ms(self.num_samples)
 
     @property
     def source_info(self):
@@ -341,8 +410,14 @@ class SpeechOutputInstance(Instance):
     def prediction(self):
         return self.wav_path
 
+    def release(self) -> None:
+        # the predicted speech is in the wav file
+        self.prediction_list = []
+        super().release()
+
     def summarize(self):
         samples = []
+        num_samples = 0
         self.intervals = []
         self.silences = []
 
@@ -355,15 +430,20 @@ class SpeechOutputInstance(Instance):
 
                 if start > prev_end:
                     # Wait source speech, add discontinuity with silence
-                    samples += [0.0] * int(
-                        self.target_sample_rate * (start - prev_end) / 1000
+                    samples.append(
+                        np.zeros(
+                            int(self.target_sample_rate * (start - prev_end) / 1000),
+                            dtype=np.float32,
+                        )
                     )
                     self.silences.append(start - prev_end)
 
-                samples += self.prediction_list[i]
+                samples.append(self.prediction_list[i])
                 duration = self.durations[i]
                 prev_end = start + duration
                 self.intervals.append([start, duration])
+            samples = np.concatenate(samples)
+            num_samples = len(samples)
             soundfile.write(self.wav_path, samples, self.target_sample_rate)
         else:
             # For empty prediction
@@ -377,7 +457,7 @@ class SpeechOutputInstance(Instance):
             "prediction_offset": prediction_offset,
             "elapsed": [],
             "intervals": self.intervals,
-            "prediction_length": len(samples) / self.target_sample_rate,
+            "prediction_length": num_samples / self.target_sample_rate,
             "source_length": self.source_length,
             "reference": self.reference,
             "source": self.dataloader.get_source_audio_path(self.index),
@@ -411,7 +491,7 @@ class SpeechOutputInstance(Instance):
             self.target_sample_rate = segment.sample_rate
 
         self.durations.append(pred_duration)
-        self.prediction_list.append(segment.content)
+        self.prediction_list.append(as_sample_array(segment.content))
         self.elapsed.append(self.step_to_elapsed(self.step, current_time))
         self.delays.append(self.step_to_delay(self.step))
 
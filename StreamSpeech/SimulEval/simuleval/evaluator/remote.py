@@ -5,12 +5,18 @@
 # LICENSE file in the root directory of this source tree.
 
 import logging
-from simuleval.data.segments import Segment, segment_from_json_string
+from simuleval.data.segments import (
+    Segment,
+    segment_from_bytes,
+    segment_from_json_string,
+)
 from simuleval.evaluator import SentenceLevelEvaluator
 import requests
 
 logger = logging.getLogger("simuleval.remote_evaluator")
 
+BINARY_CONTENT_TYPE = "application/octet-stream"
+
 
 class RemoteEvaluator:
     def __init__(self, evaluator: SentenceLevelEvaluator) -> None:
@@ -19,18 +25,35 @@ class RemoteEvaluator:
         self.port = evaluator.args.remote_port
         self.source_segment_size = evaluator.args.source_segment_size
         self.base_url = f"http://{self.address}:{self.port}"
+        self.segment_format = evaluator.args.remote_segment_format
+        # keep-alive connection reused by all the requests
+        self.session = requests.Session()
 
     def send_source(self, segment: Segment):
         url = f"{self.base_url}/input"
-        requests.put(url, data=segment.json())
+        if self.segment_format == "json":
+            self.session.put(url, data=segment.json())
+        else:
+            self.session.put(
+                url,
+                data=segment.to_bytes(self.segment_format),
+                headers={"Content-Type": BINARY_CONTENT_TYPE},
+            )
 
     def receive_prediction(self) -> Segment:
         url = f"{self.base_url}/output"
-        r = requests.get(url)
-        return segment_from_json_string(r.text)
+        if self.segment_format == "json":
+            r = self.session.get(url)
+            return segment_from_json_string(r.text)
+        r = self.session.get(
+            url,
+            params={"sample_format": self.segment_format},
+            headers={"Accept": BINARY_CONTENT_TYPE},
+        )
+        return segment_from_bytes(r.content)
 
     def system_reset(self):
-        requests.post(f"{self.base_url}/reset")
+        self.session.post(f"{self.base_url}/reset")
 
     def results(self):
         return self.evaluator.results()
@@ -11,6 +11,7 @@ from pathlib import Path
 from typing import Dict
 from sacrebleu.metrics.bleu import BLEU
 import subprocess
+import sys
 import string
 import tqdm
 
@@ -138,35 +139,33 @@ class ASRSacreBLEUScorer(QualityScorer):
         wav_dir = Path(instances[0].prediction).absolute().parent
         root_dir = wav_dir.parent
         transcripts_path = root_dir / "asr_transcripts.txt"
-        asr_cmd_bash_path = root_dir / "asr_cmd.bash"
 
         # This is a dummy reference. The bleu score will be compute separately.
         reference_path = root_dir / "instances.log"
 
-        fairseq_asr_bleu_cmd = "\n".join(
+        process = subprocess.run(
             [
-                f"cd {fairseq_path.as_posix()}/examples/speech_to_speech/asr_bleu/",
-                " ".join(
-                    [
-                        "python compute_asr_bleu.py",
-                        f"--reference_path {reference_path.as_posix()}",
-                        f"--lang {self.target_lang}",
-                        f"--audio_dirpath {wav_dir.as_posix()}",
-                        "--reference_format txt",
-                        f"--transcripts_path {(root_dir / 'asr_transcripts.txt').as_posix()}",
-                    ]
-                ),
-            ]
+                sys.executable,
+                "compute_asr_bleu.py",
+                "--reference_path",
+                reference_path.as_posix(),
+                "--lang",
+                self.target_lang,
+                "--audio_dirpath",
+                wav_dir.as_posix(),
+                "--reference_format",
+                "txt",
+                "--transcripts_path",
+                transcripts_path.as_posix(),
+            ],
+            cwd=fairseq_path / "examples" / "speech_to_speech" / "asr_bleu",
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
         )
-        with open(asr_cmd_bash_path, "w") as f:
-            f.write(fairseq_asr_bleu_cmd + "\n")
-
-        process = subprocess.Popen(["bash", asr_cmd_bash_path], stdout=subprocess.PIPE)
-        _, stderr = process.communicate()
 
         if process.returncode != 0:
             self.logger.error("ASR on target speech failed:")
-            self.logger.error(str(stderr) + "\n")
+            self.logger.error(process.stderr.decode(errors="replace") + "\n")
             return ["" for _ in instances.keys()]
 
         with open(transcripts_path, "r") as f:
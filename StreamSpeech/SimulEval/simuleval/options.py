@@ -73,6 +73,38 @@ def add_evaluator_args(parser: argparse.ArgumentParser):
         default=12321,
         help="Port to client backend",
     )
+    parser.add_argument(
+        "--remote-segment-format",
+        default="json",
+        choices=["json", "float32", "int16"],
+        help="Encoding of the segments sent to a remote agent, "
+        "json or binary with float32 or int16 PCM speech. "
+        "The binary formats need an agent service that accepts them",
+    )
+    parser.add_argument(
+        "--max-batch-size",
+        type=int,
+        default=16,
+        help="Maximum number of sessions decoded in one batch by a standalone agent",
+    )
+    parser.add_argument(
+        "--batch-timeout",
+        type=float,
+        default=10,
+        help="Time in ms a standalone agent waits for a batch of sessions to fill up",
+    )
+    parser.add_argument(
+        "--max-sessions",
+        type=int,
+        default=64,
+        help="Maximum number of open sessions of a standalone agent",
+    )
+    parser.add_argument(
+        "--session-timeout",
+        type=float,
+        default=600,
+        help="Time in seconds after which a standalone agent evicts an idle session",
+    )
     parser.add_argument(
         "--no-progress-bar",
         action="store_true",
@@ -91,6 +123,20 @@ def add_evaluator_args(parser: argparse.ArgumentParser):
         default=-1,
         help="The last index for evaluation.",
     )
+    parser.add_argument(
+        "--num-workers",
+        type=int,
+        default=1,
+        help="Number of forked processes evaluating the instances in parallel, "
+        "each with its own copy of the system. Only for systems running on CPU, "
+        "the CUDA context cannot be shared by forked processes.",
+    )
+    parser.add_argument(
+        "--num-prefetch-instances",
+        type=int,
+        default=2,
+        help="Number of instances whose source is read ahead in a background thread.",
+    )
     parser.add_argument("--output", type=str, default=None, help="Output directory")
 
 
@@ -59,3 +59,36 @@ def test_statelss_agent(root_path=ROOT_PATH):
         output_1 = agent_stateless.pushpop(segment, agent_state)
         output_2 = agent_stateful.pushpop(segment)
         assert output_1.content == output_2.content
+
+
+def test_stateless_agent_batch():
+    class DummyWaitkTextAgent(TextToTextAgent):
+        waitk = 2
+        vocab = [chr(i) for i in range(ord("A"), ord("Z") + 1)]
+
+        def policy(self, states=None):
+            if states is None:
+                states = self.states
+
+            lagging = len(states.source) - len(states.target)
+
+            if lagging >= self.waitk or states.source_finished:
+                prediction = self.vocab[len(states.source)]
+
+                return WriteAction(prediction, finished=(lagging <= 1))
+            else:
+                return ReadAction()
+
+    agent = DummyWaitkTextAgent.from_args(None)
+    states_list = [agent.build_states() for _ in range(3)]
+    reference_states_list = [agent.build_states() for _ in range(3)]
+
+    for step in range(10):
+        # the streams are at different steps
+        for index in range(step % 3 + 1):
+            segment = TextSegment(0, "A")
+            agent.push(segment, states_list[index])
+            agent.push(segment, reference_states_list[index])
+        outputs = agent.pop_batch(states_list)
+        for states, output in zip(reference_states_list, outputs):
+            assert output.content == agent.pop(states).content
@@ -0,0 +1,129 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import asyncio
+import json
+import threading
+import time
+
+from tornado.httpclient import AsyncHTTPClient
+
+from simuleval.agents import TextToTextAgent
+from simuleval.agents.actions import ReadAction, WriteAction
+from simuleval.agents.service import BatchScheduler, SessionStore, build_agent_app
+from simuleval.data.segments import TextSegment, segment_from_json_string
+from simuleval.utils.functional import find_free_port
+
+
+class DummyWaitkTextAgent(TextToTextAgent):
+    waitk = 1
+    vocab = [chr(i) for i in range(ord("A"), ord("Z") + 1)]
+
+    def __init__(self, args=None):
+        super().__init__(args)
+        self.batch_sizes = []
+
+    def policy(self, states=None):
+        if states is None:
+            states = self.states
+
+        lagging = len(states.source) - len(states.target)
+
+        if lagging >= self.waitk or states.source_finished:
+            return WriteAction(self.vocab[len(states.source)], finished=False)
+        else:
+            return ReadAction()
+
+    def policy_batch(self, states_list):
+        self.batch_sizes.append(len(states_list))
+        return super().policy_batch(states_list)
+
+
+def test_session_service():
+    agent = DummyWaitkTextAgent()
+    num_sessions = 4
+    num_steps = 5
+
+    async def run_session(client, url):
+        response = await client.fetch(f"{url}/session", method="POST", body="")
+        session_id = json.loads(response.body)["session_id"]
+        outputs = []
+        for _ in range(num_steps):
+            await client.fetch(
+                f"{url}/session/{session_id}/input",
+                method="PUT",
+                body=TextSegment(0, "A").json(),
+            )
+            response = await client.fetch(f"{url}/session/{session_id}/output")
+            outputs.append(segment_from_json_string(response.body).content)
+        await client.fetch(f"{url}/session/{session_id}", method="DELETE")
+        return outputs
+
+    async def run():
+        port = find_free_port()
+        server = build_agent_app(agent, max_batch_size=num_sessions).listen(port)
+        client = AsyncHTTPClient()
+        url = f"http://localhost:{port}"
+        try:
+            return await asyncio.gather(
+                *[run_session(client, url) for _ in range(num_sessions)]
+            )
+        finally:
+            server.stop()
+
+    all_outputs = asyncio.run(run())
+    for outputs in all_outputs:
+        assert outputs == ["B", "C", "D", "E", "F"]
+    # the sessions were decoded together
+    assert max(agent.batch_sizes) > 1
+    assert sum(agent.batch_sizes) == num_sessions * num_steps
+
+
+def test_session_store_eviction():
+    sessions = SessionStore(max_sessions=2, session_timeout=0.05)
+    first = sessions.add("states 1")
+    second = sessions.add("states 2")
+    assert sessions.add("states 3") is None
+
+    time.sleep(0.1)
+    assert sessions.get(second) == "states 2"
+    # the idle session is evicted to make room for the new one
+    third = sessions.add("states 3")
+    assert third is not None
+    assert first not in sessions
+    assert sessions.keys() == [second, third]
+
+
+def test_inputs_pushed_between_batches():
+    class BlockingSystem:
+        def __init__(self):
+            self.decoding = threading.Event()
+            self.resume = threading.Event()
+            self.pushed = []
+
+        def push(self, segment, states):
+            self.pushed.append(segment)
+
+        def pop_batch(self, states_list):
+            self.decoding.set()
+            self.resume.wait()
+            return [len(self.pushed) for _ in states_list]
+
+    system = BlockingSystem()
+    scheduler = BatchScheduler(system, max_batch_size=1)
+
+    async def run():
+        pop = asyncio.ensure_future(scheduler.pop("states"))
+        while not system.decoding.is_set():
+            await asyncio.sleep(0.001)
+        # the input received during the decoding waits for the batch
+        scheduler.push("A", "states")
+        assert system.pushed == []
+        system.resume.set()
+        assert await pop == 0
+        assert system.pushed == ["A"]
+
+    asyncio.run(run())
@@ -5,10 +5,22 @@
 # LICENSE file in the root directory of this source tree.
 
 import os
+import json
 import tempfile
+from argparse import Namespace
 from pathlib import Path
 
+import numpy as np
+import pytest
+import soundfile
+
 import simuleval.cli as cli
+from simuleval.agents import TextToTextAgent
+from simuleval.agents.actions import ReadAction, WriteAction
+from simuleval.data.dataloader.s2t_dataloader import SpeechToTextDataloader
+from simuleval.data.dataloader.t2t_dataloader import TextToTextDataloader
+from simuleval.evaluator import SentenceLevelEvaluator
+from simuleval.evaluator.instance import SpeechToTextInstance
 
 ROOT_PATH = Path(__file__).parents[2]
 
@@ -28,3 +40,90 @@ def test_score_only(root_path=ROOT_PATH):
         cli.main()
         cli.sys.argv[1:] = ["--score-only", "--output", tmpdirname]
         cli.main()
+
+
+def test_lazy_instances():
+    class CountingDataloader(TextToTextDataloader):
+        num_reads = 0
+
+        def preprocess_source(self, source):
+            self.num_reads += 1
+            return super().preprocess_source(source)
+
+    dataloader = CountingDataloader([f"A B C {i}" for i in range(10)], [None] * 10)
+    args = Namespace(
+        output=None,
+        score_only=False,
+        source_type="text",
+        target_type="text",
+        num_prefetch_instances=2,
+        no_progress_bar=True,
+        eval_latency_unit="word",
+    )
+    evaluator = SentenceLevelEvaluator(dataloader, {}, {}, args)
+    assert dataloader.num_reads == 0
+
+    for instance in evaluator.instance_iterator:
+        # the current instance and at most two prefetched ones are read
+        assert dataloader.num_reads <= instance.index + 3
+        assert instance.source[-1] == str(instance.index)
+        evaluator.write_log(instance)
+    assert dataloader.num_reads == 10
+    assert sorted(evaluator.instances.keys()) == list(range(10))
+
+
+def test_released_source():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        wav_path = os.path.join(tmpdirname, "source.wav")
+        soundfile.write(wav_path, np.zeros(16000, dtype="float32"), 16000)
+        dataloader = SpeechToTextDataloader([wav_path], ["A B C"])
+        args = Namespace(eval_latency_unit="word")
+        instance = SpeechToTextInstance(0, dataloader, args)
+        instance.load()
+        instance.release()
+        # the latency is still computed, but the source is not read again
+        assert instance.source_length == 1000
+        with pytest.raises(RuntimeError):
+            instance.source
+
+
+def test_parallel_evaluation():
+    class DummyWaitkTextAgent(TextToTextAgent):
+        waitk = 2
+
+        def policy(self):
+            lagging = len(self.states.source) - len(self.states.target)
+            if lagging >= self.waitk or self.states.source_finished:
+                if lagging == 0:
+                    return WriteAction("", finished=True)
+                return WriteAction(
+                    self.states.source[len(self.states.target)], finished=False
+                )
+            return ReadAction()
+
+    source_list = [" ".join(["A"] * (i + 1)) + f" {i}" for i in range(12)]
+    logs = []
+    for num_workers in [1, 3]:
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            args = Namespace(
+                output=tmpdirname,
+                score_only=False,
+                source_type="text",
+                target_type="text",
+                num_workers=num_workers,
+                no_progress_bar=True,
+                continue_unfinished=False,
+                eval_latency_unit="word",
+            )
+            dataloader = TextToTextDataloader(source_list, source_list)
+            evaluator = SentenceLevelEvaluator(dataloader, {}, {}, args)
+            evaluator(DummyWaitkTextAgent(None))
+            with open(Path(tmpdirname) / "instances.log") as f:
+                logs.append([json.loads(line) for line in f])
+            assert sorted(evaluator.instances.keys()) == list(range(12))
+
+    for log in logs:
+        for info in log:
+            info.pop("elapsed")
+    # the log is merged in index order
+    assert logs[0] == logs[1]
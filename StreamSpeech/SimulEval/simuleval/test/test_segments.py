@@ -0,0 +1,49 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import numpy as np
+
+from simuleval.agents import AgentStates
+from simuleval.data.segments import (
+    EmptySegment,
+    SpeechSegment,
+    TextSegment,
+    segment_from_bytes,
+    segment_from_json_string,
+)
+
+
+def test_binary_segment():
+    samples = [0.0, 0.5, -0.25, 1.0, -1.0]
+    segment = SpeechSegment(index=3, content=samples, sample_rate=16000)
+    decoded = segment_from_bytes(segment.to_bytes())
+    assert decoded.index == 3 and decoded.sample_rate == 16000
+    assert decoded.content.tolist() == samples
+    assert len(segment.to_bytes()) < len(segment.json())
+
+    decoded = segment_from_bytes(segment.to_bytes("int16"))
+    assert decoded.sample_rate == 16000
+    assert np.allclose(decoded.content, samples, atol=1e-4)
+
+    segment = TextSegment(index=1, content="Hallo Welt", finished=True)
+    assert segment_from_bytes(segment.to_bytes()) == segment
+
+    segment = EmptySegment(finished=True)
+    assert segment_from_bytes(segment.to_bytes()) == segment
+
+
+def test_speech_states():
+    states = AgentStates()
+    chunks = [np.random.rand(n).astype(np.float32) for n in (10000, 7000, 30000)]
+    for chunk in chunks[:-1]:
+        states.update_source(SpeechSegment(content=chunk, sample_rate=16000))
+    # list content is accepted as well
+    states.update_source(SpeechSegment(content=chunks[-1].tolist(), sample_rate=16000))
+    assert isinstance(states.source, np.ndarray)
+    assert np.array_equal(states.source, np.concatenate(chunks))
+
+    segment = SpeechSegment(content=np.zeros(5, dtype=np.float32), sample_rate=16000)
+    assert segment_from_json_string(segment.json()).content == [0.0] * 5
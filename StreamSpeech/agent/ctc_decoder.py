@@ -8,10 +8,12 @@ import logging
 import math
 from argparse import Namespace
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional
 
 import torch
 import torch.nn as nn
+from torch import Tensor
+from torch.nn.utils.rnn import pad_sequence
 from fairseq import utils
 from fairseq.data import Dictionary
 from fairseq.data.audio.data_cfg import MultitaskConfig, S2SDataConfig
@@ -27,6 +29,40 @@ from fairseq.tasks.text_to_speech import batch_mel_cepstral_distortion
 logger = logging.getLogger(__name__)
 
 
+def ctc_greedy_collapse(
+    pred_out: Tensor, blank: int, pad: int, lengths: Optional[Tensor] = None
+):
+    """Collapse the best paths of a batch: the repeated tokens are merged,
+    then the blanks and paddings are removed.
+
+    Args:
+        pred_out: Best token of each frame B x T
+        blank: Index of the blank token
+        pad: Index of the padding token
+        lengths: Number of frames of each path (default: T)
+    Returns:
+        The tokens B x T' padded with pad, the number of tokens of each path,
+        and the index of the first frame of each token B x T' padded with -1
+    """
+    bsz, tsz = pred_out.size()
+    frames = torch.arange(tsz, device=pred_out.device).unsqueeze(0).expand(bsz, -1)
+    keep = torch.ones_like(pred_out, dtype=torch.bool)
+    keep[:, 1:] = pred_out[:, 1:] != pred_out[:, :-1]
+    keep &= (pred_out != blank) & (pred_out != pad)
+    if lengths is not None:
+        keep &= frames < lengths.unsqueeze(1)
+
+    token_lengths = keep.sum(dim=1)
+    max_len = int(token_lengths.max()) if bsz > 0 else 0
+    # the kept frames are packed to the left, the others go to an extra column
+    positions = (keep.cumsum(dim=1) - 1).masked_fill_(~keep, max_len)
+    tokens = pred_out.new_full((bsz, max_len + 1), pad)
+    tokens.scatter_(1, positions, pred_out)
+    index = frames.new_full((bsz, max_len + 1), -1)
+    index.scatter_(1, positions, frames)
+    return tokens[:, :max_len], token_lengths, index[:, :max_len]
+
+
 class CTCDecoder(nn.Module):
     def __init__(self, tgt_dict, models):
         super().__init__()
@@ -64,48 +100,151 @@ class CTCDecoder(nn.Module):
         attn = None
         alignment = None
 
-        def _ctc_postprocess(tokens):
-            _toks = tokens.int().tolist()
-            deduplicated_toks = [
-                v for i, v in enumerate(_toks) if i == 0 or v != _toks[i - 1]
-            ]
-            hyp = [
-                v
-                for v in deduplicated_toks
-                if (v != 0) and (v != self.tgt_dict.pad_index)
-            ]
-            return torch.tensor(hyp)
-
-        def _ctc_postprocess_index(tokens):
-            _toks = tokens.int().tolist()
-            deduplicated_toks = [
-                (v, i) for i, v in enumerate(_toks) if i == 0 or v != _toks[i - 1]
-            ]
-            index = [
-                i
-                for v, i in deduplicated_toks
-                if (v != 0) and (v != self.tgt_dict.pad_index)
-            ]
-            return index
-
         if prefix is not None:
 
             pred_out = torch.cat((prefix, pred_out[:, prefix.size(1) :]), dim=1)
 
+        # the padded frames of a batch are dropped from each hypothesis
+        lengths = None
+        encoder_padding_mask = encoder_out.get("encoder_padding_mask", [])
+        if len(encoder_padding_mask) > 0:
+            lengths = (~encoder_padding_mask[0]).sum(dim=1)
+            sum_scores = scores.masked_fill(encoder_padding_mask[0], 0.0).sum(dim=1)
+        else:
+            sum_scores = scores.sum(dim=1)
+
+        tokens, token_lengths, index = ctc_greedy_collapse(
+            pred_out, 0, self.tgt_dict.pad_index, lengths
+        )
+        tokens, index = tokens.cpu(), index.cpu()
+        token_lengths = token_lengths.tolist()
+        sum_scores = sum_scores.tolist()
+        if lengths is None:
+            lengths = [pred_out.size(1)] * pred_out.size(0)
+        else:
+            lengths = lengths.tolist()
+
         hypos = [
             [
                 {
-                    "tokens": _ctc_postprocess(pred_out[b]),
-                    "org_tokens": pred_out[b],
-                    "lprobs": lprobs,
-                    "index": _ctc_postprocess_index(pred_out[b]),
+                    "tokens": tokens[b, : token_lengths[b]],
+                    "org_tokens": pred_out[b, : lengths[b]],
+                    "lprobs": lprobs[b : b + 1, : lengths[b]],
+                    "index": index[b, : token_lengths[b]],
                     "attn": None,
                     "alignment": None,
-                    "positional_scores": scores[b],
-                    "score": utils.item(scores[b].sum().data),
+                    "positional_scores": scores[b, : lengths[b]],
+                    "score": sum_scores[b],
                 }
             ]
             for b in range(pred_out.size(0))
         ]
 
         return hypos
+
+    @torch.no_grad()
+    def generate_streaming(
+        self,
+        encoder_out,
+        num_final: int,
+        state: Dict[str, Tensor],
+        aux_task_name=None,
+    ):
+        """Greedy CTC decoding of a stream whose leading encoder outputs are final.
+
+        The best tokens and scores of the final frames, and their collapsed
+        tokens, are cached in ``state``, so only the frames after them are
+        projected and collapsed. The CTC head must not have transformer
+        layers, so that the output of a frame only depends on that frame.
+        Args:
+            encoder_out: Encoder outputs of the stream received so far
+                (batch of 1)
+            num_final: Number of leading encoder outputs that will not change
+            state: Cache of the stream, an empty dict for a new one
+        Returns:
+            Same as generate, without "lprobs"
+        """
+        return self.generate_streaming_batch(
+            [encoder_out], [num_final], [state], aux_task_name=aux_task_name
+        )
+
+    @torch.no_grad()
+    def generate_streaming_batch(
+        self,
+        encoder_outs: List[Dict[str, List[Tensor]]],
+        num_finals: List[int],
+        states: List[Dict[str, Tensor]],
+        aux_task_name=None,
+    ):
+        """:func:`generate_streaming` for several streams. The uncached frames
+        of the streams are padded to a T x B x C batch and projected in one
+        call; the padded frames are cut before collapsing each stream."""
+        model = self.models[0]
+        model.eval()
+        decoder_name = f"{aux_task_name}_decoder" if aux_task_name else "decoder"
+        ctc_decoder = getattr(model, decoder_name)
+        assert len(getattr(ctc_decoder, "layers", [])) == 0
+
+        starts = [state.get("num_frames", 0) for state in states]
+        new_frames = [
+            encoder_out["encoder_out"][0][start:, 0]
+            for encoder_out, start in zip(encoder_outs, starts)
+        ]
+        lengths = [frames.size(0) for frames in new_frames]
+        ctc_out = ctc_decoder(pad_sequence(new_frames))
+        lprobs = model.get_normalized_probs(
+            [ctc_out["encoder_out"].transpose(0, 1)], log_probs=True
+        )
+        # never select pad, unk
+        lprobs[:, :, self.pad] = -math.inf
+        lprobs[:, :, self.unk] = -math.inf
+        batch_scores, batch_pred_out = torch.max(lprobs, dim=2)  # B x T'
+
+        hypos = []
+        for b, (state, start, num_final) in enumerate(zip(states, starts, num_finals)):
+            scores = batch_scores[b : b + 1, : lengths[b]]
+            pred_out = batch_pred_out[b : b + 1, : lengths[b]]
+            if start > 0:
+                # the last final frame merges the repeats at the boundary,
+                # its own token was already emitted
+                tokens, _, index = ctc_greedy_collapse(
+                    torch.cat((state["pred_out"][:, -1:], pred_out), dim=1),
+                    0,
+                    self.tgt_dict.pad_index,
+                )
+                tokens, index = tokens[index > 0], index[index > 0] + start - 1
+            else:
+                tokens, _, index = ctc_greedy_collapse(
+                    pred_out, 0, self.tgt_dict.pad_index
+                )
+                tokens, index = tokens[0], index[0]
+            tokens, index = tokens.cpu(), index.cpu()
+
+            if start > 0:
+                pred_out = torch.cat((state["pred_out"], pred_out), dim=1)
+                scores = torch.cat((state["scores"], scores), dim=1)
+                tokens = torch.cat((state["tokens"], tokens))
+                index = torch.cat((state["index"], index))
+
+            # the tokens starting on a final frame do not change anymore
+            num_final_tokens = int((index < num_final).sum())
+            state["num_frames"] = num_final
+            state["pred_out"] = pred_out[:, :num_final]
+            state["scores"] = scores[:, :num_final]
+            state["tokens"] = tokens[:num_final_tokens]
+            state["index"] = index[:num_final_tokens]
+
+            hypos.append(
+                [
+                    {
+                        "tokens": tokens,
+                        "org_tokens": pred_out[0],
+                        "index": index,
+                        "attn": None,
+                        "alignment": None,
+                        "positional_scores": scores[0],
+                        "score": utils.item(scores.sum().data),
+                    }
+                ]
+            )
+        return hypos
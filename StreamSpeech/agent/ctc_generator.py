@@ -8,7 +8,6 @@ from typing import Dict, List, Optional
 import torch
 import torch.nn as nn
 from torch import Tensor
-from fairseq import utils
 from fairseq.data import Dictionary
 from fairseq.data.audio.data_cfg import MultitaskConfig, S2SDataConfig
 from fairseq.data.audio.speech_to_speech_dataset import SpeechToSpeechDatasetCreator
@@ -19,6 +18,7 @@ from fairseq.data.audio.speech_to_text_dataset import (
 from fairseq.tasks import LegacyFairseqTask, register_task
 from fairseq.tasks.speech_to_text import DummyMultiTask
 from fairseq.tasks.text_to_speech import batch_mel_cepstral_distortion
+from agent.ctc_decoder import ctc_greedy_collapse
 
 logger = logging.getLogger(__name__)
 
@@ -38,8 +38,24 @@ class CTCSequenceGenerator(nn.Module):
         self.incremental_states = None
 
     @torch.no_grad()
-    def generate(self, encoder_out, prefix=None, aux_task_name=None, **kwargs):
-        if self.use_incremental_states:
+    def generate(
+        self,
+        encoder_out,
+        prefix=None,
+        aux_task_name=None,
+        incremental_states: Optional[
+            List[Dict[str, Dict[str, Optional[Tensor]]]]
+        ] = None,
+        **kwargs,
+    ):
+        """
+        With incremental states, only the frames of the encoder outputs
+        that were not decoded before are decoded and returned after ``prefix``.
+        """
+        if incremental_states is not None:
+            # the caller keeps the states, e.g. one per stream
+            pass
+        elif self.use_incremental_states:
             if self.incremental_states is None:
                 incremental_states = torch.jit.annotate(
                     List[Dict[str, Dict[str, Optional[Tensor]]]],
@@ -71,7 +87,7 @@ class CTCSequenceGenerator(nn.Module):
             None,
             encoder_out=encoder_out,
             incremental_state=(
-                incremental_states[0] if self.use_incremental_states else None
+                incremental_states[0] if incremental_states is not None else None
             ),
             **kwargs,
         )
@@ -88,33 +104,28 @@ class CTCSequenceGenerator(nn.Module):
         attn = ctc_extra["attn"][0]
         alignment = None
 
-        def _ctc_postprocess(tokens):
-            _toks = tokens.int().tolist()
-            deduplicated_toks = [
-                v for i, v in enumerate(_toks) if i == 0 or v != _toks[i - 1]
-            ]
-            hyp = [
-                v
-                for v in deduplicated_toks
-                if (v != self.tgt_dict.blank_index) and (v != self.tgt_dict.pad_index)
-            ]
-            return torch.tensor(hyp)
-
         if prefix is not None:
-            if self.use_incremental_states:
+            if incremental_states is not None:
                 pred_out = torch.cat((prefix, pred_out), dim=1)
             else:
                 pred_out = torch.cat((prefix, pred_out[:, prefix.size(1) :]), dim=1)
 
+        tokens, token_lengths, _ = ctc_greedy_collapse(
+            pred_out, self.tgt_dict.blank_index, self.tgt_dict.pad_index
+        )
+        tokens = tokens.cpu()
+        token_lengths = token_lengths.tolist()
+        sum_scores = scores.sum(dim=1).tolist()
+
         hypos = [
             [
                 {
-                    "tokens": _ctc_postprocess(pred_out[b]),
+                    "tokens": tokens[b, : token_lengths[b]],
                     "org_tokens": pred_out[b],
                     "attn": None,
                     "alignment": None,
                     "positional_scores": scores[b],
-                    "score": utils.item(scores[b].sum().data),
+                    "score": sum_scores[b],
                 }
             ]
             for b in range(pred_out.size(0))
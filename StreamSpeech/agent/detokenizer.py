@@ -0,0 +1,97 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+from typing import List
+
+import torch
+from torch import Tensor
+from fairseq.data import Dictionary
+
+
+def render_piece(symbol: str) -> str:
+    """Text of one subword: the word boundaries and <unk> become spaces,
+    <s> and </s> are dropped."""
+    return (
+        symbol.replace("_", " ")
+        .replace("▁", " ")
+        .replace("<unk>", " ")
+        .replace("<s>", "")
+        .replace("</s>", "")
+    )
+
+
+class PieceTable(object):
+    """Lookup tables of a dictionary, computed once per model.
+
+    Attributes:
+        pieces: rendered text of every token, see :func:`render_piece`
+        units: unit of every token, -1 for the tokens that are not units
+    """
+
+    def __init__(self, tgt_dict: Dictionary):
+        self.pieces = [render_piece(symbol) for symbol in tgt_dict.symbols]
+        self.unk_piece = render_piece(tgt_dict.unk_word)
+        units = []
+        for symbol in tgt_dict.symbols:
+            unit = symbol.replace("<s>", "").replace("</s>", "")
+            units.append(int(unit) if unit.isdigit() else -1)
+        self.units = torch.LongTensor(units)
+
+    def piece(self, token: int) -> str:
+        if 0 <= token < len(self.pieces):
+            return self.pieces[token]
+        return self.unk_piece
+
+    def text(self, tokens: List[int]) -> str:
+        return strip_text("".join([self.piece(token) for token in tokens]))
+
+    def to_units(self, tokens: Tensor) -> List[int]:
+        units = self.units[tokens.long().cpu()]
+        return units[units >= 0].tolist()
+
+    def detokenizer(self) -> "IncrementalDetokenizer":
+        return IncrementalDetokenizer(self)
+
+
+def strip_text(text: str) -> str:
+    if len(text) > 0 and text[0] == " ":
+        return text[1:]
+    return text
+
+
+class IncrementalDetokenizer(object):
+    """Detokenize the successive hypotheses of one stream. The pieces of the
+    prefix shared with the previous hypothesis are reused, so only the newly
+    appended (or rewritten) tokens are rendered."""
+
+    def __init__(self, table: PieceTable):
+        self.table = table
+        self.tokens = []
+        # offsets[i] is the length of the text of the first i tokens
+        self.offsets = [0]
+        self.text = ""
+
+    def __call__(self, tokens) -> str:
+        if isinstance(tokens, Tensor):
+            tokens = tokens.tolist()
+        prefix_len = len(self.tokens)
+        if tokens[:prefix_len] != self.tokens:
+            prefix_len = 0
+            for prev, token in zip(self.tokens, tokens):
+                if prev != token:
+                    break
+                prefix_len += 1
+            del self.tokens[prefix_len:]
+            del self.offsets[prefix_len + 1 :]
+            self.text = self.text[: self.offsets[-1]]
+        if len(tokens) > prefix_len:
+            pieces = [self.table.piece(token) for token in tokens[prefix_len:]]
+            offset = self.offsets[-1]
+            for piece in pieces:
+                offset += len(piece)
+                self.offsets.append(offset)
+            self.tokens.extend(tokens[prefix_len:])
+            self.text += "".join(pieces)
+        return strip_text(self.text)
@@ -6,27 +6,26 @@
 
 from simuleval.utils import entrypoint
 from simuleval.data.segments import SpeechSegment
-from simuleval.agents import SpeechToSpeechAgent
+from simuleval.agents import AgentStates, SpeechToSpeechAgent
 from simuleval.agents.actions import WriteAction, ReadAction
 from fairseq.checkpoint_utils import load_model_ensemble_and_task
 from fairseq.models.text_to_speech.hub_interface import TTSHubInterface
 from pathlib import Path
 from typing import Any, Dict, Optional, Union
-from fairseq.data.audio.audio_utils import convert_waveform
 from examples.speech_to_text.data_utils import extract_fbank_features
 import ast
 import math
 import os
 import json
 import numpy as np
-from copy import deepcopy
 import torch
+import torch.nn.functional as F
+import torchaudio
 import torchaudio.compliance.kaldi as kaldi
 import yaml
 from fairseq import checkpoint_utils, tasks, utils, options
 from fairseq.file_io import PathManager
 from fairseq import search
-from fairseq.data.audio.feature_transforms import CompositeAudioFeatureTransform
 
 
 SHIFT_SIZE = 10
@@ -41,50 +40,135 @@ DEFAULT_EOS = 2
 class OnlineFeatureExtractor:
     """
     Extract speech feature on the fly.
+
+    Only the frames completed since the previous call are extracted: the
+    feature window keeps the samples of the next incomplete frame, so each
+    frame is computed once. The source is resampled by a streaming sinc
+    filter (the kernel of torchaudio's Resample): each output sample is
+    computed once, when the input samples of its window are received, so it
+    matches the resampling of the whole utterance.
     """
 
-    def __init__(self, args, cfg):
+    def __init__(self, args):
         self.shift_size = args.shift_size
         self.window_size = args.window_size
         assert self.window_size >= self.shift_size
 
         self.sample_rate = args.sample_rate
         self.feature_dim = args.feature_dim
-        self.num_samples_per_shift = int(self.shift_size * self.sample_rate / 1000)
-        self.num_samples_per_window = int(self.window_size * self.sample_rate / 1000)
+        self.num_samples_per_shift = int(self.shift_size * SAMPLE_RATE / 1000)
+        self.num_samples_per_window = int(self.window_size * SAMPLE_RATE / 1000)
         self.len_ms_to_samples = lambda x: x * self.sample_rate / 1000
-        self.previous_residual_samples = []
         self.global_cmvn = args.global_cmvn
         self.device = "cuda" if args.device == "gpu" else "cpu"
-        self.feature_transforms = CompositeAudioFeatureTransform.from_config_dict(
-            {"feature_transforms": ["utterance_cmvn"]}
+        self.resampler = None
+        self.feature_buffer = torch.empty(
+            1000, self.feature_dim, device=self.device
         )
+        self.clear_cache()
 
     def clear_cache(self):
-        self.previous_residual_samples = []
-
-    def __call__(self, new_samples, sr=ORG_SAMPLE_RATE):
-        samples = new_samples
-
-        # # num_frames is the number of frames from the new segment
-        num_frames = math.floor(
-            (len(samples) - self.len_ms_to_samples(self.window_size - self.shift_size))
-            / self.num_samples_per_shift
-        )
-
-        # # the number of frames used for feature extraction
-        # # including some part of thte previous segment
-        effective_num_samples = int(
-            num_frames * self.len_ms_to_samples(self.shift_size)
-            + self.len_ms_to_samples(self.window_size - self.shift_size)
+        # samples of the input rate still needed by the streaming resampler
+        self.previous_residual_samples = None
+        # resampled samples of the next incomplete feature window
+        self.previous_residual_waveform = torch.zeros(0)
+        self.num_input_samples = 0
+        self.num_resampled_samples = 0
+        self.num_frames = 0
+        self.finished = False
+
+    @property
+    def features(self):
+        """All the features extracted so far, T X C."""
+        return self.feature_buffer[: self.num_frames]
+
+    def __call__(self, new_samples, sr=ORG_SAMPLE_RATE, finished=False):
+        """Extract the features of the frames completed by ``new_samples``.
+        Args:
+            new_samples: Samples appended to the source since the last call
+            sr: Sample rate of the source
+            finished: Whether the source is finished, the resampler is then
+                flushed and the last incomplete frames are extracted
+        Returns:
+            Tensor of shape T_new X C, also appended to ``features``
+        """
+        if self.finished:
+            return self.features[:0]
+        waveform = self.resample(
+            torch.as_tensor(new_samples, dtype=torch.float), sr, finished
         )
-        samples = samples[:effective_num_samples]
-        waveform, sample_rate = convert_waveform(
-            torch.tensor([samples]), sr, to_mono=True, to_sample_rate=16000
+        self.finished = finished
+        waveform = torch.cat((self.previous_residual_waveform, waveform))
+
+        num_frames = 0
+        if waveform.size(0) >= self.num_samples_per_window:
+            num_frames = (
+                waveform.size(0) - self.num_samples_per_window
+            ) // self.num_samples_per_shift + 1
+        if num_frames == 0:
+            self.previous_residual_waveform = waveform
+            return self.features[:0]
+
+        effective_num_samples = (
+            num_frames - 1
+        ) * self.num_samples_per_shift + self.num_samples_per_window
+        output = extract_fbank_features(
+            waveform[:effective_num_samples].unsqueeze(0), SAMPLE_RATE
         )
-        output = extract_fbank_features(waveform, 16000)
+        self.previous_residual_waveform = waveform[
+            num_frames * self.num_samples_per_shift :
+        ]
         output = self.transform(output)
-        return torch.tensor(output, device=self.device)
+        return self.append_features(torch.tensor(output, device=self.device))
+
+    def resample(self, samples, sr, finished=False):
+        """Streaming sinc resampling to SAMPLE_RATE with the kernel of
+        torchaudio's Resample, only the outputs whose window is complete are
+        returned until the source is finished."""
+        if sr == SAMPLE_RATE:
+            return samples
+        if self.resampler is None or self.resampler.orig_freq != sr:
+            self.resampler = torchaudio.transforms.Resample(sr, SAMPLE_RATE)
+        kernel, width = self.resampler.kernel, self.resampler.width
+        orig_freq = self.resampler.orig_freq // self.resampler.gcd
+        new_freq = self.resampler.new_freq // self.resampler.gcd
+
+        if self.previous_residual_samples is None:
+            self.previous_residual_samples = samples.new_zeros(width)
+        self.num_input_samples += samples.size(0)
+        samples = torch.cat((self.previous_residual_samples, samples))
+        if finished:
+            samples = F.pad(samples, (0, width + orig_freq))
+        num_steps = 0
+        if samples.size(0) >= kernel.size(-1):
+            num_steps = (samples.size(0) - kernel.size(-1)) // orig_freq + 1
+        self.previous_residual_samples = samples[num_steps * orig_freq :]
+        if num_steps == 0:
+            return samples.new_zeros(0)
+
+        resampled = F.conv1d(
+            samples[: (num_steps - 1) * orig_freq + kernel.size(-1)].view(1, 1, -1),
+            kernel,
+            stride=orig_freq,
+        )
+        resampled = resampled.transpose(1, 2).reshape(-1)
+        if finished:
+            target_length = math.ceil(new_freq * self.num_input_samples / orig_freq)
+            resampled = resampled[: target_length - self.num_resampled_samples]
+        self.num_resampled_samples += resampled.size(0)
+        return resampled
+
+    def append_features(self, features):
+        if self.num_frames + features.size(0) > self.feature_buffer.size(0):
+            feature_buffer = self.feature_buffer.new_empty(
+                max(2 * self.feature_buffer.size(0), self.num_frames + features.size(0)),
+                self.feature_dim,
+            )
+            feature_buffer[: self.num_frames] = self.features
+            self.feature_buffer = feature_buffer
+        self.feature_buffer[self.num_frames : self.num_frames + features.size(0)] = features
+        self.num_frames += features.size(0)
+        return self.feature_buffer[self.num_frames - features.size(0) : self.num_frames]
 
     def transform(self, input):
         if self.global_cmvn is None:
@@ -98,6 +182,47 @@ class OnlineFeatureExtractor:
         return x
 
 
+class StreamSpeechStates(AgentStates):
+    """
+    Decoding states of one stream, so that one agent can serve several streams.
+    """
+
+    def __init__(self, feature_extractor, num_models=1):
+        self.feature_extractor = feature_extractor
+        self.num_models = num_models
+        super().__init__()
+
+    def reset(self):
+        super().reset()
+        self.src_seg_num = 0
+        self.tgt_subwords_indices = None
+        self.src_ctc_indices = None
+        self.src_ctc_prefix_length = 0
+        self.tgt_ctc_prefix_length = 0
+        self.tgt_units_indices = None
+        self.prev_output_tokens_mt = None
+        self.tgt_text = []
+        self.mt_decoder_out = None
+        self.unit = None
+        self.post_transcription = ""
+        self.unfinished_wav = None
+        self.vocoder_incremental_state = {}
+        self.src_sample_length = 0
+        self.feature_extractor.clear_cache()
+        self.encoder_incremental_states = [{} for _ in range(self.num_models)]
+        self.mt_incremental_states = [{} for _ in range(self.num_models)]
+        # encoder outputs that were final when the MT states were cached
+        self.mt_encoder_final_frames = [0 for _ in range(self.num_models)]
+        # T2U states of the subword positions whose units were generated,
+        # with --incremental-t2u
+        self.t2u_incremental_states = [{}]
+        self.t2u_encoder_out = None
+        # CTC outputs of the final encoder frames, for each CTC head
+        self.ctc_states = {}
+        # text rendered so far, for each output
+        self.detokenizers = {}
+
+
 @entrypoint
 class StreamSpeechS2STAgent(SpeechToSpeechAgent):
     """
@@ -131,6 +256,7 @@ class StreamSpeechS2STAgent(SpeechToSpeechAgent):
         from agent.sequence_generator import SequenceGenerator
         from agent.ctc_generator import CTCSequenceGenerator
         from agent.ctc_decoder import CTCDecoder
+        from agent.detokenizer import PieceTable
         from agent.tts.vocoder import CodeHiFiGANVocoderWithDur
 
         self.ctc_generator = CTCSequenceGenerator(
@@ -140,6 +266,13 @@ class StreamSpeechS2STAgent(SpeechToSpeechAgent):
         self.asr_ctc_generator = CTCDecoder(tgt_dict_asr, self.models)
         self.st_ctc_generator = CTCDecoder(tgt_dict_st, self.models)
 
+        self.piece_tables = {
+            "asr": PieceTable(tgt_dict_asr),
+            "st": PieceTable(tgt_dict_st),
+            "mt": PieceTable(tgt_dict_mt),
+            "unit": PieceTable(tgt_dict),
+        }
+
         self.generator = SequenceGenerator(
             self.models,
             tgt_dict,
@@ -176,7 +309,7 @@ class StreamSpeechS2STAgent(SpeechToSpeechAgent):
             search_strategy=search.BeamSearch(tgt_dict_mt),
             eos=tgt_dict_mt.eos(),
             symbols_to_strip_from_output=None,
-            use_incremental_states=False,
+            use_incremental_states=True,
         )
 
         with open(args.vocoder_cfg) as f:
@@ -185,6 +318,8 @@ class StreamSpeechS2STAgent(SpeechToSpeechAgent):
         if self.device == "cuda":
             self.vocoder = self.vocoder.cuda()
         self.dur_prediction = args.dur_prediction
+        self.vocoder_overlap = args.vocoder_overlap
+        self.incremental_t2u = args.incremental_t2u
 
         self.lagging_k1 = args.lagging_k1
         self.lagging_k2 = args.lagging_k2
@@ -209,6 +344,7 @@ class StreamSpeechS2STAgent(SpeechToSpeechAgent):
         else:
             self.whole_word = False
 
+        self.states = self.build_states()
         self.reset()
 
     @staticmethod
@@ -305,6 +441,22 @@ class StreamSpeechS2STAgent(SpeechToSpeechAgent):
             action="store_true",
             help="enable duration prediction (for reduced/unique code sequences)",
         )
+        parser.add_argument(
+            "--vocoder-overlap",
+            type=int,
+            default=None,
+            help="number of synthesized samples held back until the next units, "
+            "two hops (40 ms) by default. The last samples of each step are then "
+            "synthesized without their full right context. -1 holds back the "
+            "receptive field of the vocoder (0.46 s for the 5-4-4-2-2 vocoder), "
+            "for a waveform identical to the synthesis of all the units at once.",
+        )
+        parser.add_argument(
+            "--incremental-t2u",
+            action="store_true",
+            help="encode and decode units only for the new subwords, "
+            "reusing the cached T2U states of the previous ones",
+        )
         parser.add_argument("--lagging-k1", type=int, default=0, help="lagging number")
         parser.add_argument("--lagging-k2", type=int, default=0, help="lagging number")
         parser.add_argument(
@@ -325,20 +477,13 @@ class StreamSpeechS2STAgent(SpeechToSpeechAgent):
             help="extra output dir",
         )
 
+    def build_states(self):
+        if not hasattr(self, "models"):
+            # called by GenericAgent.__init__ before the models are loaded
+            return AgentStates()
+        return StreamSpeechStates(OnlineFeatureExtractor(self.args), len(self.models))
+
     def reset(self):
-        self.src_seg_num = 0
-        self.tgt_subwords_indices = None
-        self.src_ctc_indices = None
-        self.src_ctc_prefix_length = 0
-        self.tgt_ctc_prefix_length = 0
-        self.tgt_units_indices = None
-        self.prev_output_tokens_mt = None
-        self.tgt_text = []
-        self.mt_decoder_out = None
-        self.unit = None
-        self.wav = []
-        self.post_transcription = ""
-        self.unfinished_wav = None
         self.states.reset()
         try:
             self.generator_mt.reset_incremental_states()
@@ -373,8 +518,6 @@ class StreamSpeechS2STAgent(SpeechToSpeechAgent):
             if "global_cmvn" in config:
                 args.global_cmvn = np.load(config["global_cmvn"]["stats_npz_path"])
 
-        self.feature_extractor = OnlineFeatureExtractor(args, config)
-
         if args.multitask_config_yaml is not None:
             task_args.multitask_config_yaml = args.multitask_config_yaml
 
@@ -401,16 +544,7 @@ class StreamSpeechS2STAgent(SpeechToSpeechAgent):
             model.share_memory()
             if self.gpu:
                 model.cuda()
-            model.encoder.chunk_size = chunk_size
-
-            if chunk_size >= 16:
-                chunk_size = 16
-            else:
-                chunk_size = 8
-            for conv in model.encoder.subsample.conv_layers:
-                conv.chunk_size = chunk_size
-            for layer in model.encoder.conformer_layers:
-                layer.conv_module.depthwise_conv.chunk_size = chunk_size
+            model.encoder.set_chunk_size(chunk_size, 16 if chunk_size >= 16 else 8)
 
         # Set dictionary
         self.dict = {}
@@ -420,78 +554,252 @@ class StreamSpeechS2STAgent(SpeechToSpeechAgent):
             self.dict[k] = v.tgt_dict
 
     @torch.inference_mode()
-    def policy(self):
+    def policy(self, states):
+        return self.policy_batch([states])[0]
 
-        feature = self.feature_extractor(self.states.source)
+    @torch.inference_mode()
+    def policy_batch(self, states_list):
+        """
+        Decide for several streams sharing the models. The ASR and ST CTC
+        heads project the new encoder frames of all the streams as one padded
+        batch. The encoder and the MT/T2U decoders run per stream: the cached
+        encoder states differ in length and position, and the prefix-constrained
+        MT decoding has a prefix and a budget per stream. Only the CTC heads are
+        batched, the cost of the encoder and the decoders grows with the number
+        of streams as with separate calls to ``policy``.
+        """
+        src_encoder_outs_list = [self.encode(states) for states in states_list]
+        active_indices = [
+            i for i, encoder_outs in enumerate(src_encoder_outs_list)
+            if encoder_outs is not None
+        ]
+        actions = [ReadAction() for _ in states_list]
+        if len(active_indices) == 0:
+            return actions
+
+        encoder_outs = [src_encoder_outs_list[i][0] for i in active_indices]
+        active_states = [states_list[i] for i in active_indices]
+        finalized_asr = self.generate_ctc_batch(
+            self.asr_ctc_generator, active_states, encoder_outs, "source_unigram"
+        )
+        finalized_st = self.generate_ctc_batch(
+            self.st_ctc_generator, active_states, encoder_outs, "ctc_target_unigram"
+        )
+        for j, i in enumerate(active_indices):
+            actions[i] = self.decide(
+                states_list[i],
+                src_encoder_outs_list[i],
+                finalized_asr[j : j + 1],
+                finalized_st[j : j + 1],
+            )
+        return actions
 
-        if feature.size(0) == 0 and not self.states.source_finished:
-            return ReadAction()
+    def encode(self, states):
+        """Encode the new source frames of a stream, None if there are none yet."""
+        new_feature = states.feature_extractor(
+            states.source[states.src_sample_length :],
+            finished=states.source_finished,
+        )
+        states.src_sample_length = len(states.source)
 
-        src_indices = feature.unsqueeze(0)
-        src_lengths = torch.tensor([feature.size(0)], device=self.device).long()
+        if states.feature_extractor.num_frames == 0 and not states.source_finished:
+            return None
 
-        self.encoder_outs = self.generator.model.forward_encoder(
-            {"src_tokens": src_indices, "src_lengths": src_lengths}
+        # only the new frames are encoded, the past chunks are cached
+        new_feature = new_feature.unsqueeze(0)
+        return self.generator.model.forward_encoder_streaming(
+            {
+                "src_tokens": new_feature,
+                "src_lengths": torch.tensor(
+                    [new_feature.size(1)], device=self.device
+                ).long(),
+            },
+            states.encoder_incremental_states,
         )
 
-        finalized_asr = self.asr_ctc_generator.generate(
-            self.encoder_outs[0], aux_task_name="source_unigram"
+    def generate_ctc_batch(
+        self, ctc_generator, states_list, encoder_outs, aux_task_name
+    ):
+        """Greedy CTC decoding of the encoder outputs of several streams."""
+        ctc_decoder = getattr(self.models[0], f"{aux_task_name}_decoder")
+        if len(getattr(ctc_decoder, "layers", [])) == 0:
+            # the outputs of the final encoder frames are cached, only the
+            # following frames of the streams are padded and projected
+            return ctc_generator.generate_streaming_batch(
+                encoder_outs,
+                [
+                    self.models[0].encoder.num_final_frames(
+                        states.encoder_incremental_states[0]
+                    )
+                    for states in states_list
+                ],
+                [
+                    states.ctc_states.setdefault(aux_task_name, {})
+                    for states in states_list
+                ],
+                aux_task_name=aux_task_name,
+            )
+        # the transformer layers of a CTC head take no padding mask,
+        # so such a head decodes each stream on its own
+        return [
+            ctc_generator.generate(encoder_out, aux_task_name=aux_task_name)[0]
+            for encoder_out in encoder_outs
+        ]
+
+    def generate_units(self, states, prev_output_tokens_mt):
+        """
+        Generate the units of the whole translation from the MT decoder states.
+        """
+        single_model = self.generator.model.single_model
+        mt_decoder = getattr(single_model, f"{single_model.mt_task_name}_decoder")
+        max_tgt_len = prev_output_tokens_mt.size(-1)
+        # the padding position of the unfinished word is masked in the T2U encoder
+        x = states.mt_decoder_out[:max_tgt_len]
+        if x.size(0) < max_tgt_len:
+            x = torch.cat(
+                (x, x.new_zeros(max_tgt_len - x.size(0), x.size(1), x.size(2))),
+                dim=0,
+            )
+
+        if getattr(single_model, "proj", None) is not None:
+            x = single_model.proj(x)
+
+        mt_decoder_padding_mask = None
+        if prev_output_tokens_mt.eq(mt_decoder.padding_idx).any():
+            mt_decoder_padding_mask = prev_output_tokens_mt.eq(mt_decoder.padding_idx)
+
+        # 2. T2U encoder
+        if getattr(single_model, "synthesizer_encoder", None) is not None:
+            t2u_encoder_out = single_model.synthesizer_encoder(
+                x,
+                mt_decoder_padding_mask,
+            )
+        else:
+            t2u_encoder_out = {
+                "encoder_out": [x],  # T x B x C
+                "encoder_padding_mask": (
+                    [mt_decoder_padding_mask]
+                    if mt_decoder_padding_mask is not None
+                    else []
+                ),  # B x T
+                "encoder_embedding": [],
+                "encoder_states": [],
+                "src_tokens": [],
+                "src_lengths": [],
+            }
+
+        if getattr(single_model, "t2u_augmented_cross_attn", False):
+            encoder_outs_aug = [t2u_encoder_out]
+        else:
+            encoder_outs = [t2u_encoder_out]
+            encoder_outs_aug = None
+        return self.ctc_generator.generate(
+            encoder_outs[0],
+            prefix=states.tgt_units_indices,
         )
-        asr_probs = torch.exp(finalized_asr[0][0]["lprobs"])
+
+    def generate_units_incremental(self, states, prev_output_tokens_mt):
+        """
+        Generate the units of the subword positions that are new since the
+        previous call. The T2U encoder and unit decoder only process these
+        positions, attending to the states of the previous ones cached in
+        ``states``, and only the new units are returned.
+        Returns None if there is no new position.
+        """
+        single_model = self.generator.model.single_model
+        mt_decoder = getattr(single_model, f"{single_model.mt_task_name}_decoder")
+        # the padding position of the unfinished word is left out
+        tgt_len = int(prev_output_tokens_mt.ne(mt_decoder.padding_idx).sum(-1).max())
+        prev_len = (
+            states.t2u_encoder_out.size(0) if states.t2u_encoder_out is not None else 0
+        )
+        if tgt_len <= prev_len:
+            return None
+        x = states.mt_decoder_out[prev_len:tgt_len]
+
+        if getattr(single_model, "proj", None) is not None:
+            x = single_model.proj(x)
+
+        # 2. T2U encoder
+        if getattr(single_model, "synthesizer_encoder", None) is not None:
+            x = single_model.synthesizer_encoder.forward_streaming(
+                x, states.t2u_incremental_states[0]
+            )["encoder_out"][0]
+        if states.t2u_encoder_out is not None:
+            x = torch.cat((states.t2u_encoder_out, x), dim=0)
+        states.t2u_encoder_out = x
+
+        t2u_encoder_out = {
+            "encoder_out": [x],  # T x B x C
+            "encoder_padding_mask": [],  # B x T
+            "encoder_embedding": [],
+            "encoder_states": [],
+            "src_tokens": [],
+            "src_lengths": [],
+        }
+        # 3. T2U decoder, the CTC collapse continues from the last frame
+        # of the previous units
+        finalized = self.ctc_generator.generate(
+            t2u_encoder_out,
+            prefix=states.tgt_units_indices,
+            incremental_states=states.t2u_incremental_states,
+        )
+        hypo = finalized[0][0]
+        if (
+            states.tgt_units_indices is not None
+            and states.tgt_units_indices[0, -1] != self.ctc_generator.tgt_dict.blank_index
+        ):
+            hypo["tokens"] = hypo["tokens"][1:]
+        states.tgt_units_indices = hypo["org_tokens"][-1:].unsqueeze(0)
+        return finalized
+
+    def detokenize(self, states, name, tokens):
+        """
+        Text of the hypothesis of the output ``name`` of a stream, only the
+        tokens that changed since the previous step are rendered.
+        """
+        if name not in states.detokenizers:
+            states.detokenizers[name] = self.piece_tables[name].detokenizer()
+        return states.detokenizers[name](tokens)
+
+    def decide(self, states, src_encoder_outs, finalized_asr, finalized_st):
+        feature = states.feature_extractor.features
+        src_indices = feature.unsqueeze(0)
+        src_lengths = torch.tensor([feature.size(0)], device=self.device).long()
 
         for i, hypo in enumerate(finalized_asr):
             i_beam = 0
             tmp = hypo[i_beam]["tokens"].int()
             src_ctc_indices = tmp
             src_ctc_index = hypo[i_beam]["index"]
-            text = "".join([self.dict["source_unigram"][c] for c in tmp])
-            text = text.replace("_", " ")
-            text = text.replace("▁", " ")
-            text = text.replace("<unk>", " ")
-            text = text.replace("<s>", "")
-            text = text.replace("</s>", "")
-            if len(text) > 0 and text[0] == " ":
-                text = text[1:]
-            if self.states.source_finished and not self.quiet:
+            text = self.detokenize(states, "asr", tmp)
+            if states.source_finished and not self.quiet:
                 with open(self.asr_file, "a") as file:
                     print(text, file=file)
             if self.output_asr_translation:
                 print("Streaming ASR:", text)
 
-        finalized_st = self.st_ctc_generator.generate(
-            self.encoder_outs[0], aux_task_name="ctc_target_unigram"
-        )
-        st_probs = torch.exp(finalized_st[0][0]["lprobs"])
-
         for i, hypo in enumerate(finalized_st):
             i_beam = 0
             tmp = hypo[i_beam]["tokens"].int()
             tgt_ctc_indices = tmp
             tgt_ctc_index = hypo[i_beam]["index"]
-            text = "".join([self.dict["ctc_target_unigram"][c] for c in tmp])
-            text = text.replace("_", " ")
-            text = text.replace("▁", " ")
-            text = text.replace("<unk>", " ")
-            text = text.replace("<s>", "")
-            text = text.replace("</s>", "")
-            if len(text) > 0 and text[0] == " ":
-                text = text[1:]
-
-        if not self.states.source_finished:
+
+        if not states.source_finished:
             src_ctc_prefix_length = src_ctc_indices.size(-1)
             tgt_ctc_prefix_length = tgt_ctc_indices.size(-1)
 
-            self.src_ctc_indices = src_ctc_indices
+            states.src_ctc_indices = src_ctc_indices
             if (
-                src_ctc_prefix_length < self.src_ctc_prefix_length + self.stride_n
-                or tgt_ctc_prefix_length < self.tgt_ctc_prefix_length + self.stride_n
+                src_ctc_prefix_length < states.src_ctc_prefix_length + self.stride_n
+                or tgt_ctc_prefix_length < states.tgt_ctc_prefix_length + self.stride_n
             ):
                 return ReadAction()
-            self.src_ctc_prefix_length = max(
-                src_ctc_prefix_length, self.src_ctc_prefix_length
+            states.src_ctc_prefix_length = max(
+                src_ctc_prefix_length, states.src_ctc_prefix_length
             )
-            self.tgt_ctc_prefix_length = max(
-                tgt_ctc_prefix_length, self.tgt_ctc_prefix_length
+            states.tgt_ctc_prefix_length = max(
+                tgt_ctc_prefix_length, states.tgt_ctc_prefix_length
             )
             subword_tokens = (
                 (tgt_ctc_prefix_length - self.lagging_k1) // self.stride_n
@@ -500,15 +808,15 @@ class StreamSpeechS2STAgent(SpeechToSpeechAgent):
             if self.whole_word:
                 subword_tokens += 1
             new_subword_tokens = (
-                (subword_tokens - self.tgt_subwords_indices.size(-1))
-                if self.tgt_subwords_indices is not None
+                (subword_tokens - states.tgt_subwords_indices.size(-1))
+                if states.tgt_subwords_indices is not None
                 else subword_tokens
             )
 
             if new_subword_tokens < 1:
                 return ReadAction()
         else:
-            self.src_ctc_indices = src_ctc_indices
+            states.src_ctc_indices = src_ctc_indices
             new_subword_tokens = -1
 
         new_subword_tokens = int(new_subword_tokens)
@@ -517,20 +825,50 @@ class StreamSpeechS2STAgent(SpeechToSpeechAgent):
         mt_decoder = getattr(single_model, f"{single_model.mt_task_name}_decoder")
 
         # 1. MT decoder
+        # the cached states of the positions after the target prefix, and of
+        # the encoder outputs that were not final yet, are decoded again
+        # the decoder states of the prefix positions are cached in
+        # states.mt_decoder_out, along with the incremental states
+        prefix_len = (
+            states.tgt_subwords_indices.size(-1)
+            if states.tgt_subwords_indices is not None
+            else 0
+        )
+        self.generator_mt.model.rollback_incremental_state(
+            states.mt_incremental_states,
+            prefix_len,
+            states.mt_encoder_final_frames,
+            decoder_name=f"{single_model.mt_task_name}_decoder",
+        )
+        states.mt_encoder_final_frames = [
+            model.encoder.num_final_frames(encoder_incremental_state)
+            for model, encoder_incremental_state in zip(
+                self.models, states.encoder_incremental_states
+            )
+        ]
         finalized_mt = self.generator_mt.generate_decoder(
-            self.encoder_outs,
+            src_encoder_outs,
             src_indices,
             src_lengths,
             {
                 "id": 1,
                 "net_input": {"src_tokens": src_indices, "src_lengths": src_lengths},
             },
-            self.tgt_subwords_indices,
+            states.tgt_subwords_indices,
             None,
             None,
             aux_task_name=single_model.mt_task_name,
             max_new_tokens=new_subword_tokens,
+            incremental_states=states.mt_incremental_states,
+            return_decoder_out=True,
         )
+        mt_decoder_out = finalized_mt[0][0]["decoder_out"].unsqueeze(1)  # T x B x C
+        if prefix_len > 0:
+            mt_decoder_out = torch.cat(
+                (states.mt_decoder_out[:prefix_len], mt_decoder_out[prefix_len:]),
+                dim=0,
+            )
+        states.mt_decoder_out = mt_decoder_out
 
         if finalized_mt[0][0]["tokens"][-1] == 2:
             tgt_subwords_indices = finalized_mt[0][0]["tokens"][:-1].unsqueeze(0)
@@ -539,7 +877,7 @@ class StreamSpeechS2STAgent(SpeechToSpeechAgent):
 
         if self.whole_word:
             j = 999999
-            if not self.states.source_finished:
+            if not states.source_finished:
                 for j in range(tgt_subwords_indices.size(-1) - 1, -1, -1):
                     if self.generator_mt.tgt_dict[
                         tgt_subwords_indices[0][j]
@@ -550,28 +888,8 @@ class StreamSpeechS2STAgent(SpeechToSpeechAgent):
 
                 if j == 0:
                     return ReadAction()
-
-                new_incremental_states = [{}]
-                if (
-                    self.generator_mt.incremental_states is not None
-                    and self.generator_mt.use_incremental_states
-                ):
-                    for k, v in self.generator_mt.incremental_states[0].items():
-                        if v["prev_key"].size(2) == v["prev_value"].size(2):
-                            new_incremental_states[0][k] = {
-                                "prev_key": v["prev_key"][:, :, :j, :].contiguous(),
-                                "prev_value": v["prev_value"][:, :, :j, :].contiguous(),
-                                "prev_key_padding_mask": None,
-                            }
-                        else:
-                            new_incremental_states[0][k] = {
-                                "prev_key": v["prev_key"],
-                                "prev_value": v["prev_value"][:, :, :j, :].contiguous(),
-                                "prev_key_padding_mask": None,
-                            }
-                    self.generator_mt.incremental_states = deepcopy(
-                        new_incremental_states
-                    )
+                # the unfinished word is rolled back from the MT states
+                # at the next decoding
 
         max_tgt_len = max([len(hypo[0]["tokens"]) for hypo in finalized_mt])
         if self.whole_word:
@@ -590,33 +908,24 @@ class StreamSpeechS2STAgent(SpeechToSpeechAgent):
                 tmp = tmp[:-1]
             prev_output_tokens_mt[i, 1 : len(tmp) + 1] = tmp
 
-            tokens = [self.generator_mt.tgt_dict[c] for c in tmp]
-
-            text = "".join(tokens)
-            text = text.replace("_", " ")
-            text = text.replace("▁", " ")
-            text = text.replace("<unk>", " ")
-            text = text.replace("<s>", "")
-            text = text.replace("</s>", "")
-            if len(text) > 0 and text[0] == " ":
-                text = text[1:]
-            if self.states.source_finished and not self.quiet:
+            text = self.detokenize(states, "mt", tmp)
+            if states.source_finished and not self.quiet:
                 with open(self.st_file, "a") as file:
                     print(text, file=file)
             if self.output_asr_translation:
                 print("Simultaneous translation:", text)
 
-        if self.tgt_subwords_indices is not None and torch.equal(
-            self.tgt_subwords_indices, tgt_subwords_indices
+        if states.tgt_subwords_indices is not None and torch.equal(
+            states.tgt_subwords_indices, tgt_subwords_indices
         ):
-            if not self.states.source_finished:
+            if not states.source_finished:
                 return ReadAction()
             else:
                 return WriteAction(
                     SpeechSegment(
                         content=(
-                            self.unfinished_wav.tolist()
-                            if self.unfinished_wav is not None
+                            states.unfinished_wav.cpu().numpy()
+                            if states.unfinished_wav is not None
                             else []
                         ),
                         sample_rate=SAMPLE_RATE,
@@ -624,79 +933,31 @@ class StreamSpeechS2STAgent(SpeechToSpeechAgent):
                     ),
                     finished=True,
                 )
-        self.tgt_subwords_indices = tgt_subwords_indices
+        states.tgt_subwords_indices = tgt_subwords_indices
 
-        if not self.states.source_finished:
-            if self.prev_output_tokens_mt is not None:
+        if not states.source_finished:
+            if states.prev_output_tokens_mt is not None:
                 if torch.equal(
-                    self.prev_output_tokens_mt, prev_output_tokens_mt
-                ) or prev_output_tokens_mt.size(-1) <= self.prev_output_tokens_mt.size(
+                    states.prev_output_tokens_mt, prev_output_tokens_mt
+                ) or prev_output_tokens_mt.size(-1) <= states.prev_output_tokens_mt.size(
                     -1
                 ):
                     return ReadAction()
-        self.prev_output_tokens_mt = prev_output_tokens_mt
-        mt_decoder_out = mt_decoder(
-            prev_output_tokens_mt,
-            encoder_out=self.encoder_outs[0],
-            features_only=True,
-        )[0].transpose(0, 1)
-
-        if self.mt_decoder_out is None:
-            self.mt_decoder_out = mt_decoder_out
+        states.prev_output_tokens_mt = prev_output_tokens_mt
+        if self.incremental_t2u:
+            finalized = self.generate_units_incremental(states, prev_output_tokens_mt)
         else:
-            self.mt_decoder_out = torch.cat(
-                (self.mt_decoder_out, mt_decoder_out[self.mt_decoder_out.size(0) :]),
-                dim=0,
-            )
-        self.mt_decoder_out = mt_decoder_out
-        x = self.mt_decoder_out
-
-        if getattr(single_model, "proj", None) is not None:
-            x = single_model.proj(x)
-
-        mt_decoder_padding_mask = None
-        if prev_output_tokens_mt.eq(mt_decoder.padding_idx).any():
-            mt_decoder_padding_mask = prev_output_tokens_mt.eq(mt_decoder.padding_idx)
-
-        # 2. T2U encoder
-        if getattr(single_model, "synthesizer_encoder", None) is not None:
-            t2u_encoder_out = single_model.synthesizer_encoder(
-                x,
-                mt_decoder_padding_mask,
-            )
-        else:
-            t2u_encoder_out = {
-                "encoder_out": [x],  # T x B x C
-                "encoder_padding_mask": (
-                    [mt_decoder_padding_mask]
-                    if mt_decoder_padding_mask is not None
-                    else []
-                ),  # B x T
-                "encoder_embedding": [],
-                "encoder_states": [],
-                "src_tokens": [],
-                "src_lengths": [],
-            }
+            finalized = self.generate_units(states, prev_output_tokens_mt)
 
-        if getattr(single_model, "t2u_augmented_cross_attn", False):
-            encoder_outs_aug = [t2u_encoder_out]
-        else:
-            encoder_outs = [t2u_encoder_out]
-            encoder_outs_aug = None
-        finalized = self.ctc_generator.generate(
-            encoder_outs[0],
-            prefix=self.tgt_units_indices,
-        )
-
-        if len(finalized[0][0]["tokens"]) == 0:
-            if not self.states.source_finished:
+        if finalized is None or len(finalized[0][0]["tokens"]) == 0:
+            if not states.source_finished:
                 return ReadAction()
             else:
                 return WriteAction(
                     SpeechSegment(
                         content=(
-                            self.unfinished_wav.tolist()
-                            if self.unfinished_wav is not None
+                            states.unfinished_wav.cpu().numpy()
+                            if states.unfinished_wav is not None
                             else []
                         ),
                         sample_rate=SAMPLE_RATE,
@@ -710,28 +971,28 @@ class StreamSpeechS2STAgent(SpeechToSpeechAgent):
             tmp = hypo[i_beam]["tokens"].int()  # hyp + eos
             if tmp[-1] == self.generator.eos:
                 tmp = tmp[:-1]
-            unit = []
-            for c in tmp:
-                u = self.generator.tgt_dict[c].replace("<s>", "").replace("</s>", "")
-                if u != "":
-                    unit.append(int(u))
-
-            if len(unit) > 0 and unit[0] == " ":
-                unit = unit[1:]
-            text = " ".join([str(_) for _ in unit])
-            if self.states.source_finished and not self.quiet:
+            # incrementally generated units follow the previous ones
+            unit = (
+                list(states.unit)
+                if self.incremental_t2u and states.unit is not None
+                else []
+            )
+            unit.extend(self.piece_tables["unit"].to_units(tmp))
+
+            if states.source_finished and not self.quiet:
+                text = " ".join([str(_) for _ in unit])
                 with open(self.unit_file, "a") as file:
                     print(text, file=file)
-        cur_unit = unit if self.unit is None else unit[len(self.unit) :]
+        cur_unit = unit if states.unit is None else unit[len(states.unit) :]
         if len(unit) < 1 or len(cur_unit) < 1:
-            if not self.states.source_finished:
+            if not states.source_finished:
                 return ReadAction()
             else:
                 return WriteAction(
                     SpeechSegment(
                         content=(
-                            self.unfinished_wav.tolist()
-                            if self.unfinished_wav is not None
+                            states.unfinished_wav.cpu().numpy()
+                            if states.unfinished_wav is not None
                             else []
                         ),
                         sample_rate=SAMPLE_RATE,
@@ -740,31 +1001,35 @@ class StreamSpeechS2STAgent(SpeechToSpeechAgent):
                     finished=True,
                 )
 
+        # only the new units are synthesized, after a cached left context
         x = {
-            "code": torch.tensor(unit, dtype=torch.long, device=self.device).view(
+            "code": torch.tensor(cur_unit, dtype=torch.long, device=self.device).view(
                 1, -1
             ),
         }
-        wav, dur = self.vocoder(x, self.dur_prediction)
-
-        cur_wav_length = dur[:, -len(cur_unit) :].sum() * 320
-        new_wav = wav[-cur_wav_length:]
-        if self.unfinished_wav is not None and len(self.unfinished_wav) > 0:
-            new_wav = torch.cat((self.unfinished_wav, new_wav), dim=0)
+        new_wav, dur = self.vocoder.forward_streaming(
+            x,
+            states.vocoder_incremental_state,
+            dur_prediction=self.dur_prediction,
+            finished=states.source_finished and new_subword_tokens == -1,
+            overlap=self.vocoder_overlap,
+        )
+        states.unfinished_wav = self.vocoder.pending_wav(
+            states.vocoder_incremental_state
+        )
 
-        self.wav = wav
-        self.unit = unit
+        states.unit = unit
 
         # A SpeechSegment has to be returned for speech-to-speech translation system
-        if self.states.source_finished and new_subword_tokens == -1:
-            self.states.target_finished = True
-            self.reset()
+        if states.source_finished and new_subword_tokens == -1:
+            states.target_finished = True
+            states.reset()
 
         return WriteAction(
             SpeechSegment(
-                content=new_wav.tolist(),
+                content=new_wav.cpu().numpy(),
                 sample_rate=SAMPLE_RATE,
-                finished=self.states.source_finished,
+                finished=states.source_finished,
             ),
-            finished=self.states.target_finished,
+            finished=states.target_finished,
         )
@@ -79,7 +79,10 @@ class OnlineFeatureExtractor:
         )
         samples = samples[:effective_num_samples]
         waveform, sample_rate = convert_waveform(
-            torch.tensor([samples]), sr, to_mono=True, to_sample_rate=16000
+            torch.as_tensor(samples, dtype=torch.float).unsqueeze(0),
+            sr,
+            to_mono=True,
+            to_sample_rate=16000,
         )
         output = extract_fbank_features(waveform, 16000)
         output = self.transform(output)
@@ -573,7 +576,7 @@ class WaitkS2STAgent(SpeechToSpeechAgent):
 
         return WriteAction(
             SpeechSegment(
-                content=new_wav.tolist(),
+                content=new_wav.cpu().numpy(),
                 sample_rate=SAMPLE_RATE,
                 finished=self.states.source_finished,
             ),
@@ -81,7 +81,10 @@ class OnlineFeatureExtractor:
         )
         samples = samples[:effective_num_samples]
         waveform, sample_rate = convert_waveform(
-            torch.tensor([samples]), sr, to_mono=True, to_sample_rate=16000
+            torch.as_tensor(samples, dtype=torch.float).unsqueeze(0),
+            sr,
+            to_mono=True,
+            to_sample_rate=16000,
         )
         output = extract_fbank_features(waveform, 16000)
         output = self.transform(output)
@@ -132,6 +135,7 @@ class StreamSpeechASRAgent(SpeechToTextAgent):
         from agent.sequence_generator import SequenceGenerator
         from agent.ctc_generator import CTCSequenceGenerator
         from agent.ctc_decoder import CTCDecoder
+        from agent.detokenizer import PieceTable
         from agent.tts.vocoder import CodeHiFiGANVocoderWithDur
 
         self.ctc_generator = CTCSequenceGenerator(
@@ -141,6 +145,8 @@ class StreamSpeechASRAgent(SpeechToTextAgent):
         self.asr_ctc_generator = CTCDecoder(tgt_dict_asr, self.models)
         self.st_ctc_generator = CTCDecoder(tgt_dict_st, self.models)
 
+        self.piece_tables = {"asr": PieceTable(tgt_dict_asr)}
+
         self.generator = SequenceGenerator(
             self.models,
             tgt_dict,
@@ -306,6 +312,7 @@ class StreamSpeechASRAgent(SpeechToTextAgent):
         self.wav = []
         self.post_transcription = ""
         self.unfinished_wav = None
+        self.detokenizers = {}
         self.states.reset()
         try:
             self.generator_mt.reset_incremental_states()
@@ -313,6 +320,15 @@ class StreamSpeechASRAgent(SpeechToTextAgent):
         except:
             pass
 
+    def detokenize(self, name, tokens):
+        """
+        Text of the hypothesis of the output ``name``, only the tokens that
+        changed since the previous step are rendered.
+        """
+        if name not in self.detokenizers:
+            self.detokenizers[name] = self.piece_tables[name].detokenizer()
+        return self.detokenizers[name](tokens)
+
     def to_device(self, tensor):
         if self.gpu:
             return tensor.cuda()
@@ -367,12 +383,7 @@ class StreamSpeechASRAgent(SpeechToTextAgent):
             model.share_memory()
             if self.gpu:
                 model.cuda()
-            model.encoder.chunk_size = chunk_size
-            chunk_size = min(chunk_size, 16)
-            for conv in model.encoder.subsample.conv_layers:
-                conv.chunk_size = chunk_size
-            for layer in model.encoder.conformer_layers:
-                layer.conv_module.depthwise_conv.chunk_size = chunk_size
+            model.encoder.set_chunk_size(chunk_size, min(chunk_size, 16))
 
         # Set dictionary
         self.dict = {}
@@ -398,7 +409,6 @@ class StreamSpeechASRAgent(SpeechToTextAgent):
         finalized_asr = self.asr_ctc_generator.generate(
             self.encoder_outs[0], aux_task_name="source_unigram"
         )
-        asr_probs = torch.exp(finalized_asr[0][0]["lprobs"])
 
         for i, hypo in enumerate(finalized_asr):
             i_beam = 0
@@ -406,14 +416,7 @@ class StreamSpeechASRAgent(SpeechToTextAgent):
             src_ctc_indices = tmp
             src_ctc_index = hypo[i_beam]["index"]
             tokens = [self.dict["source_unigram"][c] for c in tmp]
-            text = "".join([self.dict["source_unigram"][c] for c in tmp])
-            text = text.replace("_", " ")
-            text = text.replace("▁", " ")
-            text = text.replace("<unk>", " ")
-            text = text.replace("<s>", "")
-            text = text.replace("</s>", "")
-            if len(text) > 0 and text[0] == " ":
-                text = text[1:]
+            text = self.detokenize("asr", tmp)
             if self.states.source_finished and not self.quiet:
                 with open(self.asr_file, "a") as file:
                     print(text, file=file)
@@ -79,7 +79,10 @@ class OnlineFeatureExtractor:
         )
         samples = samples[:effective_num_samples]
         waveform, sample_rate = convert_waveform(
-            torch.tensor([samples]), sr, to_mono=True, to_sample_rate=16000
+            torch.as_tensor(samples, dtype=torch.float).unsqueeze(0),
+            sr,
+            to_mono=True,
+            to_sample_rate=16000,
         )
         output = extract_fbank_features(waveform, 16000)
         output = self.transform(output)
@@ -130,6 +133,7 @@ class StreamSpeechS2TTAgent(SpeechToTextAgent):
         from agent.sequence_generator import SequenceGenerator
         from agent.ctc_generator import CTCSequenceGenerator
         from agent.ctc_decoder import CTCDecoder
+        from agent.detokenizer import PieceTable
         from agent.tts.vocoder import CodeHiFiGANVocoderWithDur
 
         self.ctc_generator = CTCSequenceGenerator(
@@ -139,6 +143,11 @@ class StreamSpeechS2TTAgent(SpeechToTextAgent):
         self.asr_ctc_generator = CTCDecoder(tgt_dict_asr, self.models)
         self.st_ctc_generator = CTCDecoder(tgt_dict_st, self.models)
 
+        self.piece_tables = {
+            "asr": PieceTable(tgt_dict_asr),
+            "mt": PieceTable(tgt_dict_mt),
+        }
+
         self.generator = SequenceGenerator(
             self.models,
             tgt_dict,
@@ -301,6 +310,7 @@ class StreamSpeechS2TTAgent(SpeechToTextAgent):
         self.wav = []
         self.post_transcription = ""
         self.unfinished_wav = None
+        self.detokenizers = {}
         self.states.reset()
         try:
             self.generator_mt.reset_incremental_states()
@@ -308,6 +318,15 @@ class StreamSpeechS2TTAgent(SpeechToTextAgent):
         except:
             pass
 
+    def detokenize(self, name, tokens):
+        """
+        Text of the hypothesis of the output ``name``, only the tokens that
+        changed since the previous step are rendered.
+        """
+        if name not in self.detokenizers:
+            self.detokenizers[name] = self.piece_tables[name].detokenizer()
+        return self.detokenizers[name](tokens)
+
     def to_device(self, tensor):
         if self.gpu:
             return tensor.cuda()
@@ -363,12 +382,7 @@ class StreamSpeechS2TTAgent(SpeechToTextAgent):
             model.share_memory()
             if self.gpu:
                 model.cuda()
-            model.encoder.chunk_size = chunk_size
-            chunk_size = min(chunk_size, 16)
-            for conv in model.encoder.subsample.conv_layers:
-                conv.chunk_size = chunk_size
-            for layer in model.encoder.conformer_layers:
-                layer.conv_module.depthwise_conv.chunk_size = chunk_size
+            model.encoder.set_chunk_size(chunk_size, min(chunk_size, 16))
 
         # Set dictionary
         self.dict = {}
@@ -393,21 +407,13 @@ class StreamSpeechS2TTAgent(SpeechToTextAgent):
         finalized_asr = self.asr_ctc_generator.generate(
             self.encoder_outs[0], aux_task_name="source_unigram"
         )
-        asr_probs = torch.exp(finalized_asr[0][0]["lprobs"])
 
         for i, hypo in enumerate(finalized_asr):
             i_beam = 0
             tmp = hypo[i_beam]["tokens"].int()
             src_ctc_indices = tmp
             src_ctc_index = hypo[i_beam]["index"]
-            text = "".join([self.dict["source_unigram"][c] for c in tmp])
-            text = text.replace("_", " ")
-            text = text.replace("▁", " ")
-            text = text.replace("<unk>", " ")
-            text = text.replace("<s>", "")
-            text = text.replace("</s>", "")
-            if len(text) > 0 and text[0] == " ":
-                text = text[1:]
+            text = self.detokenize("asr", tmp)
             if self.states.source_finished and not self.quiet:
                 with open(self.asr_file, "a") as file:
                     print(text, file=file)
@@ -415,7 +421,6 @@ class StreamSpeechS2TTAgent(SpeechToTextAgent):
         finalized_st = self.st_ctc_generator.generate(
             self.encoder_outs[0], aux_task_name="ctc_target_unigram"
         )
-        st_probs = torch.exp(finalized_st[0][0]["lprobs"])
 
         for i, hypo in enumerate(finalized_st):
             i_beam = 0
@@ -423,15 +428,6 @@ class StreamSpeechS2TTAgent(SpeechToTextAgent):
             tgt_ctc_indices = tmp
             tgt_ctc_index = hypo[i_beam]["index"]
 
-            text = "".join([self.dict["ctc_target_unigram"][c] for c in tmp])
-            text = text.replace("_", " ")
-            text = text.replace("▁", " ")
-            text = text.replace("<unk>", " ")
-            text = text.replace("<s>", "")
-            text = text.replace("</s>", "")
-            if len(text) > 0 and text[0] == " ":
-                text = text[1:]
-
         if not self.states.source_finished:
             src_ctc_prefix_length = src_ctc_indices.size(-1)
             tgt_ctc_prefix_length = tgt_ctc_indices.size(-1)
@@ -505,15 +501,7 @@ class StreamSpeechS2TTAgent(SpeechToTextAgent):
             prev_output_tokens_mt[i, 1 : len(tmp) + 1] = tmp
 
             tokens = [self.generator_mt.tgt_dict[c] for c in tmp]
-
-            text = "".join(tokens)
-            text = text.replace("_", " ")
-            text = text.replace("▁", " ")
-            text = text.replace("<unk>", " ")
-            text = text.replace("<s>", "")
-            text = text.replace("</s>", "")
-            if len(text) > 0 and text[0] == " ":
-                text = text[1:]
+            text = self.detokenize("mt", tmp)
             if self.states.source_finished and not self.quiet:
                 with open(self.st_file, "a") as file:
                     print(text, file=file)
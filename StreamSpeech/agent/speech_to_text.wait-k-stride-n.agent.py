@@ -78,7 +78,10 @@ class OnlineFeatureExtractor:
         )
         samples = samples[:effective_num_samples]
         waveform, sample_rate = convert_waveform(
-            torch.tensor([samples]), sr, to_mono=True, to_sample_rate=16000
+            torch.as_tensor(samples, dtype=torch.float).unsqueeze(0),
+            sr,
+            to_mono=True,
+            to_sample_rate=16000,
         )
         output = extract_fbank_features(waveform, 16000)
         output = self.transform(output)
@@ -0,0 +1,89 @@
+import unittest
+
+import torch
+from agent.tts.codehifigan import CodeGenerator
+from fairseq.models.text_to_speech.hifigan import Generator
+
+
+class TestCodeGeneratorStreaming(unittest.TestCase):
+    def setUp(self) -> None:
+        torch.manual_seed(0)
+        cfg = {
+            "upsample_rates": [5, 4, 4, 2, 2],
+            "upsample_kernel_sizes": [11, 8, 8, 4, 4],
+            "upsample_initial_channel": 32,
+            "resblock_kernel_sizes": [3, 7, 11],
+            "resblock_dilation_sizes": [[1, 3, 5], [1, 3, 5], [1, 3, 5]],
+            "model_in_dim": 16,
+            "num_embeddings": 50,
+            "embedding_dim": 16,
+        }
+        self.model = CodeGenerator(cfg).eval()
+        self.model.remove_weight_norm()
+        # larger weights than the initialization, so that the context matters
+        for module in self.model.modules():
+            if isinstance(module, (torch.nn.Conv1d, torch.nn.ConvTranspose1d)):
+                module.weight.data.normal_(0.0, 0.3)
+        self.code = torch.randint(0, 50, (1, 60))
+        self.chunk_sizes = [7, 3, 12, 1, 9, 20, 8]
+
+    def stream(self, overlap):
+        state, wavs, start = {}, [], 0
+        with torch.no_grad():
+            for i, chunk_size in enumerate(self.chunk_sizes):
+                wav, _ = self.model.forward_streaming(
+                    self.code[:, start : start + chunk_size],
+                    state,
+                    finished=i == len(self.chunk_sizes) - 1,
+                    overlap=overlap,
+                )
+                wavs.append(wav)
+                start += chunk_size
+        return wavs
+
+    def test_receptive_field(self):
+        # the samples of a frame change with the input frames within the
+        # receptive field only
+        x = torch.randn(1, 16, 80)
+        x_changed = x.clone()
+        x_changed[:, :, 40] += 1.0
+        with torch.no_grad():
+            diff = Generator.forward(self.model, x) - Generator.forward(
+                self.model, x_changed
+            )
+        changed = diff.view(80, -1).abs().amax(dim=1).nonzero().view(-1)
+        self.assertGreaterEqual(changed.min().item(), 40 - self.model.receptive_field)
+        self.assertLessEqual(changed.max().item(), 40 + self.model.receptive_field)
+
+    def test_streaming_matches_full_synthesis(self):
+        with torch.no_grad():
+            expected = self.model(code=self.code)[0].view(-1)
+        wav = torch.cat(self.stream(overlap=-1))
+        self.assertEqual(wav.size(0), expected.size(0))
+        self.assertTrue(torch.allclose(wav, expected, atol=1e-5))
+
+    def test_streaming_with_small_overlap(self):
+        with torch.no_grad():
+            expected = self.model(code=self.code)[0].view(-1)
+        hop_size = self.model.hop_size
+        wavs = self.stream(overlap=None)
+        self.assertEqual(sum(wav.size(0) for wav in wavs), expected.size(0))
+        # only the samples within the receptive field of the end of the units
+        # known when they were synthesized differ from the full synthesis
+        start, num_units = 0, 0
+        for wav, chunk_size in zip(wavs[:-1], self.chunk_sizes):
+            num_units += chunk_size
+            exact = max(0, (num_units - self.model.receptive_field) * hop_size)
+            end = start + wav.size(0)
+            if exact > start:
+                self.assertTrue(
+                    torch.allclose(
+                        wav[: exact - start], expected[start:exact], atol=1e-5
+                    )
+                )
+            self.assertEqual(end, num_units * hop_size - 2 * hop_size)
+            start = end
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+
+import torch
+from agent.ctc_decoder import ctc_greedy_collapse
+
+
+def collapse_loop(tokens, blank, pad):
+    """The per-path loop ctc_greedy_collapse replaced."""
+    tokens = tokens.tolist()
+    deduplicated = [
+        (v, i) for i, v in enumerate(tokens) if i == 0 or v != tokens[i - 1]
+    ]
+    kept = [(v, i) for v, i in deduplicated if v != blank and v != pad]
+    return [v for v, _ in kept], [i for _, i in kept]
+
+
+class TestCTCGreedyCollapse(unittest.TestCase):
+    def test_matches_loop(self):
+        blank, pad = 0, 1
+        pred_out = torch.LongTensor(
+            [
+                [0, 5, 5, 0, 5, 6, 6, 1, 1, 1],
+                [7, 7, 7, 7, 0, 0, 8, 0, 8, 8],
+                [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+                [1, 1, 2, 3, 1, 3, 3, 4, 0, 4],
+            ]
+        )
+        torch.manual_seed(0)
+        random_out = torch.randint(0, 5, (6, 30))
+        for out, lengths in (
+            (pred_out, None),
+            (pred_out, torch.LongTensor([7, 10, 3, 5])),
+            (random_out, None),
+            (random_out, torch.LongTensor([30, 1, 0, 17, 29, 12])),
+        ):
+            tokens, token_lengths, index = ctc_greedy_collapse(
+                out, blank, pad, lengths
+            )
+            for b in range(out.size(0)):
+                length = out.size(1) if lengths is None else int(lengths[b])
+                expected_tokens, expected_index = collapse_loop(
+                    out[b, :length], blank, pad
+                )
+                n = int(token_lengths[b])
+                self.assertEqual(tokens[b, :n].tolist(), expected_tokens)
+                self.assertEqual(index[b, :n].tolist(), expected_index)
+                self.assertTrue((tokens[b, n:] == pad).all())
+                self.assertTrue((index[b, n:] == -1).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,14 +1,19 @@
 from argparse import Namespace
+import math
 import torch
 import torch.nn as nn
 
+from fairseq.incremental_decoding_utils import with_incremental_state
 from fairseq.models.text_to_speech.fastspeech2 import VariancePredictor
 from fairseq.models.text_to_speech.hifigan import Generator
 
 
+@with_incremental_state
 class CodeGenerator(Generator):
     def __init__(self, cfg):
         super().__init__(cfg)
+        self.hop_size = math.prod(cfg["upsample_rates"])
+        self.receptive_field = self.get_receptive_field()
         self.dict = nn.Embedding(cfg["num_embeddings"], cfg["embedding_dim"])
         self.multispkr = cfg.get("multispkr", None)
         self.embedder = cfg.get("embedder_params", None)
@@ -93,3 +98,107 @@ class CodeGenerator(Generator):
             x = torch.cat([x, feat], dim=1)
 
         return super().forward(x), dur_out
+
+    def get_receptive_field(self):
+        """Number of code frames on each side of a frame that its samples
+        depend on, derived from the convolutions of the generator."""
+
+        def conv_radius(conv):
+            return conv.dilation[0] * (conv.kernel_size[0] - 1) // 2
+
+        # in samples of the current resolution, from the output to the input
+        radius = conv_radius(self.conv_post)
+        for i in reversed(range(self.num_upsamples)):
+            resblocks = self.resblocks[
+                i * self.num_kernels : (i + 1) * self.num_kernels
+            ]
+            radius += max(
+                sum(conv_radius(conv) for conv in [*block.convs1, *block.convs2])
+                for block in resblocks
+            )
+            up = self.ups[i]
+            radius = math.ceil((radius + up.kernel_size[0]) / up.stride[0])
+        return radius + conv_radius(self.conv_pre)
+
+    def forward_streaming(
+        self,
+        code,
+        incremental_state,
+        dur_prediction=False,
+        finished=False,
+        overlap=None,
+    ):
+        """Synthesize only the new units of a stream.
+
+        The new units are synthesized after the last units of the stream,
+        which keep their durations and cover the receptive field of the
+        generator. The last ``overlap`` samples are held back until the next
+        units are known, and synthesized again then, unless the stream is
+        finished. The default overlap of two hops only delays the output by
+        40 ms, but the last samples of each call are synthesized without
+        their full right context. With a negative overlap the receptive field
+        is held back (23 frames, 0.46 s for the 5-4-4-2-2 generator) and the
+        waveform matches the synthesis of the whole stream at once, given the
+        same durations.
+        Args:
+            code: New units 1 X U
+            overlap: Number of samples held back, defaults to two hops,
+                negative for the receptive field
+        Returns:
+            Waveform of the new units, durations of the new units 1 X U
+        """
+        assert code.size(0) == 1, "only support single sample"
+        assert not self.f0 and not self.multispkr
+        if overlap is None:
+            overlap = 2 * self.hop_size
+        elif overlap < 0:
+            overlap = self.receptive_field * self.hop_size
+        saved_state = self.get_incremental_state(incremental_state, "vocoder_state")
+        if saved_state is None:
+            saved_state = {}
+        prev_wav = saved_state.get("prev_wav", None)
+        if code.size(1) == 0:
+            wav = code.new_zeros(0, dtype=torch.float)
+            if finished and prev_wav is not None:
+                wav = prev_wav
+                saved_state["prev_wav"] = None
+            self.set_incremental_state(incremental_state, "vocoder_state", saved_state)
+            return wav, code.new_zeros(1, 0)
+
+        num_new = code.size(1)
+        prev_code = saved_state.get("prev_code", None)
+        if prev_code is not None:
+            code = torch.cat((prev_code, code), dim=1)
+        x = self.dict(code).transpose(1, 2)
+        if self.dur_predictor and dur_prediction:
+            log_dur_pred = self.dur_predictor(x.transpose(1, 2))
+            dur_out = torch.clamp(
+                torch.round((torch.exp(log_dur_pred) - 1)).long(), min=1
+            )
+        else:
+            dur_out = torch.ones_like(code)
+        if prev_code is not None:
+            # keep the durations the context was synthesized with
+            dur_out = torch.cat((saved_state["prev_dur"], dur_out[:, -num_new:]), dim=1)
+        x = torch.repeat_interleave(x, dur_out.view(-1), dim=2)
+        wav = super().forward(x).view(-1)
+
+        # the held back samples are synthesized again with their right context
+        context_len = int(dur_out[:, :-num_new].sum()) * self.hop_size
+        num_held = prev_wav.size(0) if prev_wav is not None else 0
+        new_wav = wav[context_len - num_held :]
+        if finished:
+            saved_state["prev_wav"] = None
+        else:
+            overlap = min(overlap, new_wav.size(0))
+            saved_state["prev_wav"] = new_wav[new_wav.size(0) - overlap :]
+            new_wav = new_wav[: new_wav.size(0) - overlap]
+
+        # keep the units of the held back samples and of their left context
+        context_frames = self.receptive_field + math.ceil(overlap / self.hop_size)
+        num_keep = int((dur_out.flip(1).cumsum(dim=1) < context_frames).sum()) + 1
+        num_keep = min(max(num_keep, 2), code.size(1))
+        saved_state["prev_code"] = code[:, -num_keep:]
+        saved_state["prev_dur"] = dur_out[:, -num_keep:]
+        self.set_incremental_state(incremental_state, "vocoder_state", saved_state)
+        return new_wav, dur_out[:, -num_new:]
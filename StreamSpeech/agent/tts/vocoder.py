@@ -59,6 +59,38 @@ class CodeHiFiGANVocoderWithDur(BaseFairseqModel):
         wav, dur = self.model(**x)
         return wav.detach().squeeze(), dur
 
+    def forward_streaming(
+        self,
+        x: Dict[str, torch.Tensor],
+        incremental_state: Dict[str, Dict[str, torch.Tensor]],
+        dur_prediction=False,
+        finished=False,
+        overlap=None,
+    ):
+        """Synthesize the units appended to a stream, see
+        CodeGenerator.forward_streaming."""
+        assert "code" in x
+
+        # remove invalid code
+        code = x["code"][x["code"] >= 0].unsqueeze(dim=0)
+        wav, dur = self.model.forward_streaming(
+            code,
+            incremental_state,
+            dur_prediction=dur_prediction,
+            finished=finished,
+            overlap=overlap,
+        )
+        return wav.detach(), dur
+
+    def pending_wav(self, incremental_state: Dict[str, Dict[str, torch.Tensor]]):
+        """Synthesized samples of a stream that are held back until its next units."""
+        saved_state = self.model.get_incremental_state(
+            incremental_state, "vocoder_state"
+        )
+        if saved_state is None:
+            return None
+        return saved_state.get("prev_wav", None)
+
     @classmethod
     def from_data_cfg(cls, args, data_cfg):
         vocoder_cfg = data_cfg.vocoder
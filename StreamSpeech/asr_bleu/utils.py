@@ -1,11 +1,16 @@
+import hashlib
 import json
+import logging
 import re
 import urllib.request
+from collections import OrderedDict
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 
 import fairseq
 import torch
 from fairseq.data.data_utils import lengths_to_padding_mask
+from torch.nn.utils.rnn import pad_sequence
 from tqdm import tqdm
 
 try:
@@ -14,6 +19,8 @@ try:
 except ImportError:
     raise ImportError("Upgrade torchaudio to 0.12 to enable CTC decoding")
 
+logger = logging.getLogger(__name__)
+
 
 class DownloadProgressBar(tqdm):
     """A class to represent a download progress bar"""
@@ -27,6 +34,152 @@ class DownloadProgressBar(tqdm):
         self.update(b * bsize - self.n)
 
 
+def load_audio(
+    audio_path: str, sampling_rate: int, normalize_input: bool
+) -> torch.Tensor:
+    """
+    Load an audio file, downmix it to mono, then apply resampling and normalization
+
+    Args:
+        audio_path: the audio file path
+        sampling_rate: the sampling rate of the asr model
+        normalize_input: whether the asr model expects a normalized input
+
+    Returns:
+        audio_waveform: the audio waveform of shape (1, num_samples)
+    """
+
+    audio_waveform, audio_sampling_rate = torchaudio.load(audio_path)
+    if audio_waveform.size(0) > 1:
+        audio_waveform = audio_waveform.mean(0, keepdim=True)
+    if sampling_rate != audio_sampling_rate:
+        audio_waveform = torchaudio.functional.resample(
+            audio_waveform, audio_sampling_rate, sampling_rate
+        )
+    if normalize_input:
+        # following fairseq raw audio dataset
+        audio_waveform = torch.nn.functional.layer_norm(
+            audio_waveform, audio_waveform.shape
+        )
+
+    return audio_waveform
+
+
+class AudioFileDataset(torch.utils.data.Dataset):
+    """A dataset of audio files, loaded in DataLoader workers"""
+
+    def __init__(
+        self, audio_paths: List[str], sampling_rate: int, normalize_input: bool
+    ) -> None:
+        self.audio_paths = audio_paths
+        self.sampling_rate = sampling_rate
+        self.normalize_input = normalize_input
+
+    def __len__(self) -> int:
+        return len(self.audio_paths)
+
+    def __getitem__(self, index: int) -> Tuple[int, Optional[torch.Tensor]]:
+        try:
+            audio_waveform = load_audio(
+                self.audio_paths[index], self.sampling_rate, self.normalize_input
+            )
+        except Exception:
+            logger.warning(f"Failed to load {self.audio_paths[index]}")
+            return index, None
+        return index, audio_waveform[0]
+
+    def duration(self, index: int) -> float:
+        try:
+            info = torchaudio.info(self.audio_paths[index])
+        except Exception:
+            return 0.0
+        return info.num_frames / info.sample_rate
+
+    def batch_by_duration(self, batch_size: int) -> List[List[int]]:
+        """
+        Group the audio files of similar durations,
+        so that little padding is needed in a batch
+        """
+        indices = sorted(range(len(self)), key=self.duration)
+        return [
+            indices[start : start + batch_size]
+            for start in range(0, len(indices), batch_size)
+        ]
+
+
+def collate_audio(
+    samples: List[Tuple[int, Optional[torch.Tensor]]]
+) -> List[Tuple[int, Optional[torch.Tensor]]]:
+    return samples
+
+
+class TranscriptCache(object):
+    """
+    A persistent LRU cache of the transcriptions of an asr model.
+    The transcriptions are keyed by the hash of the audio file content,
+    so that the unchanged predictions of a system are not transcribed again.
+    """
+
+    def __init__(
+        self, cache_path: Path, model_key: str, max_size: int = 100000
+    ) -> None:
+        """
+        Args:
+            cache_path: the jsonl file storing the transcriptions
+            model_key: identifies the asr model and its post processing
+            max_size: the maximum number of transcriptions kept, the least
+                recently used ones are dropped
+        """
+        self.cache_path = cache_path
+        self.model_key = model_key
+        self.max_size = max_size
+        self.transcripts: OrderedDict = OrderedDict()
+        self.num_lines = 0
+        if self.cache_path.exists():
+            with open(self.cache_path, "r") as f:
+                for line in f:
+                    self.num_lines += 1
+                    try:
+                        item = json.loads(line)
+                    except json.JSONDecodeError:
+                        # a partially written line
+                        continue
+                    self.transcripts[item["key"]] = item["transcript"]
+                    self.transcripts.move_to_end(item["key"])
+                    if len(self.transcripts) > self.max_size:
+                        self.transcripts.popitem(last=False)
+
+    def key(self, audio_path: str) -> str:
+        sha1 = hashlib.sha1(self.model_key.encode())
+        with open(audio_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha1.update(block)
+        return sha1.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        transcript = self.transcripts.get(key)
+        if transcript is not None:
+            self.transcripts.move_to_end(key)
+        return transcript
+
+    def put(self, items: Dict[str, str]) -> None:
+        for key, transcript in items.items():
+            self.transcripts[key] = transcript
+            self.transcripts.move_to_end(key)
+        while len(self.transcripts) > self.max_size:
+            self.transcripts.popitem(last=False)
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        mode = "a"
+        if self.num_lines + len(items) > 2 * self.max_size:
+            # rewrite the file with the kept transcriptions only
+            items, mode = self.transcripts, "w"
+            self.num_lines = 0
+        with open(self.cache_path, mode) as f:
+            for key, transcript in items.items():
+                f.write(json.dumps({"key": key, "transcript": transcript}) + "\n")
+        self.num_lines += len(items)
+
+
 def retrieve_asr_config(lang_key: str, asr_version: str, json_path: str) -> dict:
     """
     Retrieve the asr model configs
@@ -51,6 +204,7 @@ class ASRGenerator(object):
         self,
         model_cfg: dict,
         cache_dirpath: str = (Path.home() / ".cache" / "ust_asr").as_posix(),
+        transcript_cache_size: int = 100000,
     ) -> None:
         """
         Construct all the necessary attributes of the ASRGenerator class
@@ -58,6 +212,7 @@ class ASRGenerator(object):
         Args:
             model_cfg: the dict of the asr model config
             cache_dirpath: the default cache path is "Path.home()/.cache/ust_asr"
+            transcript_cache_size: the maximum number of cached transcriptions
         """
 
         self.cache_dirpath = Path(cache_dirpath) / model_cfg["lang"]
@@ -91,6 +246,12 @@ class ASRGenerator(object):
             self.model.cuda()
         self.model.eval()
 
+        self.transcript_cache = TranscriptCache(
+            self.cache_dirpath / "transcripts.jsonl",
+            json.dumps(self.model_cfg, sort_keys=True),
+            max_size=transcript_cache_size,
+        )
+
         self.decoder = ctc_decoder(
             lexicon=None,
             tokens=self.tokens,
@@ -148,6 +309,9 @@ class ASRGenerator(object):
 
         self.sampling_rate = self.preprocessor.sampling_rate
         self.normalize_input = self.preprocessor.do_normalize
+        # checkpoints that are trained without attention mask
+        # cannot be fed zero padded batches
+        self.supports_padding = self.preprocessor.return_attention_mask
         self.tokens = vocab_list
         self.sil_token = infer_silence_token(vocab_list)
         self.blank_token = self.tokenizer.pad_token
@@ -215,6 +379,9 @@ class ASRGenerator(object):
 
         self.sampling_rate = saved_cfg.task.sample_rate
         self.normalize_input = saved_cfg.task.normalize
+        # the layer norm feature extractor of normalized models
+        # is not affected by zero padding
+        self.supports_padding = self.normalize_input
 
     @torch.inference_mode()
     def load_audiofile(self, audio_path: str) -> torch.Tensor:
@@ -228,20 +395,7 @@ class ASRGenerator(object):
             audio_waveform: the audio waveform as a torch.Tensor object
         """
 
-        audio_waveform, sampling_rate = torchaudio.load(audio_path)
-        if audio_waveform.dim == 2:
-            audio_waveform = audio_waveform.mean(-1)
-        if self.sampling_rate != sampling_rate:
-            audio_waveform = torchaudio.functional.resample(
-                audio_waveform, sampling_rate, self.sampling_rate
-            )
-        if self.normalize_input:
-            # following fairseq raw audio dataset
-            audio_waveform = torch.nn.functional.layer_norm(
-                audio_waveform, audio_waveform.shape
-            )
-
-        return audio_waveform
+        return load_audio(audio_path, self.sampling_rate, self.normalize_input)
 
     @torch.inference_mode()
     def compute_emissions(self, audio_input: torch.Tensor) -> torch.Tensor:
@@ -267,6 +421,43 @@ class ASRGenerator(object):
 
         return emissions
 
+    @torch.inference_mode()
+    def compute_emissions_batch(
+        self, audio_inputs: List[torch.Tensor]
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Compute the emissions of a batch of waveforms of different lengths
+
+        Args:
+            audio_inputs: the list of 1D input audio waveforms
+
+        Returns:
+            emissions: the logits of the encoded predictions, B x T x V
+            emission_lengths: the number of valid frames of each prediction
+        """
+
+        lengths = torch.tensor([audio_input.numel() for audio_input in audio_inputs])
+        audio_input = pad_sequence(audio_inputs, batch_first=True)
+        padding_mask = lengths_to_padding_mask(lengths)
+        if self.use_cuda:
+            audio_input = audio_input.to("cuda")
+            padding_mask = padding_mask.to("cuda")
+        if isinstance(self.model, fairseq.models.wav2vec.wav2vec2_asr.Wav2VecCtc):
+            encoder_out = self.model.w2v_encoder(audio_input, padding_mask)
+            emissions = encoder_out["encoder_out"].transpose(0, 1)
+            if encoder_out["padding_mask"] is not None:
+                emission_lengths = (~encoder_out["padding_mask"]).sum(-1)
+            else:
+                emission_lengths = torch.full(
+                    (emissions.size(0),), emissions.size(1), dtype=torch.long
+                )
+        else:
+            attention_mask = (~padding_mask).long() if self.supports_padding else None
+            emissions = self.model(audio_input, attention_mask=attention_mask).logits
+            emission_lengths = self.model._get_feat_extract_output_lengths(lengths)
+
+        return emissions, emission_lengths.cpu()
+
     def decode_emissions(self, emissions: torch.Tensor) -> str:
         """
         Decode the emissions and apply post process functions
@@ -304,3 +495,121 @@ class ASRGenerator(object):
         hypo = self.decode_emissions(emissions)
 
         return hypo.strip().lower() if lower else hypo.strip()
+
+    def decode_emissions_batch(
+        self, emissions: torch.Tensor, emission_lengths: torch.Tensor
+    ) -> List[str]:
+        """
+        Decode a batch of emissions and apply post process functions
+
+        Args:
+            emissions: the padded emissions, B x T x V
+            emission_lengths: the number of valid frames of each emission
+
+        Returns:
+            hypos: the decoded transcriptions
+        """
+
+        emissions = emissions.cpu().float().contiguous()
+        results = self.decoder(emissions, emission_lengths.int())
+
+        return [
+            self.post_process_fn(self.decoder.idxs_to_tokens(result[0].tokens))
+            for result in results
+        ]
+
+    def transcribe_batch(self, audio_inputs: List[torch.Tensor]) -> List[str]:
+        """
+        Transcribe a batch of 1D waveforms, one by one if the model
+        does not support padding
+        """
+
+        if len(audio_inputs) > 1 and not self.supports_padding:
+            return [
+                self.transcribe_batch([audio_input])[0] for audio_input in audio_inputs
+            ]
+        emissions, emission_lengths = self.compute_emissions_batch(audio_inputs)
+        return [
+            hypo.strip()
+            for hypo in self.decode_emissions_batch(emissions, emission_lengths)
+        ]
+
+    def transcribe_audiofiles(
+        self,
+        audio_paths: List[str],
+        lower: bool = True,
+        batch_size: int = 16,
+        num_workers: int = 4,
+        use_cache: bool = True,
+    ) -> List[str]:
+        """
+        Transcribe a list of audio files in batches of similar durations.
+        The audio files are loaded in parallel by DataLoader workers,
+        and the cached transcriptions of unchanged files are reused.
+        The audio files that failed to be transcribed get an empty transcription.
+
+        Args:
+            audio_paths: the input audio file paths
+            lower: the case of the transcriptions with lowercase as the default
+            batch_size: the maximum number of audio files in a batch
+            num_workers: the number of processes loading the audio files
+            use_cache: whether to read and update the transcription cache
+
+        Returns:
+            hypos: the transcription results, in the order of audio_paths
+        """
+
+        hypos: List[Optional[str]] = [None] * len(audio_paths)
+        keys: List[Optional[str]] = [None] * len(audio_paths)
+        if use_cache:
+            for index, audio_path in enumerate(audio_paths):
+                try:
+                    keys[index] = self.transcript_cache.key(audio_path)
+                except OSError:
+                    continue
+                hypos[index] = self.transcript_cache.get(keys[index])
+        todo = [index for index, hypo in enumerate(hypos) if hypo is None]
+
+        dataset = AudioFileDataset(
+            [audio_paths[index] for index in todo],
+            self.sampling_rate,
+            self.normalize_input,
+        )
+        dataloader = torch.utils.data.DataLoader(
+            dataset,
+            batch_sampler=dataset.batch_by_duration(batch_size),
+            num_workers=num_workers,
+            collate_fn=collate_audio,
+        )
+        new_hypos = {}
+        with tqdm(total=len(audio_paths), desc="Transcribing predictions") as t:
+            t.update(len(audio_paths) - len(todo))
+            for samples in dataloader:
+                t.update(len(samples))
+                samples = [
+                    (todo[i], audio_input)
+                    for i, audio_input in samples
+                    if audio_input is not None
+                ]
+                try:
+                    batch_hypos = self.transcribe_batch(
+                        [audio_input for _, audio_input in samples]
+                    )
+                except Exception:
+                    # e.g. a waveform shorter than the receptive field of the model
+                    batch_hypos = []
+                    for _, audio_input in samples:
+                        try:
+                            batch_hypos += self.transcribe_batch([audio_input])
+                        except Exception:
+                            batch_hypos.append("")
+                for (index, _), hypo in zip(samples, batch_hypos):
+                    hypos[index] = hypo
+                    if keys[index] is not None:
+                        new_hypos[keys[index]] = hypo
+
+        if use_cache and len(new_hypos) > 0:
+            self.transcript_cache.put(new_hypos)
+
+        hypos = ["" if hypo is None else hypo for hypo in hypos]
+        return [hypo.lower() for hypo in hypos] if lower else hypos
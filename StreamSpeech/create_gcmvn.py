@@ -4,58 +4,33 @@ Create GCMVN (Global Cepstral Mean and Variance Normalization) statistics
 """
 
 import numpy as np
-import zipfile
 import os
+import sys
 from pathlib import Path
 import argparse
 
-def extract_fbank_features_from_zip(zip_path, max_files=1000):
-    """Extract a sample of fbank features from the zip file"""
-    features_list = []
-    
-    with zipfile.ZipFile(zip_path, 'r') as zip_file:
-        file_list = zip_file.namelist()
-        npy_files = [f for f in file_list if f.endswith('.npy')]
-        
-        # Sample a subset of files
-        sample_files = npy_files[:min(max_files, len(npy_files))]
-        
-        print(f"Processing {len(sample_files)} files for GCMVN statistics...")
-        
-        for file_name in sample_files:
-            try:
-                with zip_file.open(file_name) as f:
-                    features = np.load(f)
-                    if len(features.shape) == 2:  # Should be (time, features)
-                        features_list.append(features)
-            except Exception as e:
-                print(f"Error processing {file_name}: {e}")
-                continue
-    
-    return features_list
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "fairseq"))
+from examples.speech_to_text.data_utils import cal_gcmvn_stats_from_zip
 
-def compute_gcmvn_stats(features_list):
-    """Compute global mean and variance from features"""
-    if not features_list:
+def compute_gcmvn_stats(zip_path, num_workers):
+    """Compute global mean and std over all the fbank features of the zip file"""
+    print(f"Processing {zip_path} with {num_workers} workers for GCMVN statistics...")
+    gcmvn_stats = cal_gcmvn_stats_from_zip(zip_path, num_workers=num_workers)
+    if gcmvn_stats.count == 0:
         # Create dummy statistics if no features available
         print("Warning: No features found, creating dummy GCMVN statistics")
         return {
             'mean': np.zeros(80),  # Assuming 80-dim fbank features
             'std': np.ones(80)
         }
-    
-    # Concatenate all features
-    all_features = np.concatenate(features_list, axis=0)
-    
-    # Compute mean and std
-    mean = np.mean(all_features, axis=0)
-    std = np.std(all_features, axis=0)
-    
-    # Prevent division by zero
-    std = np.where(std == 0, 1.0, std)
-    
-    print(f"Computed GCMVN stats from {all_features.shape[0]} frames")
-    print(f"Feature dimension: {all_features.shape[1]}")
+
+    stats = gcmvn_stats.get_stats()
+    mean = stats['mean']
+    # Prevent division by zero (get_stats floors the variance at 1e-8)
+    std = np.where(stats['std'] <= 1e-4, 1.0, stats['std'])
+
+    print(f"Computed GCMVN stats from {gcmvn_stats.count} frames")
+    print(f"Feature dimension: {mean.shape[0]}")
     print(f"Mean range: [{mean.min():.3f}, {mean.max():.3f}]")
     print(f"Std range: [{std.min():.3f}, {std.max():.3f}]")
     
@@ -64,7 +39,7 @@ def compute_gcmvn_stats(features_list):
         'std': std
     }
 
-def create_gcmvn_file(lang):
+def create_gcmvn_file(lang, num_workers=1):
     """Create GCMVN file for a language"""
     
     # Path to the source fbank zip file
@@ -72,12 +47,9 @@ def create_gcmvn_file(lang):
     
     if not zip_path.exists():
         print(f"Warning: {zip_path} not found, creating dummy GCMVN stats")
-        features_list = []
+        stats = {'mean': np.zeros(80), 'std': np.ones(80)}
     else:
-        features_list = extract_fbank_features_from_zip(zip_path)
-    
-    # Compute statistics
-    stats = compute_gcmvn_stats(features_list)
+        stats = compute_gcmvn_stats(zip_path, num_workers)
     
     # Save to configs directory
     output_path = Path(f"/run/media/shivamk21/data/ML-Project/StreamSpeech/configs/{lang}-en/gcmvn.npz")
@@ -89,9 +61,13 @@ def create_gcmvn_file(lang):
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--lang", required=True, help="Language code (hi, ma, mr)")
+    parser.add_argument(
+        "--num-workers", type=int, default=os.cpu_count(),
+        help="Number of processes reading shards of the zip file"
+    )
     args = parser.parse_args()
     
-    create_gcmvn_file(args.lang)
+    create_gcmvn_file(args.lang, args.num_workers)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
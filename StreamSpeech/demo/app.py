@@ -372,16 +372,7 @@ class StreamSpeechS2STAgent(SpeechToSpeechAgent):
 
 
         for model in self.models:
-            model.encoder.chunk_size = chunk_size
-
-            if chunk_size >= 16:
-                chunk_size = 16
-            else:
-                chunk_size = 8
-            for conv in model.encoder.subsample.conv_layers:
-                conv.chunk_size = chunk_size
-            for layer in model.encoder.conformer_layers:
-                layer.conv_module.depthwise_conv.chunk_size = chunk_size
+            model.encoder.set_chunk_size(chunk_size, 16 if chunk_size >= 16 else 8)
 
         if segment_size >= 640:
             self.whole_word = True
@@ -444,16 +435,7 @@ class StreamSpeechS2STAgent(SpeechToSpeechAgent):
             model.share_memory()
             if self.gpu:
                 model.cuda()
-            model.encoder.chunk_size = chunk_size
-
-            if chunk_size >= 16:
-                chunk_size = 16
-            else:
-                chunk_size = 8
-            for conv in model.encoder.subsample.conv_layers:
-                conv.chunk_size = chunk_size
-            for layer in model.encoder.conformer_layers:
-                layer.conv_module.depthwise_conv.chunk_size = chunk_size
+            model.encoder.set_chunk_size(chunk_size, 16 if chunk_size >= 16 else 8)
 
         # Set dictionary
         self.dict = {}
@@ -480,7 +462,6 @@ class StreamSpeechS2STAgent(SpeechToSpeechAgent):
         finalized_asr = self.asr_ctc_generator.generate(
             self.encoder_outs[0], aux_task_name="source_unigram"
         )
-        asr_probs = torch.exp(finalized_asr[0][0]["lprobs"])
 
         for i, hypo in enumerate(finalized_asr):
             i_beam = 0
@@ -507,7 +488,6 @@ class StreamSpeechS2STAgent(SpeechToSpeechAgent):
         finalized_st = self.st_ctc_generator.generate(
             self.encoder_outs[0], aux_task_name="ctc_target_unigram"
         )
-        st_probs = torch.exp(finalized_st[0][0]["lprobs"])
 
         for i, hypo in enumerate(finalized_st):
             i_beam = 0
@@ -5,7 +5,6 @@ import pandas as pd
 from glob import glob
 from pathlib import Path
 from utils import retrieve_asr_config, ASRGenerator
-from tqdm import tqdm
 from argparse import ArgumentParser
 
 
@@ -139,14 +138,12 @@ def run_asr_bleu(args):
         save_manifest_filepath=None,
     )
 
-    prediction_transcripts = []
-    for _, eval_pair in tqdm(
-        eval_manifest.iterrows(),
-        desc="Transcribing predictions",
-        total=len(eval_manifest),
-    ):
-        transcription = asr_model.transcribe_audiofile(eval_pair.prediction)
-        prediction_transcripts.append(transcription.lower())
+    prediction_transcripts = asr_model.transcribe_audiofiles(
+        eval_manifest["prediction"].tolist(),
+        batch_size=args.batch_size,
+        num_workers=args.num_workers,
+        use_cache=not args.no_transcript_cache,
+    )
 
     if args.lang == "hok":
         prediction_transcripts = [
@@ -217,6 +214,24 @@ def main():
         help="If specified, the predicted transcripts will be written to this path as a txt file.",
     )
 
+    parser.add_argument(
+        "--batch_size",
+        default=16,
+        type=int,
+        help="Maximum number of audio files transcribed in a batch, audio files of similar durations are batched together",
+    )
+    parser.add_argument(
+        "--num_workers",
+        default=4,
+        type=int,
+        help="Number of processes loading and resampling the audio files",
+    )
+    parser.add_argument(
+        "--no_transcript_cache",
+        action="store_true",
+        help="Do not reuse the cached transcriptions of unchanged audio files",
+    )
+
     args = parser.parse_args()
 
     prediction_transcripts, bleu_score = run_asr_bleu(args)
@@ -6,6 +6,7 @@
 import argparse
 import json
 import logging
+from multiprocessing import Pool
 from pathlib import Path
 import random
 import soundfile as sf
@@ -23,10 +24,10 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def dump_result(args, sample_id, pred_wav, suffix=""):
+def dump_result(results_path, sample_id, pred_wav, suffix=""):
     sf.write(
-        f"{args.results_path}/{sample_id}{suffix}_pred.wav",
-        pred_wav.detach().cpu().numpy(),
+        f"{results_path}/{sample_id}{suffix}_pred.wav",
+        pred_wav,
         16000,
     )
 
@@ -60,23 +61,56 @@ def main(args):
 
     data = load_code(args.in_code_file)
     Path(args.results_path).mkdir(exist_ok=True, parents=True)
-    for i, d in tqdm(enumerate(data), total=len(data)):
-        x = {
-            "code": torch.LongTensor(d).view(1, -1),
-        }
-        suffix = ""
-        if multispkr:
-            spk = (
+
+    speakers = [None for _ in data]
+    if multispkr:
+        speakers = [
+            (
                 random.randint(0, num_speakers - 1)
                 if args.speaker_id == -1
                 else args.speaker_id
             )
-            suffix = f"_spk{spk}"
-            x["spkr"] = torch.LongTensor([spk]).view(1, 1)
-
-        x = utils.move_to_cuda(x) if use_cuda else x
-        wav = vocoder(x, args.dur_prediction)
-        dump_result(args, i, wav, suffix=suffix)
+            for _ in data
+        ]
+
+    # the invalid codes are removed, and sequences of similar lengths are
+    # batched to limit the padding
+    data = [[c for c in d if c >= 0] for d in data]
+    indices = sorted(range(len(data)), key=lambda i: len(data[i]))
+    batches = [
+        indices[i : i + args.batch_size]
+        for i in range(0, len(indices), args.batch_size)
+    ]
+
+    # the wavs are written by a pool of processes while vocoding goes on
+    with Pool(args.num_workers) as writers:
+        results = []
+        with tqdm(total=len(data)) as progress:
+            for batch in batches:
+                max_len = max(len(data[i]) for i in batch)
+                x = {
+                    "code": torch.LongTensor(
+                        [data[i] + [-1] * (max_len - len(data[i])) for i in batch]
+                    ),
+                }
+                if multispkr:
+                    x["spkr"] = torch.LongTensor([speakers[i] for i in batch]).view(
+                        -1, 1
+                    )
+
+                x = utils.move_to_cuda(x) if use_cuda else x
+                wavs = vocoder.forward_batch(x, args.dur_prediction)
+                for i, wav in zip(batch, wavs):
+                    suffix = f"_spk{speakers[i]}" if multispkr else ""
+                    results.append(
+                        writers.apply_async(
+                            dump_result,
+                            (args.results_path, i, wav.cpu().numpy(), suffix),
+                        )
+                    )
+                progress.update(len(batch))
+        for result in results:
+            result.get()
 
 
 def cli_main():
@@ -105,6 +139,15 @@ def cli_main():
         default=-1,
         help="Speaker id (for vocoder that supports multispeaker). Set to -1 to randomly sample speakers.",
     )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=16,
+        help="number of unit sequences vocoded together, 1 to vocode them one by one",
+    )
+    parser.add_argument(
+        "--num-workers", type=int, default=4, help="number of wav writing processes"
+    )
     parser.add_argument("--cpu", action="store_true", help="run on CPU")
 
     args = parser.parse_args()
@@ -168,7 +168,13 @@ class SequenceGenerator(SequenceGeneratorBase):
         encoder_outs_aug: Optional[
             Tensor
         ] = None,  # an additional/augmented encoder_outs
+        return_decoder_out: bool = False,
     ):
+        """
+        If ``return_decoder_out`` is set, each finalized hypothesis also keeps
+        the final-layer decoder states of its input positions under
+        ``"decoder_out"`` (tgt_len x C), i.e. the states of ``[eos] + tokens[:-1]``.
+        """
         incremental_states = torch.jit.annotate(
             List[Dict[str, Dict[str, Optional[Tensor]]]],
             [
@@ -219,6 +225,7 @@ class SequenceGenerator(SequenceGeneratorBase):
         )  # +2 for eos and pad
         tokens[:, 0] = self.eos if bos_token is None else bos_token
         attn: Optional[Tensor] = None
+        decoder_out: Optional[Tensor] = None
 
         # A list that indicates candidates that should be ignored.
         # For example, suppose we're sampling and have already finalized 2/5
@@ -284,14 +291,16 @@ class SequenceGenerator(SequenceGeneratorBase):
             with torch.autograd.profiler.record_function(
                 "EnsembleModel: forward_decoder"
             ):
-                lprobs, avg_attn_scores = self.model.forward_decoder(
+                decoder_outputs = self.model.forward_decoder(
                     tokens[:, : step + 1],
                     encoder_outs,
                     incremental_states,
                     self.temperature,
                     decoder_name=decoder_name,
                     encoder_outs_aug=encoder_outs_aug,
+                    return_features=return_decoder_out,
                 )
+                lprobs, avg_attn_scores = decoder_outputs[:2]
 
             if self.lm_model is not None and not aux_task_name:
                 lm_out = self.lm_model(tokens[:, : step + 1])
@@ -336,6 +345,19 @@ class SequenceGenerator(SequenceGeneratorBase):
                     ).to(scores)
                 attn[:, :, step + 1].copy_(avg_attn_scores)
 
+            # Record the decoder states, aligned with attn
+            if return_decoder_out:
+                decoder_features = decoder_outputs[2]
+                if decoder_out is None:
+                    decoder_out = torch.zeros(
+                        bsz * beam_size,
+                        max_len + 2,
+                        decoder_features.size(-1),
+                        device=scores.device,
+                        dtype=decoder_features.dtype,
+                    )
+                decoder_out[:, step + 1].copy_(decoder_features)
+
             scores = scores.type_as(lprobs)
             eos_bbsz_idx = torch.empty(0).to(
                 tokens
@@ -394,6 +416,7 @@ class SequenceGenerator(SequenceGeneratorBase):
                     attn,
                     src_lengths,
                     max_len,
+                    decoder_out,
                 )
                 num_remaining_sent -= len(finalized_sents)
 
@@ -440,6 +463,10 @@ class SequenceGenerator(SequenceGeneratorBase):
                     attn = attn.view(bsz, -1)[batch_idxs].view(
                         new_bsz * beam_size, attn.size(1), -1
                     )
+                if decoder_out is not None:
+                    decoder_out = decoder_out.view(bsz, -1)[batch_idxs].view(
+                        new_bsz * beam_size, -1, decoder_out.size(-1)
+                    )
                 bsz = new_bsz
             else:
                 batch_idxs = None
@@ -506,6 +533,10 @@ class SequenceGenerator(SequenceGeneratorBase):
                 attn[:, :, : step + 2] = torch.index_select(
                     attn[:, :, : step + 2], dim=0, index=active_bbsz_idx
                 )
+            if decoder_out is not None:
+                decoder_out[:, : step + 2] = torch.index_select(
+                    decoder_out[:, : step + 2], dim=0, index=active_bbsz_idx
+                )
 
             # reorder incremental state in decoder
             reorder_state = active_bbsz_idx
@@ -522,6 +553,51 @@ class SequenceGenerator(SequenceGeneratorBase):
             )
         return finalized
 
+    def finalize_hypos(
+        self,
+        step: int,
+        bbsz_idx,
+        eos_scores,
+        tokens,
+        scores,
+        finalized: List[List[Dict[str, Tensor]]],
+        finished: List[bool],
+        beam_size: int,
+        attn: Optional[Tensor],
+        src_lengths,
+        max_len: int,
+        decoder_out: Optional[Tensor] = None,
+    ):
+        """Finalize hypothesis as the base class does,
+        and attach the decoder states of the newly finalized ones."""
+        num_finalized = [len(hypos) for hypos in finalized]
+        unfinished_sents = [sent for sent, f in enumerate(finished) if not f]
+        newly_finished = super().finalize_hypos(
+            step,
+            bbsz_idx,
+            eos_scores,
+            tokens,
+            scores,
+            finalized,
+            finished,
+            beam_size,
+            attn,
+            src_lengths,
+            max_len,
+        )
+        if decoder_out is not None:
+            # the base class appends the hypos in the order of bbsz_idx,
+            # until beam_size hypos are collected for a sentence
+            decoder_out_clone = decoder_out.index_select(0, bbsz_idx)[:, 1 : step + 2]
+            for i, idx in enumerate(bbsz_idx.tolist()):
+                sent = unfinished_sents[idx // beam_size]
+                if num_finalized[sent] < len(finalized[sent]):
+                    finalized[sent][num_finalized[sent]]["decoder_out"] = (
+                        decoder_out_clone[i]
+                    )
+                    num_finalized[sent] += 1
+        return newly_finished
+
 
 class EnsembleModel(EnsembleModelBase):
     """A wrapper around an ensemble of models."""
@@ -538,9 +614,12 @@ class EnsembleModel(EnsembleModelBase):
         temperature: float = 1.0,
         decoder_name="decoder",
         encoder_outs_aug: List[Dict[str, List[Tensor]]] = None,
+        return_features: bool = False,
     ):
         log_probs = []
         avg_attn: Optional[Tensor] = None
+        # the decoder states of the first model, if return_features
+        features: Optional[Tensor] = None
         encoder_out: Optional[Dict[str, List[Tensor]]] = None
         encoder_out_aug: Optional[Dict[str, List[Tensor]]] = None
         for i, model in enumerate(self.models):
@@ -556,21 +635,33 @@ class EnsembleModel(EnsembleModelBase):
                         encoder_out=encoder_out,
                         encoder_out_aug=encoder_out_aug,
                         incremental_state=incremental_states[i],
+                        features_only=return_features,
                     )
                 else:
                     decoder_out = getattr(model, decoder_name).forward(
                         tokens,
                         encoder_out=encoder_out,
                         incremental_state=incremental_states[i],
+                        features_only=return_features,
                     )
             else:
                 if hasattr(model, decoder_name):
                     decoder_out = getattr(model, decoder_name).forward(
-                        tokens, encoder_out=encoder_out
+                        tokens,
+                        encoder_out=encoder_out,
+                        features_only=return_features,
                     )
                 else:
                     decoder_out = model.forward(tokens)
 
+            if return_features:
+                # the logits are projected from the final-layer states
+                if features is None:
+                    features = decoder_out[0][:, -1, :]
+                decoder_out = (
+                    getattr(model, decoder_name).output_layer(decoder_out[0]),
+                ) + tuple(decoder_out[1:])
+
             attn: Optional[Tensor] = None
             decoder_len = len(decoder_out)
             if decoder_len > 1 and decoder_out[1] is not None:
@@ -594,6 +685,8 @@ class EnsembleModel(EnsembleModelBase):
             )
             probs = probs[:, -1, :]
             if self.models_size == 1:
+                if return_features:
+                    return probs, attn, features
                 return probs, attn
 
             log_probs.append(probs)
@@ -609,6 +702,8 @@ class EnsembleModel(EnsembleModelBase):
 
         if avg_attn is not None:
             avg_attn.div_(self.models_size)
+        if return_features:
+            return avg_probs, avg_attn, features
         return avg_probs, avg_attn
 
     @torch.jit.export
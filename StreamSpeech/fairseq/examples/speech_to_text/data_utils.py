@@ -7,7 +7,7 @@ import csv
 from pathlib import Path
 import zipfile
 from functools import reduce
-from multiprocessing import cpu_count
+from multiprocessing import Pool, cpu_count
 from typing import Any, Dict, List, Optional, Union
 import io
 
@@ -133,6 +133,55 @@ def get_zip_manifest(
     return paths, lengths
 
 
+def create_packed_features(
+    zip_path: Path,
+    store_path: Path,
+    dtype: str = "float16",
+):
+    """Pack the .npy features of a stored zip file into one contiguous
+    (total_frames, feature_dim) .npy array, to be memory mapped by the data
+    loaders. An index "<id>\t<frame offset>\t<number of frames>" is written
+    next to it, as ``store_path`` with an ``.index.tsv`` suffix.
+
+    Returns the paths ("<store path>:<frame offset>:<number of frames>") and
+    the number of frames of the utterances, as ``get_zip_manifest``.
+    """
+    with zipfile.ZipFile(zip_path, mode="r") as f:
+        infos = [i for i in f.infolist() if i.filename.endswith(".npy")]
+        shapes = []
+        for i in tqdm(infos):
+            with f.open(i) as member:
+                version = np.lib.format.read_magic(member)
+                read_header = (
+                    np.lib.format.read_array_header_1_0
+                    if version == (1, 0)
+                    else np.lib.format.read_array_header_2_0
+                )
+                shapes.append(read_header(member)[0])
+        feature_dims = {shape[1] for shape in shapes}
+        assert len(feature_dims) == 1, f"Inconsistent feature dims: {feature_dims}"
+        offsets = np.cumsum([0] + [shape[0] for shape in shapes])
+        store = np.lib.format.open_memmap(
+            store_path.as_posix(),
+            mode="w+",
+            dtype=dtype,
+            shape=(int(offsets[-1]), feature_dims.pop()),
+        )
+        for i, start, end in zip(tqdm(infos), offsets[:-1], offsets[1:]):
+            store[start:end] = np.load(io.BytesIO(f.read(i)))
+        store.flush()
+        del store
+
+    paths, lengths = {}, {}
+    with open(store_path.with_suffix(".index.tsv"), "w") as index:
+        for i, start, end in zip(infos, offsets[:-1], offsets[1:]):
+            utt_id = Path(i.filename).stem
+            paths[utt_id] = f"{store_path.as_posix()}:{start}:{end - start}"
+            lengths[utt_id] = int(end - start)
+            index.write(f"{utt_id}\t{start}\t{end - start}\n")
+    return paths, lengths
+
+
 def gen_config_yaml(
     manifest_root: Path,
     spm_filename: Optional[str] = None,
@@ -274,6 +323,92 @@ def cal_gcmvn_stats(features_list):
     return {"mean": mean.astype("float32"), "std": std.astype("float32")}
 
 
+class GCMVNStats(object):
+    """Streaming global mean and variance of features, accumulated in float64.
+
+    Batches of frames are merged with the parallel variant of Welford's
+    algorithm (Chan et al.), so that the statistics of a whole corpus are
+    computed in constant memory, and the statistics of shards can be merged.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = None
+        self.m2 = None
+
+    def update(self, features: np.ndarray):
+        """Add the frames of a (num_frames, feature_dim) array"""
+        if features.shape[0] == 0:
+            return
+        features = features.astype(np.float64)
+        mean = features.mean(axis=0)
+        m2 = np.square(features - mean).sum(axis=0)
+        self._merge(features.shape[0], mean, m2)
+
+    def merge(self, other: "GCMVNStats"):
+        if other.count > 0:
+            self._merge(other.count, other.mean, other.m2)
+
+    def _merge(self, count, mean, m2):
+        if self.count == 0:
+            self.count, self.mean, self.m2 = count, mean, m2
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (count / total)
+        self.m2 = self.m2 + m2 + np.square(delta) * (self.count * count / total)
+        self.count = total
+
+    def get_stats(self) -> Dict[str, np.ndarray]:
+        var = self.m2 / self.count
+        std = np.sqrt(np.maximum(var, 1e-8))
+        return {"mean": self.mean.astype("float32"), "std": std.astype("float32")}
+
+
+def _cal_gcmvn_stats_of_zip_shard(zip_path: Path, start: int, end: int) -> GCMVNStats:
+    stats = GCMVNStats()
+    with zipfile.ZipFile(zip_path, mode="r") as f:
+        for i in f.infolist():
+            if not (start <= i.header_offset < end and i.filename.endswith(".npy")):
+                continue
+            with f.open(i) as member:
+                features = np.load(io.BytesIO(member.read()))
+            if features.ndim == 2:
+                stats.update(features)
+    return stats
+
+
+def cal_gcmvn_stats_from_zip(zip_path: Path, num_workers: int = 1) -> GCMVNStats:
+    """Accumulate the GCMVN statistics of all the .npy features in a zip file.
+
+    The zip is split into ``num_workers`` byte ranges of about the same
+    size, which are read in parallel, and the statistics of the shards are
+    merged in order.
+    """
+    with zipfile.ZipFile(zip_path, mode="r") as f:
+        infos = sorted(f.infolist(), key=lambda i: i.header_offset)
+    if len(infos) == 0:
+        return GCMVNStats()
+    num_workers = max(1, min(num_workers, len(infos)))
+    total_size = sum(i.compress_size for i in infos)
+    bounds, size = [infos[0].header_offset], 0
+    for i in infos:
+        if size >= total_size * len(bounds) / num_workers:
+            bounds.append(i.header_offset)
+        size += i.compress_size
+    bounds.append(infos[-1].header_offset + 1)
+    shards = [(zip_path, start, end) for start, end in zip(bounds, bounds[1:])]
+    if num_workers == 1:
+        shard_stats = [_cal_gcmvn_stats_of_zip_shard(*shard) for shard in shards]
+    else:
+        with Pool(num_workers) as pool:
+            shard_stats = pool.starmap(_cal_gcmvn_stats_of_zip_shard, shards)
+    stats = GCMVNStats()
+    for shard in shard_stats:
+        stats.merge(shard)
+    return stats
+
+
 class S2TDataConfigWriter(object):
     DEFAULT_VOCAB_FILENAME = "dict.txt"
     DEFAULT_INPUT_FEAT_PER_CHANNEL = 80
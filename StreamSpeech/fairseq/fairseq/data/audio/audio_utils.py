@@ -5,6 +5,9 @@
 
 
 import mmap
+import os
+import threading
+from collections import OrderedDict
 from pathlib import Path
 import io
 from typing import BinaryIO, List, Optional, Tuple, Union
@@ -137,6 +140,33 @@ def get_features_from_npy_or_audio(path, waveform_transforms=None):
     )
 
 
+_PACKED_FEATURE_STORES = {}
+
+
+def is_packed_features_path(path: str) -> bool:
+    return path.endswith(".npy")
+
+
+def get_packed_feature_store(path: str) -> np.ndarray:
+    """Memory map a packed feature store once per process. The store is a
+    (total_frames, feature_dim) .npy array of the features of all the
+    utterances, concatenated along time, see
+    ``examples.speech_to_text.data_utils.create_packed_features``."""
+    store = _PACKED_FEATURE_STORES.get(path, None)
+    if store is None:
+        store = np.load(path, mmap_mode="r")
+        _PACKED_FEATURE_STORES[path] = store
+    return store
+
+
+def get_features_from_packed_store(
+    path: str, frame_offset: int, n_frames: int
+) -> np.ndarray:
+    """Read-only view of the features of one utterance in a packed store,
+    without any copy. The dtype is the one of the store (float16 or float32)."""
+    return get_packed_feature_store(path)[frame_offset : frame_offset + n_frames]
+
+
 def get_features_or_waveform_from_stored_zip(
     path,
     byte_offset,
@@ -174,8 +204,9 @@ def get_features_or_waveform(
     offset and length.
 
     Args:
-        path (str): File path in the format of "<.npy/.wav/.flac path>" or
-        "<zip path>:<byte offset>:<byte length>".
+        path (str): File path in the format of "<.npy/.wav/.flac path>",
+        "<zip path>:<byte offset>:<byte length>" or
+        "<packed .npy path>:<frame offset>:<number of frames>".
         need_waveform (bool): return waveform instead of features.
         use_sample_rate (int): change sample rate for the input wave file
 
@@ -194,6 +225,11 @@ def get_features_or_waveform(
         return get_features_from_npy_or_audio(
             _path, waveform_transforms=waveform_transforms
         )
+    elif len(slice_ptr) == 2 and is_packed_features_path(_path):
+        assert not need_waveform, f"{_path} only stores features"
+        features_or_waveform = get_features_from_packed_store(
+            _path, slice_ptr[0], slice_ptr[1]
+        )
     elif len(slice_ptr) == 2:
         features_or_waveform = get_features_or_waveform_from_stored_zip(
             _path,
@@ -283,11 +319,99 @@ def is_sf_audio_data(data: bytes) -> bool:
     return is_wav or is_flac or is_ogg
 
 
+class MmapPool(object):
+    """LRU pool of read-only mmaps of whole files, so that reading many
+    slices of a stored zip does not open and map it every time.
+
+    A pool belongs to one process, see :func:`get_mmap_pool`. The entries
+    are keyed on the path, modification time and size of the files, so a
+    rewritten file is mapped again.
+
+    Args:
+        max_size (int): maximum number of files kept open
+        madvise (Optional[int]): advice given to the kernel for the mapped
+            files, e.g. ``mmap.MADV_SEQUENTIAL`` to read ahead more
+            aggressively, or ``mmap.MADV_RANDOM`` to disable read-ahead
+    """
+
+    def __init__(self, max_size: int = 16, madvise: Optional[int] = None):
+        self.max_size = max_size
+        self.madvise = madvise
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.mmaps = OrderedDict()
+
+    def _open(self, path: str) -> mmap.mmap:
+        with open(path, "rb") as f:
+            mmap_o = mmap.mmap(f.fileno(), length=0, access=mmap.ACCESS_READ)
+        if self.madvise is not None and hasattr(mmap_o, "madvise"):
+            mmap_o.madvise(self.madvise)
+        return mmap_o
+
+    def _get(self, path: str) -> mmap.mmap:
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            mmap_o = self.mmaps.get(key, None)
+            if mmap_o is not None:
+                self.mmaps.move_to_end(key)
+                return mmap_o
+        # files are mapped outside of the lock, if two threads map the same
+        # file the first mmap inserted is kept
+        mmap_o = self._open(path)
+        with self.lock:
+            mmap_o = self.mmaps.setdefault(key, mmap_o)
+            self.mmaps.move_to_end(key)
+            while len(self.mmaps) > self.max_size:
+                # the evicted mmaps are closed once no thread reads them
+                self.mmaps.popitem(last=False)
+        return mmap_o
+
+    def read(self, path: str, offset: int, length: int) -> bytes:
+        return self._get(path)[offset : offset + length]
+
+    def close(self):
+        with self.lock:
+            self.mmaps.clear()
+
+
+_MMAP_POOL = None
+
+
+def configure_mmap_pool(max_size: int = 16, madvise: Optional[Union[int, str]] = None):
+    """Set the options of the mmap pools, before the data is read.
+    The pools of the processes forked afterwards (e.g. data loader
+    workers) use the same options.
+
+    Args:
+        max_size (int): maximum number of files kept open
+        madvise (Optional[Union[int, str]]): advice given to the kernel for
+            the mapped files, or its name in :mod:`mmap` (e.g. "MADV_RANDOM")
+    """
+    global _MMAP_POOL
+    if isinstance(madvise, str):
+        madvise = getattr(mmap, madvise, None)
+    if _MMAP_POOL is not None:
+        _MMAP_POOL.close()
+    _MMAP_POOL = MmapPool(max_size=max_size, madvise=madvise)
+
+
+def get_mmap_pool() -> MmapPool:
+    """The mmap pool of the current process. The mmaps inherited from a
+    parent process are not shared: a new pool with the same options is
+    created after a fork."""
+    global _MMAP_POOL
+    if _MMAP_POOL is None:
+        _MMAP_POOL = MmapPool()
+    elif _MMAP_POOL.pid != os.getpid():
+        _MMAP_POOL = MmapPool(
+            max_size=_MMAP_POOL.max_size, madvise=_MMAP_POOL.madvise
+        )
+    return _MMAP_POOL
+
+
 def mmap_read(path: str, offset: int, length: int) -> bytes:
-    with open(path, "rb") as f:
-        with mmap.mmap(f.fileno(), length=0, access=mmap.ACCESS_READ) as mmap_o:
-            data = mmap_o[offset : offset + length]
-    return data
+    return get_mmap_pool().read(path, offset, length)
 
 
 def read_from_stored_zip(zip_path: str, offset: int, length: int) -> bytes:
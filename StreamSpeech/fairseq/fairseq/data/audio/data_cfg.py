@@ -189,6 +189,12 @@ class S2TDataConfig(object):
     def hub(self) -> Dict[str, str]:
         return self.config.get("hub", {})
 
+    @property
+    def mmap_pool(self) -> Dict:
+        """Options of the pool of mmaps the stored zips are read with, e.g.
+        {max_size: 32, madvise: MADV_RANDOM}, see configure_mmap_pool."""
+        return self.config.get("mmap_pool", {})
+
 
 class S2SDataConfig(S2TDataConfig):
     """Wrapper class for data config YAML"""
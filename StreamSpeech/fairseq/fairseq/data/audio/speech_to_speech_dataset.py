@@ -8,6 +8,7 @@ from dataclasses import dataclass
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
+import numpy as np
 import torch
 
 from fairseq.data import ConcatDataset, Dictionary
@@ -33,6 +34,87 @@ class SpeechToSpeechDatasetItem(object):
     tgt_lang_tag: Optional[int] = None
 
 
+class UnitStore(object):
+    """Discrete units of the targets of a split, binarized once: the units of
+    all the samples are concatenated into one int16 array, memory mapped from
+    ``<root>/<split>.units.npy``, with the offsets of the samples, their ids
+    and their tgt_n_frames in the manifest in ``<root>/<split>.units_index.npz``."""
+
+    def __init__(self, root: str, split: str):
+        units_path, index_path = self.get_paths(root, split)
+        self.units = np.load(units_path, mmap_mode="r")
+        index = np.load(index_path)
+        self.offsets = index["offsets"]
+        # None for the stores saved without them, which are never used
+        self.tgt_n_frames = index["tgt_n_frames"] if "tgt_n_frames" in index else None
+        self.rows = {
+            sample_id: i for i, sample_id in enumerate(index["ids"].tolist())
+        }
+
+    @classmethod
+    def get_paths(cls, root: str, split: str) -> Tuple[str, str]:
+        return (
+            (Path(root) / f"{split}.units.npy").as_posix(),
+            (Path(root) / f"{split}.units_index.npz").as_posix(),
+        )
+
+    @classmethod
+    def exists(cls, root: str, split: str) -> bool:
+        return all(Path(p).is_file() for p in cls.get_paths(root, split))
+
+    @classmethod
+    def save(
+        cls,
+        root: str,
+        split: str,
+        ids: List[str],
+        units: List[List[int]],
+        tgt_n_frames: List[int],
+    ):
+        units_path, index_path = cls.get_paths(root, split)
+        offsets = np.cumsum([0] + [len(u) for u in units], dtype=np.int64)
+        store = np.lib.format.open_memmap(
+            units_path, mode="w+", dtype=np.int16, shape=(int(offsets[-1]),)
+        )
+        for u, start, end in zip(units, offsets[:-1], offsets[1:]):
+            store[start:end] = u
+        store.flush()
+        del store
+        np.savez(
+            index_path,
+            offsets=offsets,
+            ids=np.array(ids, dtype=str),
+            tgt_n_frames=np.array(tgt_n_frames, dtype=np.int64),
+        )
+
+    def mismatch(self, ids: List[str], tgt_n_frames: List[int]) -> Optional[str]:
+        """Why the store does not hold the targets of a manifest (e.g. after
+        the units were extracted again with another --reduce-unit), None if
+        it does"""
+        if self.tgt_n_frames is None:
+            return "it has no tgt_n_frames, it should be saved again"
+        missing = [i for i in ids if i not in self.rows]
+        if len(missing) > 0:
+            return f"{len(missing)} samples are missing, e.g. {missing[0]}"
+        rows = np.array([self.rows[i] for i in ids], dtype=np.int64)
+        changed = np.nonzero(
+            self.tgt_n_frames[rows] != np.array(tgt_n_frames, dtype=np.int64)
+        )[0]
+        if len(changed) > 0:
+            return (
+                f"the tgt_n_frames of {len(changed)} samples differ from the "
+                f"manifest, e.g. {ids[changed[0]]}"
+            )
+        return None
+
+    def __contains__(self, sample_id: str) -> bool:
+        return sample_id in self.rows
+
+    def __getitem__(self, sample_id: str) -> np.ndarray:
+        row = self.rows[sample_id]
+        return self.units[self.offsets[row] : self.offsets[row + 1]]
+
+
 class SpeechToSpeechDataset(SpeechToTextDataset):
     def __init__(
         self,
@@ -49,7 +131,19 @@ class SpeechToSpeechDataset(SpeechToTextDataset):
         target_is_code: bool = False,
         tgt_dict: Dictionary = None,
         n_frames_per_step: int = 1,
+        tgt_units: Optional[UnitStore] = None,
     ):
+        if target_is_code and tgt_units is not None:
+            mismatch = tgt_units.mismatch(ids, tgt_n_frames)
+            if mismatch is not None:
+                logger.warning(
+                    f"ignoring the binarized units of '{split}': {mismatch}"
+                )
+                tgt_units = None
+            else:
+                # the targets are read from the store, the unit strings of the
+                # manifest are not kept
+                tgt_audio_paths = ["" for _ in tgt_audio_paths]
         tgt_texts = tgt_audio_paths if target_is_code else None
         super().__init__(
             split=split,
@@ -71,6 +165,18 @@ class SpeechToSpeechDataset(SpeechToTextDataset):
         assert not target_is_code or tgt_dict is not None
         self.target_is_code = target_is_code
 
+        self.tgt_units, self.unit_to_index = None, None
+        if target_is_code and tgt_units is not None:
+            self.tgt_units = tgt_units
+            # unit -> dictionary index, the units that are not in the
+            # dictionary are mapped to <unk> as by encode_line
+            self.unit_to_index = np.full(
+                np.iinfo(np.int16).max + 1, tgt_dict.unk(), dtype=np.int64
+            )
+            for unit in range(len(self.unit_to_index)):
+                if str(unit) in tgt_dict.indices:
+                    self.unit_to_index[unit] = tgt_dict.indices[str(unit)]
+
         assert len(tgt_audio_paths) == self.n_samples
         assert len(tgt_n_frames) == self.n_samples
 
@@ -121,11 +227,7 @@ class SpeechToSpeechDataset(SpeechToTextDataset):
             target = torch.from_numpy(target).float()
             target = self.pack_frames(target)
         else:
-            target = self.tgt_dict.encode_line(
-                self.tgt_audio_paths[index],
-                add_if_not_exist=False,
-                append_eos=True,
-            ).long()
+            target = self._get_code_target(index)
             if self.n_frames_per_step > 1:
                 n_tgt_frame = target.size(0) - 1  # exclude <eos>
                 keep_n_tgt_frame = n_tgt_frame - n_tgt_frame % self.n_frames_per_step
@@ -151,6 +253,19 @@ class SpeechToSpeechDataset(SpeechToTextDataset):
             tgt_lang_tag=tgt_lang_tag,
         )
 
+    def _get_code_target(self, index: int) -> torch.Tensor:
+        if self.tgt_units is None:
+            return self.tgt_dict.encode_line(
+                self.tgt_audio_paths[index],
+                add_if_not_exist=False,
+                append_eos=True,
+            ).long()
+        units = self.tgt_units[self.ids[index]]
+        target = np.empty(len(units) + 1, dtype=np.int64)
+        target[:-1] = self.unit_to_index[units]
+        target[-1] = self.tgt_dict.eos()
+        return torch.from_numpy(target)
+
     def _collate_target(self, samples: List[SpeechToSpeechDatasetItem]) -> torch.Tensor:
         if self.target_is_code:
             target = fairseq_data_utils.collate_tokens(
@@ -302,6 +417,7 @@ class SpeechToSpeechDatasetCreator(object):
         tgt_dict: Dictionary = None,
         n_frames_per_step: int = 1,
         multitask: Optional[Dict] = None,
+        tgt_units: Optional[UnitStore] = None,
     ) -> SpeechToSpeechDataset:
         audio_root = Path(data_cfg.audio_root)
         ids = [s[cls.KEY_ID] for s in samples]
@@ -338,6 +454,7 @@ class SpeechToSpeechDatasetCreator(object):
             target_is_code=target_is_code,
             tgt_dict=tgt_dict,
             n_frames_per_step=n_frames_per_step,
+            tgt_units=tgt_units,
         )
 
         if has_multitask:
@@ -365,6 +482,11 @@ class SpeechToSpeechDatasetCreator(object):
         datasets = []
         for split in splits.split(","):
             samples = SpeechToTextDatasetCreator._load_samples_from_tsv(root, split)
+            tgt_units = (
+                UnitStore(root, split)
+                if target_is_code and UnitStore.exists(root, split)
+                else None
+            )
             ds = cls._from_list(
                 split_name=split,
                 is_train_split=is_train_split,
@@ -374,6 +496,7 @@ class SpeechToSpeechDatasetCreator(object):
                 tgt_dict=tgt_dict,
                 n_frames_per_step=n_frames_per_step,
                 multitask=multitask,
+                tgt_units=tgt_units,
             )
             datasets.append(ds)
         return ConcatDataset(datasets) if len(datasets) > 1 else datasets[0]
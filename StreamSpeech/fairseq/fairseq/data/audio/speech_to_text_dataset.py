@@ -4,7 +4,10 @@
 # LICENSE file in the root directory of this source tree.
 
 import csv
+import hashlib
+import json
 import logging
+import os
 import re
 
 # Increase CSV field size limit to handle large target audio token sequences
@@ -21,7 +24,7 @@ import torch.nn.functional as F
 
 from fairseq.data import ConcatDataset, Dictionary, FairseqDataset, ResamplingDataset
 from fairseq.data import data_utils as fairseq_data_utils
-from fairseq.data import encoders
+from fairseq.data import encoders, indexed_dataset
 from fairseq.data.audio.audio_utils import get_features_or_waveform
 from fairseq.data.audio.data_cfg import S2TDataConfig
 from fairseq.data.audio.dataset_transforms import CompositeAudioDatasetTransform
@@ -35,6 +38,15 @@ from fairseq.data.audio.waveform_transforms import CompositeAudioWaveformTransfo
 logger = logging.getLogger(__name__)
 
 
+def _file_checksum(path: Union[str, Path]) -> str:
+    """SHA-1 of the content of a file"""
+    checksum = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+
 def _collate_frames(
     frames: List[torch.Tensor], is_audio_input: bool = False
 ) -> torch.Tensor:
@@ -395,12 +407,16 @@ class TextTargetMultitaskData(object):
     # mandatory columns
     KEY_ID, KEY_TEXT = "id", "tgt_text"
     LANG_TAG_TEMPLATE = "<lang:{}>"
+    BINARIZED_SUFFIX = "binarized"
 
     def __init__(self, args, split, tgt_dict):
         samples = SpeechToTextDatasetCreator._load_samples_from_tsv(args.data, split)
         self.data = {s[self.KEY_ID]: s[self.KEY_TEXT] for s in samples}
         self.dict = tgt_dict
         self.append_eos = args.decoder_type != "ctc"
+        self.tokenizer_config = {
+            k: args.config.get(k) for k in ("pre_tokenizer", "bpe_tokenizer")
+        }
         self.pre_tokenizer = self.build_tokenizer(args)
         self.bpe_tokenizer = self.build_bpe(args)
         self.prepend_bos_and_append_tgt_lang_tag = (
@@ -408,6 +424,7 @@ class TextTargetMultitaskData(object):
         )
         self.eos_token = args.eos_token
         self.lang_tag_mapping = args.get_lang_tag_mapping
+        self.binarized, self.rows = self.load_binarized(args.data, split)
 
     @classmethod
     def is_lang_tag(cls, token):
@@ -446,14 +463,105 @@ class TextTargetMultitaskData(object):
         else:
             return None
 
+    @classmethod
+    def get_binarized_path(cls, root: str, split: str, tgt_dict: Dictionary) -> str:
+        """The binarized targets are named after a checksum of the dictionary,
+        so the tasks sharing a data directory with different dictionaries do
+        not overwrite each other's targets."""
+        dict_checksum = cls.get_dict_checksum(tgt_dict)[:8]
+        path = Path(root) / f"{split}.{dict_checksum}.{cls.BINARIZED_SUFFIX}"
+        return path.as_posix()
+
+    @classmethod
+    def get_dict_checksum(cls, tgt_dict: Dictionary) -> str:
+        return hashlib.sha1("\n".join(tgt_dict.symbols).encode("utf-8")).hexdigest()
+
+    def get_binarized_checksums(
+        self, root: str, split: str
+    ) -> Dict[str, Optional[str]]:
+        """Checksums of the inputs of the binarized targets"""
+        bpe_tokenizer = self.tokenizer_config["bpe_tokenizer"] or {}
+        spm_path = bpe_tokenizer.get("sentencepiece_model")
+        return {
+            "tsv": _file_checksum(Path(root) / f"{split}.tsv"),
+            "dict": self.get_dict_checksum(self.dict),
+            "tokenizer": hashlib.sha1(
+                json.dumps(self.tokenizer_config, sort_keys=True, default=str).encode(
+                    "utf-8"
+                )
+            ).hexdigest(),
+            "spm": (
+                _file_checksum(spm_path)
+                if spm_path is not None and os.path.isfile(spm_path)
+                else None
+            ),
+        }
+
+    def load_binarized(self, root: str, split: str):
+        """The targets binarized by :meth:`binarize` and their row of each
+        sample id, or None if they do not exist or are stale"""
+        path = self.get_binarized_path(root, split, self.dict)
+        if not indexed_dataset.dataset_exists(path, "mmap"):
+            return None, None
+        try:
+            with open(f"{path}.json") as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            logger.warning(f"ignoring {path}: {path}.json is missing")
+            return None, None
+        checksums = self.get_binarized_checksums(root, split)
+        changed = [k for k, v in checksums.items() if meta.get(k) != v]
+        if len(changed) > 0:
+            logger.warning(
+                f"ignoring {path}: the {', '.join(changed)} changed since it was "
+                "binarized, the targets are tokenized from the TSV instead"
+            )
+            return None, None
+        binarized = indexed_dataset.MMapIndexedDataset(path)
+        if len(binarized) != len(meta["ids"]):
+            logger.warning(
+                f"ignoring {path}: {len(binarized)} targets for "
+                f"{len(meta['ids'])} sample ids, it should be binarized again"
+            )
+            return None, None
+        logger.info(f"loaded binarized targets from {path}")
+        return binarized, {sample_id: i for i, sample_id in enumerate(meta["ids"])}
+
+    def binarize(self, root: str, split: str):
+        """Tokenize all the targets once and save their indices (without
+        EOS) as a mmap indexed dataset, which is then used by :meth:`get`.
+        The sample ids and the checksums of the TSV, the dictionary and the
+        tokenizers are saved next to it, in a .json file."""
+        path = self.get_binarized_path(root, split, self.dict)
+        builder = indexed_dataset.make_builder(
+            indexed_dataset.data_file_path(path), "mmap", vocab_size=len(self.dict)
+        )
+        for sample_id in self.data:
+            builder.add_item(self.encode_text(sample_id, append_eos=False))
+        builder.finalize(indexed_dataset.index_file_path(path))
+        meta = self.get_binarized_checksums(root, split)
+        meta["ids"] = list(self.data)
+        with open(f"{path}.json", "w") as f:
+            json.dump(meta, f)
+        return path
+
+    def encode_text(self, sample_id, append_eos: bool) -> torch.Tensor:
+        tokenized = self.get_tokenized_tgt_text(sample_id)
+        return self.dict.encode_line(
+            tokenized, add_if_not_exist=False, append_eos=append_eos
+        )
+
+    def encode(self, sample_id, append_eos: bool) -> torch.Tensor:
+        if self.binarized is None or sample_id not in self.rows:
+            return self.encode_text(sample_id, append_eos)
+        target = self.binarized[self.rows[sample_id]].int()
+        if append_eos:
+            target = torch.cat((target, target.new([self.dict.eos()])))
+        return target
+
     def get(self, sample_id, tgt_lang=None):
         if sample_id in self.data:
-            tokenized = self.get_tokenized_tgt_text(sample_id)
-            target = self.dict.encode_line(
-                tokenized,
-                add_if_not_exist=False,
-                append_eos=self.append_eos,
-            )
+            target = self.encode(sample_id, self.append_eos)
             if self.prepend_bos_and_append_tgt_lang_tag:
                 bos = torch.LongTensor([self.dict.bos()])
                 lang_tag_idx = self.get_lang_tag_idx(tgt_lang, self.dict)
@@ -1,4 +1,5 @@
 from argparse import Namespace
+import math
 import torch
 import torch.nn as nn
 
@@ -29,6 +30,8 @@ class CodeGenerator(Generator):
         self.f0_quant_embed = (
             None if n_f0_bin <= 0 else nn.Embedding(n_f0_bin, cfg["embedding_dim"])
         )
+        # number of waveform samples per frame
+        self.upsample_factor = math.prod(cfg["upsample_rates"])
 
     @staticmethod
     def _upsample(signal, max_frames):
@@ -53,18 +56,58 @@ class CodeGenerator(Generator):
         signal = signal.view(bsz, channels, max_frames)
         return signal
 
+    def predict_durations(self, x):
+        log_dur_pred = self.dur_predictor(x.transpose(1, 2))
+        return torch.clamp(torch.round((torch.exp(log_dur_pred) - 1)).long(), min=1)
+
     def forward(self, **kwargs):
         x = self.dict(kwargs["code"]).transpose(1, 2)
 
         if self.dur_predictor and kwargs.get("dur_prediction", False):
             assert x.size(0) == 1, "only support single sample"
-            log_dur_pred = self.dur_predictor(x.transpose(1, 2))
-            dur_out = torch.clamp(
-                torch.round((torch.exp(log_dur_pred) - 1)).long(), min=1
-            )
+            dur_out = self.predict_durations(x)
             # B x C x T
             x = torch.repeat_interleave(x, dur_out.view(-1), dim=2)
 
+        return self.generate(x, **kwargs)
+
+    def forward_batch(self, code, code_lengths, dur_prediction=False, **kwargs):
+        """Synthesize a batch of code sequences of different lengths.
+
+        The durations are predicted for each sequence without its padding,
+        then the expanded sequences are padded with zeros for the generator.
+        Args:
+            code: Codes of shape B x T, padded after code_lengths
+            code_lengths: Lengths of the code sequences
+            dur_prediction: Expand the codes by their predicted durations
+        Returns:
+            The waveforms of shape B x 1 x T', padded, and their lengths
+        """
+        x = self.dict(code).transpose(1, 2)
+
+        if self.dur_predictor and dur_prediction:
+            expanded = [
+                torch.repeat_interleave(
+                    x[i : i + 1, :, :length],
+                    self.predict_durations(x[i : i + 1, :, :length]).view(-1),
+                    dim=2,
+                )
+                for i, length in enumerate(code_lengths.tolist())
+            ]
+            frame_lengths = code_lengths.new_tensor([e.size(2) for e in expanded])
+            x = x.new_zeros(x.size(0), x.size(1), int(frame_lengths.max()))
+            for i, e in enumerate(expanded):
+                x[i, :, : e.size(2)] = e[0]
+        else:
+            frame_lengths = code_lengths
+
+        mask = torch.arange(x.size(2), device=x.device) < frame_lengths.unsqueeze(1)
+        wav = self.generate(x, mask=mask.unsqueeze(1).to(x), **kwargs)
+        return wav, frame_lengths * self.upsample_factor
+
+    def generate(self, x, mask=None, **kwargs):
+        """Synthesize the waveforms of the code embeddings x (B x C x T),
+        with the conditions in kwargs and the optional padding mask (B x 1 x T)."""
         if self.f0:
             if self.f0_quant_embed:
                 kwargs["f0"] = self.f0_quant_embed(kwargs["f0"].long()).transpose(1, 2)
@@ -92,4 +135,4 @@ class CodeGenerator(Generator):
             feat = self._upsample(feat, x.shape[-1])
             x = torch.cat([x, feat], dim=1)
 
-        return super().forward(x)
+        return super().forward(x, mask)
@@ -92,12 +92,18 @@ class ResBlock(torch.nn.Module):
         )
         self.convs2.apply(init_weights)
 
-    def forward(self, x):
+    def forward(self, x, mask=None):
+        # the padding of a batch is zeroed before each convolution, as the
+        # zero padding of the convolutions would do for a single sequence
         for c1, c2 in zip(self.convs1, self.convs2):
             xt = F.leaky_relu(x, LRELU_SLOPE)
             xt = c1(xt)
+            if mask is not None:
+                xt = xt * mask
             xt = F.leaky_relu(xt, LRELU_SLOPE)
             xt = c2(xt)
+            if mask is not None:
+                xt = xt * mask
             x = xt + x
         return x
 
@@ -113,6 +119,7 @@ class Generator(torch.nn.Module):
         super(Generator, self).__init__()
         self.num_kernels = len(cfg["resblock_kernel_sizes"])
         self.num_upsamples = len(cfg["upsample_rates"])
+        self.upsample_rates = cfg["upsample_rates"]
         self.conv_pre = weight_norm(
             Conv1d(
                 cfg.get("model_in_dim", 80),
@@ -151,17 +158,31 @@ class Generator(torch.nn.Module):
         self.ups.apply(init_weights)
         self.conv_post.apply(init_weights)
 
-    def forward(self, x):
+    def forward(self, x, mask=None):
+        """
+        Args:
+            x: Input features of shape B x C x T
+            mask: Optional mask of shape B x 1 x T, 0 for the padding of a batch
+                of sequences of different lengths, which then does not change
+                the outputs of the other positions
+        """
+        if mask is not None:
+            x = x * mask
         x = self.conv_pre(x)
+        if mask is not None:
+            x = x * mask
         for i in range(self.num_upsamples):
             x = F.leaky_relu(x, LRELU_SLOPE)
             x = self.ups[i](x)
+            if mask is not None:
+                mask = torch.repeat_interleave(mask, self.upsample_rates[i], dim=2)
+                x = x * mask
             xs = None
             for j in range(self.num_kernels):
                 if xs is None:
-                    xs = self.resblocks[i * self.num_kernels + j](x)
+                    xs = self.resblocks[i * self.num_kernels + j](x, mask)
                 else:
-                    xs += self.resblocks[i * self.num_kernels + j](x)
+                    xs += self.resblocks[i * self.num_kernels + j](x, mask)
             x = xs / self.num_kernels
         x = F.leaky_relu(x)
         x = self.conv_post(x)
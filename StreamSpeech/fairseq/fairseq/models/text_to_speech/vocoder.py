@@ -5,7 +5,7 @@
 
 import json
 import logging
-from typing import Dict
+from typing import Dict, List
 
 import numpy as np
 import torch
@@ -245,6 +245,28 @@ class CodeHiFiGANVocoder(BaseFairseqModel):
 
         return self.model(**x).detach().squeeze()
 
+    def forward_batch(
+        self, x: Dict[str, torch.Tensor], dur_prediction=False
+    ) -> List[torch.Tensor]:
+        """Synthesize a batch of code sequences.
+
+        Args:
+            x: "code" of shape B x T, padded with -1, and the optional
+                "spkr" of shape B x 1
+        Returns:
+            The waveform of each sequence
+        """
+        assert "code" in x and "f0" not in x
+        code_lengths = (x["code"] >= 0).sum(dim=1)
+        code = x["code"].clamp(min=0)
+        kwargs = {k: v for k, v in x.items() if k != "code"}
+
+        wav, wav_lengths = self.model.forward_batch(
+            code, code_lengths, dur_prediction=dur_prediction, **kwargs
+        )
+        wav = wav.detach().squeeze(1)
+        return [wav[i, :length] for i, length in enumerate(wav_lengths.tolist())]
+
     @classmethod
     def from_data_cfg(cls, args, data_cfg):
         vocoder_cfg = data_cfg.vocoder
@@ -15,6 +15,7 @@ import torch.nn as nn
 
 from fairseq import utils
 from fairseq.data import Dictionary
+from fairseq.data.audio.audio_utils import configure_mmap_pool
 from fairseq.data.audio.data_cfg import MultitaskConfig, S2SDataConfig
 from fairseq.data.audio.speech_to_speech_dataset import SpeechToSpeechDatasetCreator
 from fairseq.data.audio.speech_to_text_dataset import (
@@ -213,6 +214,8 @@ class SpeechToSpeechTask(LegacyFairseqTask):
         super().__init__(args)
         self.tgt_dict = tgt_dict
         self.data_cfg = S2SDataConfig(Path(args.data) / args.config_yaml)
+        if self.data_cfg.mmap_pool:
+            configure_mmap_pool(**self.data_cfg.mmap_pool)
 
         self.multitask_tasks = {}
         self.tgt_dict_mt = None
@@ -9,7 +9,10 @@ from pathlib import Path
 from typing import List
 
 from fairseq.data import Dictionary, encoders
-from fairseq.data.audio.audio_utils import get_features_or_waveform
+from fairseq.data.audio.audio_utils import (
+    configure_mmap_pool,
+    get_features_or_waveform,
+)
 from fairseq.data.audio.data_cfg import MultitaskConfig
 from fairseq.data.audio.speech_to_text_dataset import (
     S2TDataConfig,
@@ -58,6 +61,8 @@ class SpeechToTextTask(LegacyFairseqTask):
         super().__init__(args)
         self.tgt_dict = tgt_dict
         self.data_cfg = S2TDataConfig(Path(args.data) / args.config_yaml)
+        if self.data_cfg.mmap_pool:
+            configure_mmap_pool(**self.data_cfg.mmap_pool)
         self.speaker_to_id = self._get_speaker_to_id()
         if (
             self.data_cfg.prepend_tgt_lang_tag
@@ -0,0 +1,59 @@
+import unittest
+
+import torch
+from fairseq.models.text_to_speech.codehifigan import CodeGenerator
+
+
+class TestCodeGeneratorBatch(unittest.TestCase):
+    def setUp(self) -> None:
+        torch.manual_seed(0)
+        cfg = {
+            "resblock": "1",
+            "upsample_rates": [5, 4, 2],
+            "upsample_kernel_sizes": [11, 8, 4],
+            "upsample_initial_channel": 32,
+            "resblock_kernel_sizes": [3, 7],
+            "resblock_dilation_sizes": [[1, 3, 5], [1, 3, 5]],
+            "model_in_dim": 32,
+            "num_embeddings": 50,
+            "embedding_dim": 16,
+            "multispkr": True,
+            "num_speakers": 4,
+            "dur_predictor_params": {
+                "encoder_embed_dim": 16,
+                "var_pred_hidden_dim": 16,
+                "var_pred_kernel_size": 3,
+                "var_pred_dropout": 0.5,
+            },
+        }
+        self.model = CodeGenerator(cfg).eval()
+        self.codes = [torch.randint(0, 50, (n,)) for n in (7, 30, 31)]
+        self.spkr = torch.LongTensor([[0], [1], [3]])
+
+    def test_forward_batch_matches_single(self):
+        code = torch.zeros(len(self.codes), 31, dtype=torch.long)
+        for i, c in enumerate(self.codes):
+            code[i, : len(c)] = c
+        code_lengths = torch.LongTensor([len(c) for c in self.codes])
+
+        for dur_prediction in (False, True):
+            with torch.no_grad():
+                wav, wav_lengths = self.model.forward_batch(
+                    code, code_lengths, dur_prediction=dur_prediction, spkr=self.spkr
+                )
+                for i, c in enumerate(self.codes):
+                    expected = self.model(
+                        code=c.view(1, -1),
+                        spkr=self.spkr[i : i + 1],
+                        dur_prediction=dur_prediction,
+                    ).view(-1)
+                    self.assertEqual(wav_lengths[i].item(), expected.size(0))
+                    self.assertTrue(
+                        torch.allclose(
+                            wav[i, 0, : wav_lengths[i]], expected, atol=1e-6
+                        )
+                    )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+
+import numpy as np
+from examples.speech_to_text.data_utils import GCMVNStats
+
+
+class TestGCMVNStats(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        # an offset mean makes the naive E[x^2] - E[x]^2 estimate imprecise
+        self.chunks = [
+            (rng.randn(n, 80) * 0.5 + 1e3).astype(np.float32)
+            for n in (7, 1, 0, 33, 128, 2)
+        ]
+        features = np.concatenate(self.chunks).astype(np.float64)
+        self.mean = features.mean(axis=0)
+        self.std = features.std(axis=0)
+
+    def assert_stats(self, stats: GCMVNStats):
+        self.assertEqual(stats.count, sum(c.shape[0] for c in self.chunks))
+        np.testing.assert_allclose(stats.mean, self.mean, rtol=1e-12)
+        np.testing.assert_allclose(np.sqrt(stats.m2 / stats.count), self.std, rtol=1e-9)
+        result = stats.get_stats()
+        self.assertEqual(result["mean"].dtype, np.float32)
+        self.assertEqual(result["std"].dtype, np.float32)
+        np.testing.assert_allclose(result["std"], self.std, rtol=1e-5)
+
+    def test_update_matches_numpy(self):
+        stats = GCMVNStats()
+        for chunk in self.chunks:
+            stats.update(chunk)
+        self.assert_stats(stats)
+
+    def test_merge_matches_numpy(self):
+        shards = [GCMVNStats() for _ in range(3)]
+        for i, chunk in enumerate(self.chunks):
+            shards[i % 3].update(chunk)
+        stats = GCMVNStats()
+        stats.merge(GCMVNStats())
+        for shard in shards:
+            stats.merge(shard)
+        self.assert_stats(stats)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import mmap
+import multiprocessing
+import os
+import tempfile
+import threading
+import unittest
+
+from fairseq.data.audio import audio_utils
+
+
+def _read_in_child(path, queue):
+    pool = audio_utils.get_mmap_pool()
+    queue.put((pool.pid == os.getpid(), len(pool.mmaps), pool.max_size))
+    queue.put(audio_utils.mmap_read(path, 3, 4))
+
+
+class TestMmapPool(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.paths = []
+        for i in range(3):
+            path = os.path.join(self.tmp.name, f"{i}.bin")
+            with open(path, "wb") as f:
+                f.write(bytes(range(i, i + 16)))
+            self.paths.append(path)
+
+    def tearDown(self):
+        audio_utils.configure_mmap_pool()
+        self.tmp.cleanup()
+
+    def test_lru(self):
+        audio_utils.configure_mmap_pool(max_size=2)
+        for _ in range(2):
+            for i, path in enumerate(self.paths):
+                self.assertEqual(
+                    audio_utils.mmap_read(path, 2, 3), bytes([i + 2, i + 3, i + 4])
+                )
+        pool = audio_utils.get_mmap_pool()
+        self.assertEqual([key[0] for key in pool.mmaps.keys()], self.paths[1:])
+
+    def test_rewritten_file(self):
+        audio_utils.configure_mmap_pool(max_size=2, madvise="MADV_RANDOM")
+        self.assertEqual(audio_utils.mmap_read(self.paths[0], 0, 2), bytes([0, 1]))
+        with open(self.paths[0], "wb") as f:
+            f.write(bytes(range(100, 132)))
+        self.assertEqual(
+            audio_utils.mmap_read(self.paths[0], 0, 2), bytes([100, 101])
+        )
+
+    def test_threads(self):
+        audio_utils.configure_mmap_pool(max_size=1)
+        results = []
+
+        def read(path, i):
+            for _ in range(200):
+                data = audio_utils.mmap_read(path, 1, 2)
+                results.append(data == bytes([i + 1, i + 2]))
+
+        threads = [
+            threading.Thread(target=read, args=(path, i))
+            for i, path in enumerate(self.paths)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [True] * 600)
+        self.assertEqual(len(audio_utils.get_mmap_pool().mmaps), 1)
+
+    @unittest.skipIf(not hasattr(mmap, "MADV_SEQUENTIAL"), "no madvise")
+    def test_fork(self):
+        audio_utils.configure_mmap_pool(max_size=5, madvise=mmap.MADV_SEQUENTIAL)
+        audio_utils.mmap_read(self.paths[0], 0, 1)
+        context = multiprocessing.get_context("fork")
+        queue = context.Queue()
+        process = context.Process(target=_read_in_child, args=(self.paths[1], queue))
+        process.start()
+        self.assertEqual(queue.get(timeout=30), (True, 0, 5))
+        self.assertEqual(queue.get(timeout=30), bytes([4, 5, 6, 7]))
+        process.join()
+
+
+if __name__ == "__main__":
+    unittest.main()
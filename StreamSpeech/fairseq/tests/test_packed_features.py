@@ -0,0 +1,39 @@
+import tempfile
+import unittest
+import zipfile
+from pathlib import Path
+
+import numpy as np
+from examples.speech_to_text.data_utils import create_packed_features
+from fairseq.data.audio.audio_utils import get_features_or_waveform
+
+
+class TestPackedFeatures(unittest.TestCase):
+    def test_packed_features_match_zip(self):
+        rng = np.random.RandomState(0)
+        features = {
+            f"utt{i}": rng.randn(n, 80).astype(np.float32)
+            for i, n in enumerate((5, 1, 17))
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+            zip_path = tmp / "src_fbank80.zip"
+            with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_STORED) as f:
+                for utt_id, feature in features.items():
+                    np.save(tmp / f"{utt_id}.npy", feature)
+                    f.write(tmp / f"{utt_id}.npy", arcname=f"{utt_id}.npy")
+
+            for dtype, atol in (("float32", 0.0), ("float16", 1e-2)):
+                store_path = tmp / f"src_fbank80.{dtype}.npy"
+                paths, lengths = create_packed_features(zip_path, store_path, dtype)
+                self.assertTrue(store_path.with_suffix(".index.tsv").is_file())
+                for utt_id, feature in features.items():
+                    self.assertEqual(lengths[utt_id], feature.shape[0])
+                    packed = get_features_or_waveform(paths[utt_id])
+                    self.assertEqual(packed.dtype, np.dtype(dtype))
+                    self.assertFalse(packed.flags.writeable)
+                    np.testing.assert_allclose(packed, feature, atol=atol)
+
+
+if __name__ == "__main__":
+    unittest.main()
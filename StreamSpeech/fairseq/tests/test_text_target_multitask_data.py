@@ -0,0 +1,78 @@
+import os
+import tempfile
+import unittest
+from argparse import Namespace
+
+import torch
+from fairseq.data import Dictionary
+from fairseq.data.audio.speech_to_text_dataset import TextTargetMultitaskData
+
+
+class TestTextTargetMultitaskData(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.texts = {"a": "x y z", "b": "z", "c": "y q x x"}
+        self.write_tsv()
+        self.dict = Dictionary()
+        for symbol in "xyz":
+            self.dict.add_symbol(symbol)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write_tsv(self):
+        with open(os.path.join(self.tmp.name, "train.tsv"), "w") as f:
+            f.write("id\ttgt_text\n")
+            for sample_id, text in self.texts.items():
+                f.write(f"{sample_id}\t{text}\n")
+
+    def build(self, decoder_type, tgt_dict=None):
+        args = Namespace(
+            data=self.tmp.name,
+            decoder_type=decoder_type,
+            config={},
+            prepend_bos_and_append_tgt_lang_tag=False,
+            eos_token=None,
+            get_lang_tag_mapping={},
+        )
+        return TextTargetMultitaskData(args, "train", tgt_dict or self.dict)
+
+    def test_binarized_targets_match_text(self):
+        expected = {}
+        for decoder_type in ("ctc", "transformer"):
+            data = self.build(decoder_type)
+            self.assertIsNone(data.binarized)
+            expected[decoder_type] = {i: data.get(i) for i in self.texts}
+        self.build("ctc").binarize(self.tmp.name, "train")
+
+        for decoder_type in ("ctc", "transformer"):
+            data = self.build(decoder_type)
+            self.assertIsNotNone(data.binarized)
+            for sample_id, target in expected[decoder_type].items():
+                binarized = data.get(sample_id)
+                self.assertEqual(binarized.dtype, target.dtype)
+                self.assertTrue(torch.equal(binarized, target))
+
+
+    def test_stale_binarized_targets_are_ignored(self):
+        self.build("ctc").binarize(self.tmp.name, "train")
+        self.assertIsNotNone(self.build("ctc").binarized)
+
+        # a task with another dictionary uses other files
+        other_dict = Dictionary()
+        for symbol in "zyx":
+            other_dict.add_symbol(symbol)
+        data = self.build("ctc", other_dict)
+        self.assertIsNone(data.binarized)
+        self.assertEqual(data.get("a").tolist(), [6, 5, 4])
+
+        # the targets are tokenized again once the TSV changed
+        self.texts["a"] = "y"
+        self.write_tsv()
+        data = self.build("ctc")
+        self.assertIsNone(data.binarized)
+        self.assertEqual(data.get("a").tolist(), [5])
+
+
+if __name__ == "__main__":
+    unittest.main()
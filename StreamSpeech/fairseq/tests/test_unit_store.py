@@ -0,0 +1,78 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import torch
+from fairseq.data import Dictionary
+from fairseq.data.audio.data_cfg import S2SDataConfig
+from fairseq.data.audio.speech_to_speech_dataset import (
+    SpeechToSpeechDataset,
+    UnitStore,
+)
+
+
+class TestUnitStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        self.tgt_dict = Dictionary()
+        for unit in range(10):
+            self.tgt_dict.add_symbol(str(unit))
+        self.ids = ["a", "b", "c"]
+        # unit 12 is not in the dictionary
+        self.units = [[3, 3, 0, 9], [], [1, 12, 5]]
+        self.cfg_path = Path(self.root) / "config.yaml"
+        self.cfg_path.write_text("input_channels: 1\n")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def build(self, tgt_units):
+        return SpeechToSpeechDataset(
+            split="train",
+            is_train_split=False,
+            data_cfg=S2SDataConfig(self.cfg_path),
+            src_audio_paths=["" for _ in self.ids],
+            src_n_frames=[1 for _ in self.ids],
+            tgt_audio_paths=[" ".join(str(u) for u in units) for units in self.units],
+            tgt_n_frames=[len(units) for units in self.units],
+            ids=self.ids,
+            target_is_code=True,
+            tgt_dict=self.tgt_dict,
+            tgt_units=tgt_units,
+        )
+
+    def test_binarized_units_match_text(self):
+        # the store may list the samples in another order
+        UnitStore.save(
+            self.root,
+            "train",
+            self.ids[::-1],
+            self.units[::-1],
+            [len(units) for units in self.units[::-1]],
+        )
+        self.assertTrue(UnitStore.exists(self.root, "train"))
+        from_text = self.build(None)
+        from_store = self.build(UnitStore(self.root, "train"))
+        self.assertIsNotNone(from_store.tgt_units)
+        for i in range(len(self.ids)):
+            expected = from_text._get_code_target(i)
+            target = from_store._get_code_target(i)
+            self.assertEqual(target.dtype, expected.dtype)
+            self.assertTrue(torch.equal(target, expected))
+
+    def test_missing_samples(self):
+        UnitStore.save(self.root, "train", self.ids[:2], self.units[:2], [4, 0])
+        self.assertIsNone(self.build(UnitStore(self.root, "train")).tgt_units)
+
+    def test_stale_units(self):
+        # e.g. units saved with --reduce-unit, the manifest without
+        reduced = [[3, 0, 9], [], [1, 12, 5]]
+        UnitStore.save(self.root, "train", self.ids, reduced, [3, 0, 3])
+        dataset = self.build(UnitStore(self.root, "train"))
+        self.assertIsNone(dataset.tgt_units)
+        self.assertEqual(dataset._get_code_target(0).tolist(), [7, 7, 4, 13, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
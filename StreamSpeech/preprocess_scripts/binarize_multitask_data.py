@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+import os
+import argparse
+import sys
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+parent_dir_path = os.path.abspath(os.path.join(dir_path, os.pardir))
+sys.path.insert(0, parent_dir_path)
+from fairseq.data.audio.data_cfg import MultitaskConfig
+from fairseq.data.audio.speech_to_text_dataset import TextTargetMultitaskData
+
+
+def main():
+    """Tokenize the targets of all the multitasks once, the training then
+    reads the token indices from <data>/<split>.<dict checksum>.binarized.{bin,idx}."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--multitask-config-yaml", type=str, required=True)
+    parser.add_argument("--splits", type=str, nargs="+", default=["train", "dev"])
+    args = parser.parse_args()
+
+    binarized = set()
+    for task_name, task_cfg in MultitaskConfig(
+        args.multitask_config_yaml
+    ).get_all_tasks().items():
+        for split in args.splits:
+            # the targets are saved without EOS, tasks sharing the data
+            # directory and the dictionary (e.g. target_unigram and
+            # ctc_target_unigram) share them
+            path = TextTargetMultitaskData.get_binarized_path(
+                task_cfg.data, split, task_cfg.tgt_dict
+            )
+            if path in binarized:
+                continue
+            task_data = TextTargetMultitaskData(task_cfg, split, task_cfg.tgt_dict)
+            task_data.binarize(task_cfg.data, split)
+            binarized.add(path)
+            print(f"{task_name}: binarized {len(task_data.data)} targets to {path}")
+
+
+if __name__ == "__main__":
+    main()
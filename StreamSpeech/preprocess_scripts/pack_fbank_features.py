@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+import os
+import argparse
+import sys
+from pathlib import Path
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+parent_dir_path = os.path.abspath(os.path.join(dir_path, os.pardir))
+sys.path.insert(0, parent_dir_path)
+from examples.speech_to_text.data_utils import (
+    create_packed_features,
+    load_df_from_tsv,
+    save_df_to_tsv,
+)
+
+
+def main():
+    """Pack the features of src_fbank80.zip into one memory-mapped array,
+    and point the src_audio column of the manifests to it."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--zip-path", type=str, required=True)
+    parser.add_argument(
+        "--output-path",
+        type=str,
+        default=None,
+        help="packed .npy store, defaults to the zip path with a .npy suffix",
+    )
+    parser.add_argument(
+        "--dtype", type=str, default="float16", choices=["float16", "float32"]
+    )
+    parser.add_argument(
+        "--manifests",
+        type=str,
+        nargs="*",
+        default=[],
+        help="manifest tsv files whose src_audio column is rewritten",
+    )
+    args = parser.parse_args()
+
+    zip_path = Path(args.zip_path)
+    store_path = (
+        Path(args.output_path) if args.output_path else zip_path.with_suffix(".npy")
+    )
+    paths, _ = create_packed_features(zip_path, store_path, dtype=args.dtype)
+    print(f"Packed {len(paths)} utterances into {store_path}")
+
+    for manifest in args.manifests:
+        df = load_df_from_tsv(manifest)
+        df["src_audio"] = [paths[str(utt_id)] for utt_id in df["id"]]
+        save_df_to_tsv(df, manifest)
+        print(f"Updated {manifest}")
+
+
+if __name__ == "__main__":
+    main()
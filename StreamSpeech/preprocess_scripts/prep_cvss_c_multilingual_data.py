@@ -40,7 +40,7 @@ from examples.speech_to_text.data_utils import (
     get_zip_manifest,
     load_df_from_tsv,
     save_df_to_tsv,
-    cal_gcmvn_stats,
+    GCMVNStats,
 )
 from data_utils import gen_config_yaml as gen_config_yaml_gcmvn
 
@@ -298,7 +298,7 @@ def process(args):
     else:
         print("Extracting source audio/features...")
         source_root.mkdir(exist_ok=True)
-        gcmvn_feature_list = []
+        gcmvn_stats, gcmvn_num = GCMVNStats(), 0
         for src_lang in src_lang_list:
             covost_root = Path(args.covost_data_root) / src_lang
             cvss_root = Path(args.cvss_data_root) / f"{src_lang}-en"
@@ -337,13 +337,12 @@ def process(args):
                             waveform, sample_rate, source_root / f"{utt_id}.npy"
                         )
                         if split == "train" and args.cmvn_type == "global":
-                            if len(gcmvn_feature_list) < args.gcmvn_max_num:
-                                gcmvn_feature_list.append(features)
-                            else:
-                                break
+                            if gcmvn_num < args.gcmvn_max_num:
+                                gcmvn_stats.update(features)
+                                gcmvn_num += 1
                     if split == "train" and args.cmvn_type == "global":
                         # Estimate and save cmv
-                        stats = cal_gcmvn_stats(gcmvn_feature_list)
+                        stats = gcmvn_stats.get_stats()
                         with open(output_root / "gcmvn.npz", "wb") as f:
                             np.savez(f, mean=stats["mean"], std=stats["std"])
 
@@ -22,6 +22,7 @@ from examples.speech_to_text.data_utils import (
     save_df_to_tsv,
 )
 from fairseq.data.audio.audio_utils import convert_waveform
+from fairseq.data.audio.speech_to_speech_dataset import UnitStore
 import torchaudio
 import soundfile as sf
 from tqdm import tqdm
@@ -130,6 +131,7 @@ def process_simple(args):
     print("Generating manifest...")
     for split in [ "dev", "test","train"]:
         manifest = {c: [] for c in MANIFEST_COLUMNS}
+        manifest_units = []
         
         # Read our CoVoST-style data
         covost_tsv_path = covost_root / f"covost_v2.{args.src_lang}_en.tsv"
@@ -175,12 +177,22 @@ def process_simple(args):
                 target_units = process_units(target_unit_data[target_key], args.reduce_unit)
                 manifest["tgt_audio"].append(" ".join(target_units))
                 manifest["tgt_n_frames"].append(len(target_units))
+                manifest_units.append([int(u) for u in target_units])
             else:
                 manifest["tgt_audio"].append("")
                 manifest["tgt_n_frames"].append(0)
+                manifest_units.append([])
 
         df = pd.DataFrame.from_dict(manifest)
         save_df_to_tsv(df, output_tsv_dir / f"{split}.tsv")
+        # binarized units, read by the datasets instead of the tgt_audio column
+        UnitStore.save(
+            output_tsv_dir.as_posix(),
+            split,
+            manifest["id"],
+            manifest_units,
+            manifest["tgt_n_frames"],
+        )
 
     # Generate config YAML
     if args.use_audio_input:
@@ -42,7 +42,7 @@ from examples.speech_to_text.data_utils import (
     get_zip_manifest,
     load_df_from_tsv,
     save_df_to_tsv,
-    cal_gcmvn_stats,
+    GCMVNStats,
 )
 
 log = logging.getLogger(__name__)
@@ -318,7 +318,7 @@ def process(args):
                         sample_rate,
                     )
             else:
-                gcmvn_feature_list = []
+                gcmvn_stats, gcmvn_num = GCMVNStats(), 0
                 if split == "train" and args.cmvn_type == "global":
                     print("And estimating cepstral mean and variance stats...")
                 for waveform, sample_rate, _, _, _, _, _, utt_id in tqdm(dataset):
@@ -331,13 +331,14 @@ def process(args):
                     )
                     features = extract_fbank_features(waveform, sample_rate)
                     if split == "train" and args.cmvn_type == "global":
-                        if len(gcmvn_feature_list) < args.gcmvn_max_num:
-                            gcmvn_feature_list.append(features)
+                        if gcmvn_num < args.gcmvn_max_num:
+                            gcmvn_stats.update(features)
+                            gcmvn_num += 1
                         else:
                             break
                 if split == "train" and args.cmvn_type == "global":
                     # Estimate and save cmv
-                    stats = cal_gcmvn_stats(gcmvn_feature_list)
+                    stats = gcmvn_stats.get_stats()
                     with open(output_root / "gcmvn.npz", "wb") as f:
                         np.savez(f, mean=stats["mean"], std=stats["std"])
 
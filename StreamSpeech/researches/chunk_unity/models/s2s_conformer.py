@@ -61,6 +61,20 @@ class ChunkS2SConformerEncoder(ChunkS2TConformerEncoder):
 
         return out
 
+    def forward_streaming(
+        self, src_tokens, src_lengths, incremental_state, tgt_speaker=None
+    ):
+        out = super().forward_streaming(src_tokens, src_lengths, incremental_state)
+
+        if self.spk_emb_proj:
+            x = out["encoder_out"][0]
+            seq_len, bsz, _ = x.size()
+            tgt_speaker_emb = tgt_speaker.view(1, bsz, -1).expand(seq_len, bsz, -1)
+            x = self.spk_emb_proj(torch.cat([x, tgt_speaker_emb], dim=2))
+            out["encoder_out"][0] = x
+
+        return out
+
 
 class ChunkS2UTConformerModel(S2UTTransformerModel):
     """
@@ -6,17 +6,21 @@
 import logging
 import math
 from pathlib import Path
+from typing import Dict, Optional
 
 import torch
+from torch import Tensor
 from fairseq import utils
 from fairseq import checkpoint_utils
 from fairseq.data.data_utils import lengths_to_padding_mask
+from fairseq.incremental_decoding_utils import with_incremental_state
 from fairseq.models import FairseqEncoder, register_model, register_model_architecture
 
 # from fairseq.models.speech_to_text.modules.convolution import (
 #     Conv1dSubsampler,
 #     Conv2dSubsampler,
 # )
+from chunk_unity.modules.chunk_mask import ChunkMaskCache
 from chunk_unity.modules.convolution import (
     Conv1dSubsampler,
     Conv2dSubsampler,
@@ -34,6 +38,7 @@ from chunk_unity.modules.conformer_layer import ChunkConformerEncoderLayer
 logger = logging.getLogger(__name__)
 
 
+@with_incremental_state
 class ChunkS2TConformerEncoder(FairseqEncoder):
     """Conformer Encoder for speech translation based on https://arxiv.org/abs/2005.08100"""
 
@@ -71,6 +76,7 @@ class ChunkS2TConformerEncoder(FairseqEncoder):
                 args.encoder_embed_dim,
             )
         self.pos_enc_type = args.pos_enc_type
+        self.attn_type = args.attn_type
         if self.pos_enc_type == "rel_pos":
             self.embed_positions = RelPositionalEncoding(
                 args.max_source_positions, args.encoder_embed_dim
@@ -106,7 +112,21 @@ class ChunkS2TConformerEncoder(FairseqEncoder):
         self._future_mask = torch.empty(0)
         self.unidirectional = getattr(args, "uni_encoder", False)
 
-        self._chunk_mask = torch.empty(0)
+        self._chunk_masks = ChunkMaskCache()
+
+    def set_chunk_size(self, chunk_size: int, conv_chunk_size: Optional[int] = None):
+        """Set the attention chunk size, and the chunk size of the chunk-based
+        convolutions (the attention chunk size by default).
+
+        The incremental states of the streams in progress become invalid.
+        """
+        if conv_chunk_size is None:
+            conv_chunk_size = chunk_size
+        self.chunk_size = chunk_size
+        for conv in self.subsample.conv_layers:
+            conv.chunk_size = conv_chunk_size
+        for layer in self.conformer_layers:
+            layer.conv_module.depthwise_conv.chunk_size = conv_chunk_size
 
     def _forward(self, src_tokens, src_lengths, return_all_hiddens=False):
         """
@@ -143,7 +163,13 @@ class ChunkS2TConformerEncoder(FairseqEncoder):
         # extra={
         #     'encoder_mask':self.buffered_future_mask(x) if self.unidirectional else None
         # }
-        extra = {"encoder_mask": self.buffered_chunk_mask(x) if self.chunk else None}
+        if not self.chunk:
+            extra = {"encoder_mask": None}
+        elif self.attn_type == "espnet" and self.pos_enc_type == "rel_pos":
+            # the chunk masked scores are not computed by the attention
+            extra = {"encoder_mask": None, "chunk_size": self.chunk_size}
+        else:
+            extra = {"encoder_mask": self.buffered_chunk_mask(x)}
 
         # x is T X B X C
         for layer in self.conformer_layers:
@@ -178,6 +204,79 @@ class ChunkS2TConformerEncoder(FairseqEncoder):
             )
         return x
 
+    def forward_streaming(
+        self,
+        src_tokens,
+        src_lengths,
+        incremental_state: Optional[Dict[str, Dict[str, Optional[Tensor]]]],
+    ):
+        """Encode newly arrived frames, reusing the states of committed chunks.
+
+        With the chunk mask and chunk-based convolutions, the outputs of a
+        complete chunk never change, so their keys/values, convolution left
+        contexts and encoder outputs are cached in ``incremental_state``. Only
+        the last incomplete chunk is recomputed on each call.
+        Args:
+            src_tokens: New input frames of shape B X T X C, not padded
+            src_lengths: Lengths of the new input frames (unused)
+            incremental_state: Cache of the stream, an empty dict for a new one
+        Returns:
+            Same as forward, for the whole sequence received so far
+        """
+        if (
+            not self.chunk
+            or self.pos_enc_type != "rel_pos"
+            or self.conv_version != "s2t_transformer"
+        ):
+            raise NotImplementedError(
+                "streaming encoder requires --chunk-size, rel_pos and s2t_transformer conv"
+            )
+        saved_state = self.get_incremental_state(incremental_state, "encoder_state")
+        if saved_state is None:
+            saved_state = {}
+
+        x, num_final = self.subsample.forward_streaming(src_tokens, incremental_state)
+        x = self.embed_scale * x
+        x = self.linear(x)
+        x = self.dropout(x)
+
+        # every stage returns the frames following its previous final frames,
+        # so the sequence length is the number of finalized frames plus x
+        prev_frames = saved_state.get("num_frames", 0)
+        total_len = prev_frames + x.size(0)
+        saved_state["num_frames"] = prev_frames + num_final
+        positions = self.embed_positions(x.new_zeros(1, 1, 1).expand(total_len, 1, 1))
+
+        for layer in self.conformer_layers:
+            x, num_final = layer.forward_streaming(
+                x, num_final, positions, self.chunk_size, incremental_state
+            )
+
+        if "encoder_out" in saved_state:
+            num_final += saved_state["encoder_out"].size(0)
+            x = torch.cat((saved_state["encoder_out"], x), dim=0)
+        saved_state["encoder_out"] = x[:num_final]
+        self.set_incremental_state(incremental_state, "encoder_state", saved_state)
+
+        return {
+            "encoder_out": [x],  # T x B x C
+            "encoder_padding_mask": [],  # B x T
+            "encoder_embedding": [],  # B x T x C
+            "encoder_states": [],  # List[T x B x C]
+            "src_tokens": [],
+            "src_lengths": [],
+        }
+
+    def num_final_frames(
+        self, incremental_state: Optional[Dict[str, Dict[str, Optional[Tensor]]]]
+    ) -> int:
+        """Number of leading encoder outputs of a stream that will not change
+        anymore, i.e. the outputs of its committed chunks."""
+        saved_state = self.get_incremental_state(incremental_state, "encoder_state")
+        if saved_state is None or "encoder_out" not in saved_state:
+            return 0
+        return saved_state["encoder_out"].size(0)
+
     def buffered_future_mask(self, tensor):
         dim = tensor.size(0)
         # self._future_mask.device != tensor.device is not working in TorchScript. This is a workaround.
@@ -193,24 +292,9 @@ class ChunkS2TConformerEncoder(FairseqEncoder):
         return self._future_mask[:dim, :dim]
 
     def buffered_chunk_mask(self, tensor):
-        dim = tensor.size(0)
-        # self._future_mask.device != tensor.device is not working in TorchScript. This is a workaround.
-        if (
-            self._chunk_mask.size(0) == 0
-            or (not self._chunk_mask.device == tensor.device)
-            or self._chunk_mask.size(0) < dim
-        ):
-            chunk_size = max(self.chunk_size, 1)
-            idx = torch.arange(0, dim, device=tensor.device).unsqueeze(1)
-            idx = (idx // chunk_size + 1) * chunk_size
-            idx = idx.clamp(1, dim)
-            tmp = torch.arange(0, dim, device=tensor.device).unsqueeze(0).repeat(dim, 1)
-            self._chunk_mask = torch.where(
-                idx <= tmp, torch.tensor(float("-inf")), torch.tensor(0.0)
-            )
-
-        self._chunk_mask = self._chunk_mask.to(tensor)
-        return self._chunk_mask[:dim, :dim]
+        return self._chunk_masks(
+            tensor.size(0), max(self.chunk_size, 1), tensor.device, tensor.dtype
+        )
 
     def reorder_encoder_out(self, encoder_out, new_order):
         """Required method for a FairseqEncoder. Calls the method from the parent class"""
@@ -4,12 +4,15 @@
 # StreamSpeech: Simultaneous Speech-to-Speech Translation with Multi-task Learning (ACL 2024)
 ##########################################
 
-from typing import Optional
+from typing import Dict, Optional
 
 import torch
 import torch.nn.functional as F
+from torch import Tensor
+from fairseq.incremental_decoding_utils import with_incremental_state
 
 
+@with_incremental_state
 class ChunkCausalConv1d(torch.nn.Conv1d):
     def __init__(
         self,
@@ -36,30 +39,16 @@ class ChunkCausalConv1d(torch.nn.Conv1d):
         self.__padding = (kernel_size // 2) * dilation
         self.chunk_size = chunk_size
 
+    def is_chunked(self):
+        return self.chunk_size > 0 and self.chunk_size < 999
+
     def forward(self, input):
-        if self.chunk_size > 0 and self.chunk_size < 999:
-            self.__k = self.__padding + self.chunk_size
+        if self.is_chunked():
             output_len = (
                 input.size(-1) + 2 * self.__padding - self.kernel_size[0]
             ) // self.stride[0] + 1
             padded_input = self.pad_to_chunk_size(input)
-            unfolded_input = padded_input.unfold(
-                -1, self.__k, self.__k - self.__padding
-            )
-            unfolded_input = F.pad(unfolded_input, (0, self.__padding))
-            bsz, n_channels, chunks, seq_length = unfolded_input.size()
-            unfolded_input = (
-                unfolded_input.transpose(1, 2)
-                .contiguous()
-                .view(-1, n_channels, seq_length)
-            )
-            res = super(ChunkCausalConv1d, self).forward(unfolded_input)
-            res = (
-                res.contiguous()
-                .view(bsz, chunks, self.out_channels, -1)
-                .transpose(1, 2)
-            )
-            res = res.contiguous().view(bsz, self.out_channels, -1)[:, :, :output_len]
+            res = self._forward_chunks(padded_input)[:, :, :output_len]
         else:
             unfolded_input = F.pad(input, (self.__padding, 0))
             unfolded_input = F.pad(unfolded_input, (0, self.__padding))
@@ -67,6 +56,92 @@ class ChunkCausalConv1d(torch.nn.Conv1d):
 
         return res
 
+    def _forward_chunks(self, padded_input):
+        """Convolve every chunk of a left-context padded input independently.
+        Args:
+            padded_input: B X C X (padding + n * chunk_size)
+        Returns:
+            Tensor of shape B X C' X (n * outputs per chunk)
+        """
+        self.__k = self.__padding + self.chunk_size
+        unfolded_input = padded_input.unfold(-1, self.__k, self.__k - self.__padding)
+        unfolded_input = F.pad(unfolded_input, (0, self.__padding))
+        bsz, n_channels, chunks, seq_length = unfolded_input.size()
+        unfolded_input = (
+            unfolded_input.transpose(1, 2).contiguous().view(-1, n_channels, seq_length)
+        )
+        res = super(ChunkCausalConv1d, self).forward(unfolded_input)
+        res = res.contiguous().view(bsz, chunks, self.out_channels, -1).transpose(1, 2)
+        return res.contiguous().view(bsz, self.out_channels, -1)
+
+    def forward_streaming(
+        self,
+        input,
+        num_final: int,
+        incremental_state: Optional[Dict[str, Dict[str, Optional[Tensor]]]],
+    ):
+        """Convolve the frames that follow the last committed chunk.
+
+        The caller feeds every frame after the last committed chunk; the first
+        ``num_final`` of them will not change anymore. Complete chunks of final
+        frames are committed and only their last frames are kept as left
+        context, so past chunks are never convolved again.
+        Args:
+            input: Input of shape B X C X T
+            num_final: Number of leading frames of ``input`` that are final
+        Returns:
+            Tensor of shape B X C' X T', number of leading final output frames
+        """
+        if input.size(-1) == 0:
+            return input.new_zeros(input.size(0), self.out_channels, 0), 0
+        if not self.is_chunked():
+            # a single unbounded chunk, nothing can be committed
+            return self.forward(input), 0
+
+        assert self.chunk_size % self.stride[0] == 0
+        saved_state = self._get_input_buffer(incremental_state)
+        if "prev_input" in saved_state:
+            left_context = saved_state["prev_input"]
+        else:
+            left_context = input.new_zeros(input.size(0), input.size(1), 0)
+        left_context = F.pad(
+            left_context, (self.__padding - left_context.size(-1), 0)
+        )
+
+        output_len = (
+            input.size(-1) + 2 * self.__padding - self.kernel_size[0]
+        ) // self.stride[0] + 1
+        padding_size = (
+            self.chunk_size - (input.size(-1) % self.chunk_size)
+        ) % self.chunk_size
+        padded_input = F.pad(torch.cat((left_context, input), dim=-1), (0, padding_size))
+        res = self._forward_chunks(padded_input)[:, :, :output_len]
+
+        num_commit = (num_final // self.chunk_size) * self.chunk_size
+        if num_commit > 0:
+            saved_state["prev_input"] = padded_input[
+                :, :, num_commit : num_commit + self.__padding
+            ]
+            self._set_input_buffer(incremental_state, saved_state)
+        return res, num_commit // self.stride[0]
+
+    def _get_input_buffer(
+        self, incremental_state: Optional[Dict[str, Dict[str, Optional[Tensor]]]]
+    ) -> Dict[str, Optional[Tensor]]:
+        result = self.get_incremental_state(incremental_state, "conv_state")
+        if result is not None:
+            return result
+        else:
+            empty_result: Dict[str, Optional[Tensor]] = {}
+            return empty_result
+
+    def _set_input_buffer(
+        self,
+        incremental_state: Dict[str, Dict[str, Optional[Tensor]]],
+        buffer: Dict[str, Optional[Tensor]],
+    ):
+        return self.set_incremental_state(incremental_state, "conv_state", buffer)
+
     def pad_to_chunk_size(self, input_tensor):
         batch_size, num_channels, seq_length = input_tensor.size()
 
@@ -0,0 +1,52 @@
+##########################################
+# Chunk attention masks in StreamSpeech
+#
+# StreamSpeech: Simultaneous Speech-to-Speech Translation with Multi-task Learning (ACL 2024)
+##########################################
+
+from collections import OrderedDict
+
+import torch
+from torch import Tensor
+
+
+def build_chunk_mask(
+    dim: int, chunk_size: int, device, dtype: torch.dtype = torch.float32
+) -> Tensor:
+    """Float mask of the attention of each frame to the frames after its chunk"""
+    idx = torch.arange(0, dim, device=device).unsqueeze(1)
+    idx = (idx // chunk_size + 1) * chunk_size
+    tmp = torch.arange(0, dim, device=device).unsqueeze(0)
+    mask = torch.zeros(dim, dim, device=device, dtype=dtype)
+    return mask.masked_fill(idx <= tmp, float("-inf"))
+
+
+class ChunkMaskCache(object):
+    """LRU cache of chunk masks, keyed on the chunk size and the length rounded
+    up to a power of two (at least ``min_size``). The mask of a length is the
+    top left corner of the mask of its bucket, so the masks are only built
+    when an input is longer than all the previous ones of its chunk size.
+
+    Args:
+        max_masks (int): maximum number of masks kept
+        min_size (int): size of the smallest bucket
+    """
+
+    def __init__(self, max_masks: int = 8, min_size: int = 64):
+        self.max_masks = max_masks
+        self.min_size = min_size
+        self.masks = OrderedDict()
+
+    def __call__(
+        self, dim: int, chunk_size: int, device, dtype: torch.dtype = torch.float32
+    ) -> Tensor:
+        size = max(self.min_size, 1 << (dim - 1).bit_length())
+        key = (chunk_size, size)
+        mask = self.masks.get(key, None)
+        if mask is None or mask.device != device or mask.dtype != dtype:
+            mask = build_chunk_mask(size, chunk_size, device, dtype)
+            self.masks[key] = mask
+            if len(self.masks) > self.max_masks:
+                self.masks.popitem(last=False)
+        self.masks.move_to_end(key)
+        return mask[:dim, :dim]
@@ -4,13 +4,15 @@
 # LICENSE file in the root directory of this source tree.
 
 
-from typing import Optional
+from typing import Dict, Optional
 
 import torch
+from torch import Tensor
 
+from fairseq.incremental_decoding_utils import with_incremental_state
 from fairseq.modules import LayerNorm
 from uni_unity.modules.multihead_attention import MultiheadAttention
-from uni_unity.modules.espnet_multihead_attention import (
+from chunk_unity.modules.espnet_multihead_attention import (
     ESPNETMultiHeadedAttention,
     RelPositionMultiHeadedAttention,
     RotaryPositionMultiHeadedAttention,
@@ -118,6 +120,34 @@ class ConvolutionModule(torch.nn.Module):
 
         return x.transpose(1, 2)
 
+    def forward_streaming(
+        self,
+        x,
+        num_final: int,
+        incremental_state: Optional[Dict[str, Dict[str, Optional[Tensor]]]],
+    ):
+        """
+        Args:
+            x: Frames after the last committed chunk B X T X C
+            num_final: Number of leading frames of x that are final
+        Returns:
+          Tensor of shape B X T X C, number of committed frames
+        """
+        x = self.layer_norm(x)
+        x = x.transpose(1, 2)
+        x = self.pointwise_conv1(x)
+        x = self.glu(x)
+        x, num_commit = self.depthwise_conv.forward_streaming(
+            x, num_final, incremental_state
+        )
+        x = self.batch_norm(x)
+        x = self.activation(x)
+
+        x = self.pointwise_conv2(x)
+        x = self.dropout(x)
+
+        return x.transpose(1, 2), num_commit
+
 
 class FeedForwardModule(torch.nn.Module):
     """Positionwise feed forward layer used in conformer"""
@@ -164,6 +194,7 @@ class FeedForwardModule(torch.nn.Module):
         return self.dropout2(x)
 
 
+@with_incremental_state
 class ChunkConformerEncoderLayer(torch.nn.Module):
     """Conformer block based on https://arxiv.org/abs/2005.08100. We currently don't support relative positional encoding in MHA"""
 
@@ -310,3 +341,71 @@ class ChunkConformerEncoderLayer(torch.nn.Module):
 
         x = self.final_layer_norm(x)
         return x, (attn, layer_result)
+
+    def forward_streaming(
+        self,
+        x,
+        num_final: int,
+        position_emb: Optional[torch.Tensor],
+        chunk_size: int,
+        incremental_state: Optional[Dict[str, Dict[str, Optional[Tensor]]]],
+    ):
+        """
+        Args:
+            x: Frames after the previously returned final frames T X B X C
+            num_final: Number of leading frames of x that are final
+            position_emb: Relative positional embedding of the whole sequence
+            chunk_size: Attention chunk size
+        Returns:
+            Tensor of shape T' X B X C starting right after the previously
+            returned final frames, number of leading final frames
+        """
+        assert self.pos_enc_type == "rel_pos" and isinstance(
+            self.self_attn, RelPositionMultiHeadedAttention
+        ), "streaming is only supported for espnet rel_pos attention"
+        saved_state = self.get_incremental_state(incremental_state, "layer_state")
+        if saved_state is None:
+            saved_state = {}
+
+        residual = x
+        x = self.ffn1(x)
+        x = x * 0.5 + residual
+
+        # final frames of a chunk that is not complete yet are attended again
+        if "attn_input" in saved_state:
+            num_final += saved_state["attn_input"].size(0)
+            x = torch.cat((saved_state["attn_input"], x), dim=0)
+        num_commit = (num_final // max(chunk_size, 1)) * max(chunk_size, 1)
+        saved_state["attn_input"] = x[num_commit:num_final]
+        if x.size(0) > 0:
+            residual = x
+            x = self.self_attn_layer_norm(x)
+            x = self.self_attn.forward_streaming(
+                x, position_emb, chunk_size, num_commit, incremental_state
+            )
+            x = self.self_attn_dropout(x)
+            x = x + residual
+        num_final = num_commit
+
+        if "conv_input" in saved_state:
+            num_final += saved_state["conv_input"].size(0)
+            x = torch.cat((saved_state["conv_input"], x), dim=0)
+        if x.size(0) > 0:
+            residual = x
+            x = x.transpose(0, 1)
+            x, num_commit = self.conv_module.forward_streaming(
+                x, num_final, incremental_state
+            )
+            x = x.transpose(0, 1)
+            saved_state["conv_input"] = residual[num_commit:num_final]
+            x = residual + x
+        else:
+            num_commit = 0
+        self.set_incremental_state(incremental_state, "layer_state", saved_state)
+
+        residual = x
+        x = self.ffn2(x)
+        x = x * 0.5 + residual
+
+        x = self.final_layer_norm(x)
+        return x, num_commit
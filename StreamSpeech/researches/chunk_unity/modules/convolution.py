@@ -4,13 +4,16 @@
 # LICENSE file in the root directory of this source tree.
 
 
-from typing import List
+from typing import Dict, List, Optional
 
 import torch
 import torch.nn as nn
+from torch import Tensor
+from fairseq.incremental_decoding_utils import with_incremental_state
 from chunk_unity.modules.chunk_causal_conv1d import ChunkCausalConv1d
 
 
+@with_incremental_state
 class Conv1dSubsampler(nn.Module):
     """Convolutional subsampler: a stack of 1D convolution (along temporal
     dimension) followed by non-linear activation via gated linear units
@@ -88,6 +91,39 @@ class Conv1dSubsampler(nn.Module):
         x = x.transpose(1, 2).transpose(0, 1).contiguous()  # -> T x B x (C x D)
         return x, self.get_out_seq_lens_tensor(src_lengths)
 
+    def forward_streaming(
+        self,
+        src_tokens,
+        incremental_state: Optional[Dict[str, Dict[str, Optional[Tensor]]]],
+    ):
+        """Subsample newly arrived frames, reusing the committed chunks.
+        Args:
+            src_tokens: New input frames of shape B X T X (C X D), all final
+        Returns:
+            Tensor of shape T' X B X (C X D) starting right after the
+            previously returned final frames, number of leading final frames
+        """
+        saved_state = self.get_incremental_state(incremental_state, "subsample_state")
+        if saved_state is None:
+            saved_state = {}
+        x = src_tokens.transpose(1, 2).contiguous()  # -> B x (C x D) x T
+        num_final = x.size(-1)
+        for i, conv in enumerate(self.conv_layers):
+            # final frames not yet committed by this layer are fed again
+            prev_input = saved_state.get(f"prev_input_{i}", None)
+            if prev_input is not None:
+                x = torch.cat((prev_input, x), dim=-1)
+                num_final += prev_input.size(-1)
+            out, num_final_out = conv.forward_streaming(x, num_final, incremental_state)
+            saved_state[f"prev_input_{i}"] = x[
+                :, :, num_final_out * conv.stride[0] : num_final
+            ]
+            x = nn.functional.glu(out, dim=1)
+            num_final = num_final_out
+        self.set_incremental_state(incremental_state, "subsample_state", saved_state)
+        x = x.transpose(1, 2).transpose(0, 1).contiguous()  # -> T x B x (C x D)
+        return x, num_final
+
 
 def infer_conv_output_dim(in_channels, input_dim, out_channels):
     sample_seq_len = 200
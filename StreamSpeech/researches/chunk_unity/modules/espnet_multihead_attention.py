@@ -7,9 +7,12 @@
 """Multi-Head Attention layer definition."""
 
 import math
+from typing import Dict, Optional
 
 import torch
-from torch import nn
+import torch.nn.functional as F
+from torch import Tensor, nn
+from fairseq.incremental_decoding_utils import with_incremental_state
 from fairseq.modules.rotary_positional_embedding import (
     RotaryPositionalEmbedding,
     apply_rotary_pos_emb,
@@ -107,6 +110,7 @@ class ESPNETMultiHeadedAttention(nn.Module):
         return scores, None
 
 
+@with_incremental_state
 class RelPositionMultiHeadedAttention(ESPNETMultiHeadedAttention):
     """Multi-Head Attention layer with relative position encoding.
     Paper: https://arxiv.org/abs/1901.02860
@@ -179,6 +183,18 @@ class RelPositionMultiHeadedAttention(ESPNETMultiHeadedAttention):
         # (batch, head, time1, d_k)
         q_with_bias_v = (q + self.pos_bias_v).transpose(1, 2)
 
+        if extra is not None and extra.get("chunk_size", None) is not None:
+            x = self.forward_chunk_attention(
+                q_with_bias_u,
+                q_with_bias_v,
+                k,
+                v,
+                p,
+                extra["chunk_size"],
+                key_padding_mask,
+            )
+            return x.transpose(0, 1), None
+
         # compute attention score
         # first compute matrix a and matrix c
         # as described in https://arxiv.org/abs/1901.02860 Section 3.3
@@ -208,6 +224,166 @@ class RelPositionMultiHeadedAttention(ESPNETMultiHeadedAttention):
         scores = scores.transpose(0, 1)
         return scores, None
 
+    def forward_chunk_attention(
+        self,
+        q_with_bias_u,
+        q_with_bias_v,
+        k,
+        v,
+        p,
+        chunk_size: int,
+        key_padding_mask=None,
+        block_size: int = 64,
+    ):
+        """Chunk-masked self attention computed block by block.
+
+        Frames attend to the keys up to the end of their chunk. The queries
+        are split into blocks of whole chunks, and the scores of a block are
+        only computed for the keys up to its end, instead of computing the
+        whole T X T scores and masking them.
+        Args:
+            q_with_bias_u: Query with bias u  B X n_head X T X d_k
+            q_with_bias_v: Query with bias v  B X n_head X T X d_k
+            k: Key  B X n_head X T X d_k
+            v: Value  B X n_head X T X d_k
+            p: Positional embedding  B X n_head X 2T-1 X d_k
+            chunk_size: Attention chunk size
+            key_padding_mask: Mask tensor B X T
+            block_size: Minimum number of queries of a block
+        Returns:
+            torch.Tensor: Output tensor B X T X C.
+        """
+        n_batch, n_head, time, _ = k.size()
+        chunk_size = max(chunk_size, 1)
+        block_size = chunk_size * max(block_size // chunk_size, 1)
+        if key_padding_mask is not None:
+            key_padding_mask = key_padding_mask.unsqueeze(1).unsqueeze(2).to(bool)
+
+        outputs = []
+        for start in range(0, time, block_size):
+            end = min(start + block_size, time)
+            time1 = end - start
+
+            # relative distances from end - 1 down to -(time1 - 1),
+            # row i keeps the distances (start + i - j) for the keys j
+            p_block = p[:, :, time - end : time + time1 - 1]
+            matrix_bd = torch.matmul(
+                q_with_bias_v[:, :, start:end], p_block.transpose(-2, -1)
+            ).contiguous()
+            width = matrix_bd.size(-1)
+            matrix_bd = matrix_bd.as_strided(
+                (n_batch, n_head, time1, end),
+                (n_head * time1 * width, time1 * width, width - 1, 1),
+                matrix_bd.storage_offset() + time1 - 1,
+            )
+            bias = matrix_bd / math.sqrt(self.d_k)
+
+            rows = torch.arange(start, end, device=k.device).unsqueeze(1)
+            cols = torch.arange(0, end, device=k.device).unsqueeze(0)
+            mask = (cols >= (rows // chunk_size + 1) * chunk_size).unsqueeze(0)
+            if key_padding_mask is not None:
+                mask = mask.unsqueeze(0) | key_padding_mask[:, :, :, :end]
+            bias = bias.masked_fill(mask, float("-inf"))
+
+            if hasattr(F, "scaled_dot_product_attention"):
+                x = F.scaled_dot_product_attention(
+                    q_with_bias_u[:, :, start:end],
+                    k[:, :, :end],
+                    v[:, :, :end],
+                    attn_mask=bias,
+                    dropout_p=self.dropout.p if self.training else 0.0,
+                )
+            else:
+                matrix_ac = torch.matmul(
+                    q_with_bias_u[:, :, start:end], k[:, :, :end].transpose(-2, -1)
+                )
+                scores = matrix_ac / math.sqrt(self.d_k) + bias
+                p_attn = self.dropout(torch.softmax(scores, dim=-1))
+                x = torch.matmul(p_attn, v[:, :, :end])
+            outputs.append(x)
+
+        x = torch.cat(outputs, dim=2)  # (batch, head, time, d_k)
+        x = x.transpose(1, 2).contiguous().view(n_batch, -1, self.h * self.d_k)
+        return self.linear_out(x)  # (batch, time, d_model)
+
+    def forward_streaming(
+        self,
+        query,
+        pos_emb,
+        chunk_size: int,
+        num_commit: int,
+        incremental_state: Optional[Dict[str, Dict[str, Optional[Tensor]]]],
+    ):
+        """Chunk-masked self attention of new frames over the cached ones.
+        Args:
+            query: Frames after the cached ones T1 X B X C
+            pos_emb: Positional embedding of the whole sequence 2T-1 X 1 X C
+            chunk_size: Attention chunk size (frames attend up to their chunk end)
+            num_commit: Number of leading query frames whose keys and values
+                are appended to the cache
+        Returns:
+            torch.Tensor: Output tensor T1 X B X C.
+        """
+        saved_state = self._get_input_buffer(incremental_state)
+        query = query.transpose(0, 1)
+        q, k, v = self.forward_qkv(query, query, query)
+        if "prev_key" in saved_state:
+            k = torch.cat((saved_state["prev_key"], k), dim=2)
+            v = torch.cat((saved_state["prev_value"], v), dim=2)
+        time1, time2 = q.size(2), k.size(2)
+        start = time2 - time1
+
+        # relative distances from time2 - 1 down to -(time1 - 1)
+        pos_emb = pos_emb[: time2 + time1 - 1].transpose(0, 1)
+        p = self.linear_pos(pos_emb).view(pos_emb.size(0), -1, self.h, self.d_k)
+        p = p.transpose(1, 2)  # (batch, head, time2+time1-1, d_k)
+
+        q = q.transpose(1, 2)  # (batch, time1, head, d_k)
+        q_with_bias_u = (q + self.pos_bias_u).transpose(1, 2)
+        q_with_bias_v = (q + self.pos_bias_v).transpose(1, 2)
+        matrix_ac = torch.matmul(q_with_bias_u, k.transpose(-2, -1))
+        matrix_bd = torch.matmul(q_with_bias_v, p.transpose(-2, -1)).contiguous()
+        # row i keeps the distances (start + i - j) for the keys j
+        n_batch, n_head, _, width = matrix_bd.size()
+        matrix_bd = matrix_bd.as_strided(
+            (n_batch, n_head, time1, time2),
+            (n_head * time1 * width, time1 * width, width - 1, 1),
+            matrix_bd.storage_offset() + time1 - 1,
+        )
+        scores = (matrix_ac + matrix_bd) / math.sqrt(self.d_k)
+
+        chunk_size = max(chunk_size, 1)
+        rows = torch.arange(start, time2, device=q.device).unsqueeze(1)
+        cols = torch.arange(0, time2, device=q.device).unsqueeze(0)
+        chunk_mask = cols >= (rows // chunk_size + 1) * chunk_size
+        scores = scores.masked_fill(
+            chunk_mask.unsqueeze(0).unsqueeze(1), float("-inf")
+        )
+        x = self.forward_attention(v, scores, None)
+
+        if num_commit > 0:
+            saved_state["prev_key"] = k[:, :, : start + num_commit]
+            saved_state["prev_value"] = v[:, :, : start + num_commit]
+            self._set_input_buffer(incremental_state, saved_state)
+        return x.transpose(0, 1)
+
+    def _get_input_buffer(
+        self, incremental_state: Optional[Dict[str, Dict[str, Optional[Tensor]]]]
+    ) -> Dict[str, Optional[Tensor]]:
+        result = self.get_incremental_state(incremental_state, "attn_state")
+        if result is not None:
+            return result
+        else:
+            empty_result: Dict[str, Optional[Tensor]] = {}
+            return empty_result
+
+    def _set_input_buffer(
+        self,
+        incremental_state: Dict[str, Dict[str, Optional[Tensor]]],
+        buffer: Dict[str, Optional[Tensor]],
+    ):
+        return self.set_incremental_state(incremental_state, "attn_state", buffer)
+
 
 class RotaryPositionMultiHeadedAttention(ESPNETMultiHeadedAttention):
     def __init__(
@@ -150,19 +150,12 @@ class SpeechToUnit2passCTCMultitaskTaskCriterion(
                 chunk_size = random.choice([8, 16, 24, 32, 99999])
             chunk_size = int(chunk_size)
 
-            model.encoder.chunk_size = chunk_size
-
             if not model.training and num_updates < 20000:
                 conv_chunk_size = 8
             else:
                 conv_chunk_size = random.choice([8, 16])
 
-            chunk_size = min(chunk_size, conv_chunk_size)
-
-            for conv in model.encoder.subsample.conv_layers:
-                conv.chunk_size = chunk_size
-            for layer in model.encoder.conformer_layers:
-                layer.conv_module.depthwise_conv.chunk_size = chunk_size
+            model.encoder.set_chunk_size(chunk_size, min(chunk_size, conv_chunk_size))
 
         net_output, extra = model(**net_input_concat)
         loss, nll_loss, rdrop_kl_loss = self.compute_loss(
@@ -16,6 +16,7 @@ from fairseq.data.audio.speech_to_speech_dataset import (
     SpeechToSpeechDatasetItem,
     SpeechToSpeechDataset,
     SpeechToSpeechMultitaskDataset,
+    UnitStore,
 )
 from translatotron.datasets.speech_to_speech_data_cfg_modified import (
     S2SDataConfigModified,
@@ -105,6 +106,9 @@ class SpeechToSpeechDatasetModified(FairseqDataset):
             self.src_audio_paths[index],
             waveform_transforms=self.source_waveform_transforms,
         )
+        # features of a packed store are read-only float16/float32 views of
+        # its memmap, they are copied once here
+        source = source.astype(np.float32, copy=not source.flags.writeable)
         if self.source_feature_transforms is not None:
             source = self.source_feature_transforms(source)
         source = torch.from_numpy(source).float()
@@ -146,31 +150,31 @@ class SpeechToSpeechDatasetModified(FairseqDataset):
     ) -> Dict:
         if len(samples) == 0:
             return {}
+        # sort samples by descending number of frames, then collate them in order
+        n_frames = torch.tensor([x.source.size(0) for x in samples], dtype=torch.long)
+        n_frames, order = n_frames.sort(descending=True)
+        samples = [samples[i] for i in order.tolist()]
         indices = torch.tensor([x.index for x in samples], dtype=torch.long)
         # source audio
-        sources = [x.source for x in samples]
-        frames = _collate_frames(sources, self.cfg.use_audio_input)
-        # sort samples by descending number of frames
-        n_frames = torch.tensor([x.size(0) for x in sources], dtype=torch.long)
-        n_frames, order = n_frames.sort(descending=True)
-        indices = indices.index_select(0, order)
-        frames = frames.index_select(0, order)
+        frames = _collate_frames([x.source for x in samples], self.cfg.use_audio_input)
 
         # target audio
         target, target_lengths, prev_output_tokens, ntokens = None, None, None, None
         if self.tgt_audio_paths is not None:
-            target = _collate_frames([x.target for x in samples], is_audio_input=False)
-            bsz, _, d = target.size()
-            prev_output_tokens = torch.cat(
-                (target.new_full((bsz, 1, d), 0.0), target[:, :-1, :]), dim=1
-            )
             target_lengths = torch.tensor(
                 [x.target.size(0) for x in samples], dtype=torch.long
             )
-            target = target.index_select(0, order)
-            target_lengths = target_lengths.index_select(0, order)
-            prev_output_tokens = prev_output_tokens.index_select(0, order)
-            ntokens = sum(x.target.size(0) for x in samples)
+            max_len = int(target_lengths.max())
+            target = samples[0].target.new_zeros(
+                (len(samples), max_len, samples[0].target.size(1))
+            )
+            # prev_output_tokens is the target shifted right by a zero frame
+            prev_output_tokens = torch.zeros_like(target)
+            for i, x in enumerate(samples):
+                target[i, : x.target.size(0)] = x.target
+                n = min(x.target.size(0), max_len - 1)
+                prev_output_tokens[i, 1 : n + 1] = x.target[:n]
+            ntokens = int(target_lengths.sum())
 
         net_input = {
             "src_tokens": frames,
@@ -254,17 +258,16 @@ class SpeechToSpeechMultitaskDatasetModified(SpeechToSpeechDatasetModified):
         for task_name, task_dataset in self.multitask_data.items():
             if "multitask" not in out:
                 out["multitask"] = {}
-            d = [s[task_name] for _, s in samples]
+            # collate the targets in the sorted order of the samples
+            d = [samples[i][1][task_name] for i in order.tolist()]
             task_target = task_dataset.collater(d)
             out["multitask"][task_name] = {
-                "target": task_target["target"].index_select(0, order),
-                "target_lengths": task_target["target_lengths"].index_select(0, order),
+                "target": task_target["target"],
+                "target_lengths": task_target["target_lengths"],
                 "ntokens": task_target["ntokens"],
             }
             out["multitask"][task_name]["net_input"] = {
-                "prev_output_tokens": task_target["prev_output_tokens"].index_select(
-                    0, order
-                ),
+                "prev_output_tokens": task_target["prev_output_tokens"],
             }
 
         return out
@@ -287,6 +290,7 @@ class SpeechToSpeechDatasetModifiedCreator(object):
         tgt_dict: Dictionary = None,
         n_frames_per_step: int = 1,
         multitask: Optional[Dict] = None,
+        tgt_units: Optional[UnitStore] = None,
     ) -> SpeechToSpeechDatasetModified:
         ids = [s[cls.KEY_ID] for s in samples]
         src_audio_paths = [s[cls.KEY_SRC_AUDIO] for s in samples]
@@ -320,6 +324,7 @@ class SpeechToSpeechDatasetModifiedCreator(object):
                 target_is_code=target_is_code,
                 tgt_dict=tgt_dict,
                 n_frames_per_step=n_frames_per_step,
+                tgt_units=tgt_units,
             )
         else:
             has_multitask = multitask is not None and len(multitask.keys()) > 0
@@ -363,6 +368,11 @@ class SpeechToSpeechDatasetModifiedCreator(object):
         datasets = []
         for split in splits.split(","):
             samples = SpeechToTextDatasetCreator._load_samples_from_tsv(root, split)
+            tgt_units = (
+                UnitStore(root, split)
+                if target_is_code and UnitStore.exists(root, split)
+                else None
+            )
             ds = cls._from_list(
                 split_name=split,
                 is_train_split=is_train_split,
@@ -372,6 +382,7 @@ class SpeechToSpeechDatasetModifiedCreator(object):
                 tgt_dict=tgt_dict,
                 n_frames_per_step=n_frames_per_step,
                 multitask=multitask,
+                tgt_units=tgt_units,
             )
             datasets.append(ds)
         return ConcatDataset(datasets) if len(datasets) > 1 else datasets[0]
@@ -861,6 +861,28 @@ class MultiheadAttention(FairseqIncrementalDecoder):
             incremental_state = self._set_input_buffer(incremental_state, input_buffer)
         return incremental_state
 
+    def rollback_incremental_state(
+        self,
+        incremental_state: Optional[Dict[str, Dict[str, Optional[Tensor]]]],
+        length: int,
+    ):
+        """Keep the cached keys and values of the first ``length`` positions.
+
+        The cache is narrowed to a view instead of being copied, so rolling
+        back is O(1); the next step concatenates its keys and values as usual.
+        """
+        input_buffer = self._get_input_buffer(incremental_state)
+        if "prev_key" not in input_buffer:
+            return incremental_state
+        for k in ["prev_key", "prev_value"]:
+            input_buffer_k = input_buffer[k]
+            if input_buffer_k is not None:
+                input_buffer[k] = input_buffer_k[:, :, :length]
+        prev_key_padding_mask = input_buffer.get("prev_key_padding_mask")
+        if prev_key_padding_mask is not None:
+            input_buffer["prev_key_padding_mask"] = prev_key_padding_mask[:, :length]
+        return self._set_input_buffer(incremental_state, input_buffer)
+
     def set_beam_size(self, beam_size):
         """Used for effiecient beamable enc-dec attention"""
         self.beam_size = beam_size
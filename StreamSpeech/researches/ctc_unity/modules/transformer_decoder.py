@@ -402,6 +402,23 @@ class TransformerDecoderBase(FairseqIncrementalDecoder):
 
         return x, {"attn": [attn], "inner_states": inner_states}
 
+    def rollback_incremental_state(
+        self,
+        incremental_state: Dict[str, Dict[str, Optional[Tensor]]],
+        tgt_len: int,
+        src_len: Optional[int] = None,
+    ):
+        """Discard the cached states of the target positions from ``tgt_len`` on,
+        and those of the encoder frames from ``src_len`` on if it is given.
+        The discarded encoder frames are attended again at the next step.
+        """
+        for layer in self.layers:
+            layer.self_attn.rollback_incremental_state(incremental_state, tgt_len)
+            if src_len is not None and layer.encoder_attn is not None:
+                layer.encoder_attn.rollback_incremental_state(
+                    incremental_state, src_len
+                )
+
     def build_streaming_mask(self, x, src_len, tgt_len, src_wait, src_step, tgt_step):
         idx = torch.arange(0, tgt_len, device=x.device).unsqueeze(1)
         idx = (idx // tgt_step + 1) * src_step + src_wait
@@ -6,10 +6,13 @@ import torch
 from fairseq import utils
 import torch.nn as nn
 import math
+from typing import Dict, Optional
+from torch import Tensor
 
 from fairseq.models import FairseqEncoder
 from fairseq.modules import LayerNorm, PositionalEmbedding, FairseqDropout
 from ctc_unity.modules.transformer_layer import TransformerEncoderLayer
+from chunk_unity.modules.chunk_mask import ChunkMaskCache
 
 
 class UniTransformerEncoderNoEmb(FairseqEncoder):
@@ -29,6 +32,8 @@ class UniTransformerEncoderNoEmb(FairseqEncoder):
         self._future_mask = torch.empty(0)
         self.unidirectional = getattr(args, "uni_encoder", False)
 
+        self._chunk_masks = ChunkMaskCache()
+
     def forward(
         self, x, encoder_padding_mask, return_all_hiddens=False, streaming_config=None
     ):
@@ -76,6 +81,50 @@ class UniTransformerEncoderNoEmb(FairseqEncoder):
             "src_lengths": [],
         }
 
+    def forward_streaming(
+        self,
+        x,
+        incremental_state: Optional[Dict[str, Dict[str, Optional[Tensor]]]],
+    ):
+        """Encode the newly appended positions of a stream.
+
+        The keys and values of the previous positions are cached in
+        ``incremental_state``. For a unidirectional encoder the outputs are
+        the same as encoding the whole sequence, otherwise the previous
+        outputs are not updated with the new positions.
+        Args:
+            x: States of the new positions of shape T x B x C, not padded
+            incremental_state: Cache of the stream, an empty dict for a new one
+        Returns:
+            Same as forward, for the new positions only
+        """
+        prev_len = 0
+        saved_state = self.layers[0].self_attn._get_input_buffer(incremental_state)
+        if "prev_key" in saved_state:
+            prev_len = saved_state["prev_key"].size(2)
+
+        encoder_mask = None
+        if self.unidirectional:
+            encoder_mask = self.buffered_future_mask(
+                x.new_empty(prev_len + x.size(0), 0)
+            )[prev_len:]
+        extra = {"encoder_mask": encoder_mask}
+
+        for layer in self.layers:
+            x = layer(x, None, extra=extra, incremental_state=incremental_state)
+
+        if self.layer_norm is not None:
+            x = self.layer_norm(x)
+
+        return {
+            "encoder_out": [x],  # T x B x C
+            "encoder_padding_mask": [],  # B x T
+            "encoder_embedding": [],  # B x T x C
+            "encoder_states": [],  # List[T x B x C]
+            "src_tokens": [],
+            "src_lengths": [],
+        }
+
     def buffered_future_mask(self, tensor):
         dim = tensor.size(0)
         # self._future_mask.device != tensor.device is not working in TorchScript. This is a workaround.
@@ -91,15 +140,7 @@ class UniTransformerEncoderNoEmb(FairseqEncoder):
         return self._future_mask[:dim, :dim]
 
     def buffered_chunk_mask(self, tensor, tgt_step):
-        dim = tensor.size(0)
-        idx = torch.arange(0, dim, device=tensor.device).unsqueeze(1)
-        idx = (idx // tgt_step + 1) * tgt_step
-        idx = idx.clamp(1, dim)
-        tmp = torch.arange(0, dim, device=tensor.device).unsqueeze(0).repeat(dim, 1)
-        chunk_mask = torch.where(
-            idx <= tmp, torch.tensor(float("-inf")), torch.tensor(0.0)
-        )
-        return chunk_mask[:dim, :dim]
+        return self._chunk_masks(tensor.size(0), tgt_step, tensor.device)
 
     def reorder_encoder_out(self, encoder_out, new_order):
         new_encoder_out = (
@@ -182,6 +223,8 @@ class UniTransformerEncoderWithEmb(FairseqEncoder):
         self._future_mask = torch.empty(0)
         self.unidirectional = getattr(args, "uni_encoder", False)
 
+        self._chunk_masks = ChunkMaskCache()
+
     def forward_embedding(self, src_tokens):
         token_embedding = self.embed_tokens(src_tokens)
         x = embed = self.embed_scale * token_embedding
@@ -259,15 +302,7 @@ class UniTransformerEncoderWithEmb(FairseqEncoder):
         return self._future_mask[:dim, :dim]
 
     def buffered_chunk_mask(self, tensor, tgt_step):
-        dim = tensor.size(0)
-        idx = torch.arange(0, dim, device=tensor.device).unsqueeze(1)
-        idx = (idx // tgt_step + 1) * tgt_step
-        idx = idx.clamp(1, dim)
-        tmp = torch.arange(0, dim, device=tensor.device).unsqueeze(0).repeat(dim, 1)
-        chunk_mask = torch.where(
-            idx <= tmp, torch.tensor(float("-inf")), torch.tensor(0.0)
-        )
-        return chunk_mask[:dim, :dim]
+        return self._chunk_masks(tensor.size(0), tgt_step, tensor.device)
 
     def reorder_encoder_out(self, encoder_out, new_order):
         new_encoder_out = (
@@ -168,6 +168,7 @@ class TransformerEncoderLayerBase(nn.Module):
         encoder_padding_mask: Optional[Tensor],
         attn_mask: Optional[Tensor] = None,
         extra=None,
+        incremental_state: Optional[Dict[str, Dict[str, Optional[Tensor]]]] = None,
     ):
         """
         Args:
@@ -180,6 +181,8 @@ class TransformerEncoderLayerBase(nn.Module):
                 `attn_mask[tgt_i, src_j] = 1` means that when calculating the
                 embedding for `tgt_i`, we exclude (mask out) `src_j`. This is
                 useful for strided self-attention.
+            incremental_state (dict, optional): keys and values of the previous
+                positions, for encoding a stream incrementally
 
         Returns:
             encoded output of shape `(seq_len, batch, embed_dim)`
@@ -202,6 +205,7 @@ class TransformerEncoderLayerBase(nn.Module):
             key=x,
             value=x,
             key_padding_mask=encoder_padding_mask,
+            incremental_state=incremental_state,
             need_weights=False,
             attn_mask=attn_mask,
             extra=extra,
@@ -3,6 +3,10 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+import atexit
+import json
+import queue
+import threading
 from typing import Dict, List, Optional
 
 import torch
@@ -12,6 +16,85 @@ from torch import Tensor
 from fairseq import search
 
 
+def tokens_to_text(tgt_dict, tokens):
+    text = "".join([tgt_dict[c] for c in tokens])
+    text = text.replace("_", " ")
+    text = text.replace("▁", " ")
+    text = text.replace("<unk>", " ")
+    text = text.replace("<s>", "")
+    text = text.replace("</s>", "")
+    if len(text) > 0 and text[0] == " ":
+        text = text[1:]
+    return text
+
+
+class GenerationResultWriter(object):
+    """Write the outputs of each sample as a line of a JSONL file,
+    with the fields "id", "asr", "st", "mt" and "unit".
+
+    The token sequences of a batch are queued, and converted to text and
+    written by a background thread while the next batch is generated.
+    The lines are in generation order, they can be sorted by "id".
+    An error of the thread is raised by the next call to put or close.
+    """
+
+    def __init__(self, path, dicts):
+        self.dicts = dicts
+        self.file = open(path, "w", buffering=1 << 20)
+        self.queue = queue.Queue()
+        self.error = None
+        self.thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def put(self, sample_ids, outputs):
+        """
+        Args:
+            sample_ids (List[int]): ids of the samples of the batch
+            outputs (Dict[str, List[List[int]]]): token sequences of the
+                samples for each field
+        """
+        self._raise_error()
+        self.queue.put((sample_ids, outputs))
+
+    def _write_loop(self):
+        for sample_ids, outputs in iter(self.queue.get, None):
+            if self.error is not None:
+                # the batches queued after an error are dropped
+                continue
+            try:
+                self._write(sample_ids, outputs)
+            except Exception as e:
+                self.error = e
+
+    def _write(self, sample_ids, outputs):
+        for i, sample_id in enumerate(sample_ids):
+            result = {"id": sample_id}
+            for name, tokens in outputs.items():
+                if name == "unit":
+                    result[name] = self.dicts[name].string(tokens[i])
+                else:
+                    result[name] = tokens_to_text(self.dicts[name], tokens[i])
+            self.file.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+    def _raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise RuntimeError("Failed to write the generation results") from error
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        try:
+            self.file.close()
+        except Exception as e:
+            if self.error is None:
+                self.error = e
+        self._raise_error()
+
+
 class CTCMultiDecoderSequenceGenerator(nn.Module):
     def __init__(
         self,
@@ -38,6 +121,7 @@ class CTCMultiDecoderSequenceGenerator(nn.Module):
         symbols_to_strip_from_output=None,
         lm_model=None,
         lm_weight=1.0,
+        results_jsonl=None,
     ):
         """Generates translations of a given source sentence.
 
@@ -66,6 +150,8 @@ class CTCMultiDecoderSequenceGenerator(nn.Module):
                 sharper samples (default: 1.0)
             match_source_len (bool, optional): outputs should match the source
                 length (default: False)
+            results_jsonl (str, optional): write the ASR, CTC-ST, MT and unit
+                outputs to this JSONL file instead of printing the texts
         """
         super().__init__()
 
@@ -142,6 +228,19 @@ class CTCMultiDecoderSequenceGenerator(nn.Module):
             symbols_to_strip_from_output=symbols_to_strip_from_output,
         )
 
+        # dictionaries of the outputs of each sample
+        self.output_dicts = {"mt": tgt_dict_mt, "unit": tgt_dict}
+        if self.asr_ctc_generator is not None:
+            self.output_dicts["asr"] = self.asr_ctc_generator.tgt_dict
+        if self.st_ctc_generator is not None:
+            self.output_dicts["st"] = self.st_ctc_generator.tgt_dict
+
+        self.result_writer = None
+        if results_jsonl is not None:
+            self.result_writer = GenerationResultWriter(
+                results_jsonl, self.output_dicts
+            )
+
     @torch.no_grad()
     def generate(
         self, models, sample: Dict[str, Dict[str, Tensor]], **kwargs
@@ -205,47 +304,22 @@ class CTCMultiDecoderSequenceGenerator(nn.Module):
         with torch.autograd.profiler.record_function("EnsembleModel: forward_encoder"):
             encoder_outs = self.generator.model.forward_encoder(net_input)
 
+        sample_ids = sample["id"].tolist()
+        outputs = {}
+
         if self.asr_ctc_generator is not None:
             finalized_asr = self.asr_ctc_generator.generate(
                 encoder_outs[0], aux_task_name="source_unigram"
             )
 
-            for i, hypo in enumerate(finalized_asr):
-                i_beam = 0
-                tmp = hypo[i_beam]["tokens"].int()  # hyp + eos
-                src_ctc_indices = tmp
-                src_ctc_index = hypo[i_beam]["index"]
-                text = "".join([self.asr_ctc_generator.tgt_dict[c] for c in tmp])
-                text = text.replace("_", " ")
-                text = text.replace("▁", " ")
-                text = text.replace("<unk>", " ")
-                text = text.replace("<s>", "")
-                text = text.replace("</s>", "")
-                if len(text) > 0 and text[0] == " ":
-                    text = text[1:]
-                sample_id = sample["id"].tolist()[i]
-                print("A-{}\t{}".format(sample_id, text))
+            outputs["asr"] = [hypo[0]["tokens"].tolist() for hypo in finalized_asr]
 
         if self.st_ctc_generator is not None:
             finalized_st = self.st_ctc_generator.generate(
                 encoder_outs[0], aux_task_name="ctc_target_unigram"
             )
 
-            for i, hypo in enumerate(finalized_st):
-                i_beam = 0
-                tmp = hypo[i_beam]["tokens"].int()  # hyp + eos
-                tgt_ctc_indices = tmp
-                tgt_ctc_index = hypo[i_beam]["index"]
-                text = "".join([self.st_ctc_generator.tgt_dict[c] for c in tmp])
-                text = text.replace("_", " ")
-                text = text.replace("▁", " ")
-                text = text.replace("<unk>", " ")
-                text = text.replace("<s>", "")
-                text = text.replace("</s>", "")
-                if len(text) > 0 and text[0] == " ":
-                    text = text[1:]
-                sample_id = sample["id"].tolist()[i]
-                print("S-{}\t{}".format(sample_id, text))
+            outputs["st"] = [hypo[0]["tokens"].tolist() for hypo in finalized_st]
 
         single_model = self.generator.model.single_model
         mt_decoder = getattr(single_model, f"{single_model.mt_task_name}_decoder")
@@ -260,6 +334,7 @@ class CTCMultiDecoderSequenceGenerator(nn.Module):
             constraints,
             bos_token,
             aux_task_name=single_model.mt_task_name,
+            return_decoder_out=True,
         )
 
         # extract decoder output corresponding to the best hypothesis
@@ -269,30 +344,25 @@ class CTCMultiDecoderSequenceGenerator(nn.Module):
             .fill_(mt_decoder.padding_idx)
             .int()
         )  # B x T
+        # the decoder states were kept during generation,
+        # the padding positions are masked in the T2U encoder
+        x = finalized_mt[0][0]["decoder_out"].new_zeros(
+            src_tokens.shape[0],
+            max_tgt_len,
+            finalized_mt[0][0]["decoder_out"].size(-1),
+        )  # B x T x C
+        outputs["mt"] = []
         for i, hypo in enumerate(finalized_mt):
             i_beam = 0
             tmp = hypo[i_beam]["tokens"].int()  # hyp + eos
+            x[i, : len(tmp)] = hypo[i_beam]["decoder_out"]
             prev_output_tokens_mt[i, 0] = self.generator_mt.eos
             if tmp[-1] == self.generator_mt.eos:
                 tmp = tmp[:-1]
             prev_output_tokens_mt[i, 1 : len(tmp) + 1] = tmp
+            outputs["mt"].append(tmp.tolist())
 
-            text = "".join([self.generator_mt.tgt_dict[c] for c in tmp])
-            text = text.replace("_", " ")
-            text = text.replace("▁", " ")
-            text = text.replace("<unk>", " ")
-            text = text.replace("<s>", "")
-            text = text.replace("</s>", "")
-            if len(text) > 0 and text[0] == " ":
-                text = text[1:]
-            sample_id = sample["id"].tolist()[i]
-            print("D-{}\t{}".format(sample_id, text))
-
-        x = mt_decoder(
-            prev_output_tokens_mt,
-            encoder_out=encoder_outs[0],
-            features_only=True,
-        )[0].transpose(0, 1)
+        x = x.transpose(0, 1)
 
         if getattr(single_model, "proj", None) is not None:
             x = single_model.proj(x)
@@ -328,4 +398,15 @@ class CTCMultiDecoderSequenceGenerator(nn.Module):
             encoder_outs_aug = None
 
         finalized = self.ctc_generator.generate(encoder_outs[0])
+
+        if self.result_writer is not None:
+            outputs["unit"] = [hypo[0]["tokens"].tolist() for hypo in finalized]
+            self.result_writer.put(sample_ids, outputs)
+        else:
+            for name, prefix in (("asr", "A"), ("st", "S"), ("mt", "D")):
+                if name not in outputs:
+                    continue
+                for sample_id, tokens in zip(sample_ids, outputs[name]):
+                    text = tokens_to_text(self.output_dicts[name], tokens)
+                    print("{}-{}\t{}".format(prefix, sample_id, text))
         return finalized
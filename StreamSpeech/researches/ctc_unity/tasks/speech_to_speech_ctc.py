@@ -10,6 +10,16 @@ from ctc_unity.datasets.speech_to_speech_data_cfg_modified import S2SDataConfigM
 
 @register_task("speech_to_speech_ctc")
 class SpeechToSpeechCTCTask(SpeechToSpeechTask):
+    @classmethod
+    def add_args(cls, parser):
+        super().add_args(parser)
+        parser.add_argument(
+            "--results-jsonl",
+            type=str,
+            default=None,
+            help="write the ASR, CTC-ST, MT and unit outputs of each sample "
+            "to this JSONL file instead of printing the texts",
+        )
 
     def __init__(self, args, tgt_dict, infer_tgt_lang_id=None):
         tgt_blank_index = tgt_dict.add_symbol("<blank>")
@@ -45,5 +55,6 @@ class SpeechToSpeechCTCTask(SpeechToSpeechTask):
             temperature=getattr(args, "temperature", 1.0),
             match_source_len=getattr(args, "match_source_len", False),
             no_repeat_ngram_size=getattr(args, "no_repeat_ngram_size", 0),
+            results_jsonl=getattr(self.args, "results_jsonl", None),
             **extra_gen_cls_kwargs,
         )
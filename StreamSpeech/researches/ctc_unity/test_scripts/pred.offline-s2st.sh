@@ -75,6 +75,7 @@ PYTHONPATH=$ROOT/fairseq:$PYTHONPATH python fairseq/fairseq_cli/generate.py ${DA
     --max-tokens 10000 \
     --required-batch-size-multiple 1 \
     --skip-invalid-size-inputs-valid-test \
+    --results-jsonl $output_dir/generate-$SPLIT.jsonl \
     --results-path $output_dir > $output_dir/generate-$SPLIT.log 2>&1
 
 # Check if generation was successful
@@ -88,65 +89,42 @@ if [ ! -f "$output_dir/generate-$SPLIT.log" ] || [ ! -s "$output_dir/generate-$S
     exit 1
 fi
 
-echo "Step 2/6: Extracting and aligning ASR hypotheses..."
-# Extract ASR hypotheses
-grep '^A-' $output_dir/generate-$SPLIT.log | sort -t'-' -k2,2n | cut -f2 > $output_dir/generate-$SPLIT.asr
-if [ ! -s "$output_dir/generate-$SPLIT.asr" ]; then
-    echo "Warning: No ASR hypotheses found in output"
-fi
-
-# Extract sample IDs and align reference with hypotheses properly
+echo "Step 2/6: Extracting and aligning hypotheses..."
+# the outputs of each sample are read from the results file of the generator,
+# and aligned with the references by sample id
 python - <<END
-import os
-
-ref_file = "$DATA/$SPLIT.src"
-hyp_file = "$output_dir/generate-$SPLIT.asr"
-log_file = "$output_dir/generate-$SPLIT.log"
-out_hyp_file = "$output_dir/generate-$SPLIT.asr.aligned"
-out_ref_file = "$output_dir/generate-$SPLIT.src.aligned"
-
-# Read references
-with open(ref_file) as f:
-    references = f.read().splitlines()
-
-# Read hypotheses with sample IDs from log
-hyp_with_ids = []
-with open(log_file) as f:
-    for line in f:
-        if line.startswith("A-"):
-            parts = line.strip().split("\t")
-            if len(parts) >= 2:
-                sample_id = int(parts[0].split("-")[1])
-                hypothesis = parts[1] if len(parts) > 1 else ""
-                hyp_with_ids.append((sample_id, hypothesis))
-
-# Sort by sample ID
-hyp_with_ids.sort()
-
-# Align references and hypotheses based on available sample IDs
-aligned_refs = []
-aligned_hyps = []
-
-for sample_id, hypothesis in hyp_with_ids:
-    if sample_id < len(references):
-        aligned_refs.append(references[sample_id])
-        aligned_hyps.append(hypothesis)
-    else:
-        # If sample_id exceeds reference length, skip this sample
-        print(f"Warning: Sample ID {sample_id} exceeds reference length ({len(references)}), skipping")
-
-# Write aligned files
-with open(out_ref_file, "w") as f:
-    for line in aligned_refs:
-        f.write(line + "\n")
-
-with open(out_hyp_file, "w") as f:
-    for line in aligned_hyps:
-        f.write(line + "\n")
-
-print(f"Aligned {len(aligned_refs)} samples")
+import json
+
+with open("$output_dir/generate-$SPLIT.jsonl") as f:
+    results = sorted((json.loads(line) for line in f), key=lambda r: r["id"])
+
+for field, ref_name, hyp_file, ref_file in [
+    ("asr", "src", "asr.aligned", "src.aligned"),
+    ("mt", "txt", "tgt", "tgt.ref.aligned"),
+    ("unit", "unit", "unit", "unit.ref.aligned"),
+]:
+    with open("$DATA/$SPLIT." + ref_name) as f:
+        references = f.read().splitlines()
+    hyps, refs = [], []
+    for r in results:
+        if field not in r:
+            continue
+        if r["id"] >= len(references):
+            print(f"Warning: Sample ID {r['id']} exceeds reference length ({len(references)}), skipping")
+            continue
+        hyps.append(r[field])
+        refs.append(references[r["id"]])
+    with open("$output_dir/generate-$SPLIT." + hyp_file, "w") as f:
+        f.writelines(line + "\\n" for line in hyps)
+    with open("$output_dir/generate-$SPLIT." + ref_file, "w") as f:
+        f.writelines(line + "\\n" for line in refs)
+    print(f"Aligned {len(hyps)} {field} samples")
 END
 
+if [ ! -s "$output_dir/generate-$SPLIT.asr.aligned" ]; then
+    echo "Warning: No ASR hypotheses found in output"
+fi
+
 echo "Step 3/6: Computing ASR BLEU and WER scores..."
 # Compute BLEU for ASR source text
 echo '################### ASR source text BLEU ###################' >> $output_dir/res.txt
@@ -169,55 +147,7 @@ else:
 END
 
 
-echo "Step 4/6: Processing target text and unit outputs..."
-# Extract and align target text
-python - <<END
-import os
-
-tgt_ref_file = "$DATA/$SPLIT.txt"
-log_file = "$output_dir/generate-$SPLIT.log"
-out_tgt_file = "$output_dir/generate-$SPLIT.tgt"
-out_tgt_ref_file = "$output_dir/generate-$SPLIT.tgt.ref.aligned"
-
-# Read target references
-with open(tgt_ref_file) as f:
-    tgt_references = f.read().splitlines()
-
-# Read target hypotheses with sample IDs from log
-tgt_with_ids = []
-with open(log_file) as f:
-    for line in f:
-        if line.startswith("D-"):
-            parts = line.strip().split("\t")
-            if len(parts) >= 2:
-                sample_id = int(parts[0].split("-")[1])
-                target = parts[1] if len(parts) > 1 else ""
-                tgt_with_ids.append((sample_id, target))
-
-# Sort by sample ID
-tgt_with_ids.sort()
-
-# Align target references and hypotheses
-aligned_tgt_refs = []
-aligned_tgt_hyps = []
-
-for sample_id, target in tgt_with_ids:
-    if sample_id < len(tgt_references):
-        aligned_tgt_refs.append(tgt_references[sample_id])
-        aligned_tgt_hyps.append(target)
-
-# Write aligned files
-with open(out_tgt_ref_file, "w") as f:
-    for line in aligned_tgt_refs:
-        f.write(line + "\n")
-
-with open(out_tgt_file, "w") as f:
-    for line in aligned_tgt_hyps:
-        f.write(line + "\n")
-
-print(f"Aligned {len(aligned_tgt_refs)} target samples")
-END
-
+echo "Step 4/6: Computing target text and unit BLEU scores..."
 if [ ! -s "$output_dir/generate-$SPLIT.tgt" ]; then
     echo "Warning: No target text found in output"
 fi
@@ -225,68 +155,6 @@ fi
 echo '################### Speech-to-text target text BLEU ###################' >> $output_dir/res.txt
 sacrebleu $output_dir/generate-$SPLIT.tgt.ref.aligned -i $output_dir/generate-$SPLIT.tgt -w 3 >> $output_dir/res.txt
 
-# Extract and align unit outputs
-python - <<END
-import os
-
-unit_ref_file = "$DATA/$SPLIT.unit"
-log_file = "$output_dir/generate-$SPLIT.log"
-out_unit_file = "$output_dir/generate-$SPLIT.unit"
-out_unit_ref_file = "$output_dir/generate-$SPLIT.unit.ref.aligned"
-
-# Read unit references
-with open(unit_ref_file) as f:
-    unit_references = f.read().splitlines()
-
-# Read unit hypotheses with sample IDs from log
-# Try multiple possible formats: H-, U-, T- for units
-unit_with_ids = []
-unit_prefixes = ["H-", "U-", "T-"]
-
-with open(log_file) as f:
-    for line in f:
-        for prefix in unit_prefixes:
-            if line.startswith(prefix):
-                parts = line.strip().split("\t")
-                if len(parts) >= 3:
-                    sample_id = int(parts[0].split("-")[1])
-                    unit = parts[2] if len(parts) > 2 else ""
-                    unit_with_ids.append((sample_id, unit))
-                break
-
-# If no units found, create empty files
-if not unit_with_ids:
-    print("Warning: No unit outputs found in log. Creating empty unit files.")
-    with open(out_unit_file, "w") as f:
-        pass  # Create empty file
-    with open(out_unit_ref_file, "w") as f:
-        pass  # Create empty file
-    print(f"Aligned 0 unit samples")
-else:
-    # Sort by sample ID
-    unit_with_ids.sort()
-
-    # Align unit references and hypotheses
-    aligned_unit_refs = []
-    aligned_unit_hyps = []
-
-    for sample_id, unit in unit_with_ids:
-        if sample_id < len(unit_references):
-            aligned_unit_refs.append(unit_references[sample_id])
-            aligned_unit_hyps.append(unit)
-
-    # Write aligned files
-    with open(out_unit_ref_file, "w") as f:
-        for line in aligned_unit_refs:
-            f.write(line + "\n")
-
-    with open(out_unit_file, "w") as f:
-        for line in aligned_unit_hyps:
-            f.write(line + "\n")
-
-    print(f"Aligned {len(aligned_unit_refs)} unit samples")
-END
-
 echo '################### Speech-to-unit target unit BLEU ###################' >> $output_dir/res.txt
 sacrebleu $output_dir/generate-$SPLIT.unit.ref.aligned -i $output_dir/generate-$SPLIT.unit -w 3 >> $output_dir/res.txt
 